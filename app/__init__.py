@@ -1,3 +1,4 @@
 """initialize app modules"""
 import common
-from .app import run
+from .app import run, refresh
+from .models import RefreshError
@@ -2,30 +2,125 @@
 Keep Snyk projects in sync with their corresponding SCM repositories
 """
 import sys
-import time
 import re
+import itertools
 import snyk.errors
 import common
-from app.models import ImportStatus
+from app.models import ImportStatus, RefreshError
+from app.utils.import_poller import ImportStatusPoller
+from app.utils.metrics import ProgressTracker, get_metrics, reset_metrics
+from app.utils.results_sink import get_results_sink, close_results_sink
+from app.utils.sync_state import is_repo_unchanged_since_sync, record_repo_sync
+from app.utils.checkpoint import (
+    get_checkpoint,
+    record_repo_phase,
+    REPO_PHASE_STATUS,
+    REPO_PHASE_STALE_DELETE
+)
 from app.gh_repo import (
     get_gh_repo_status,
+    get_gh_repo_statuses,
     is_gh_repo_truncated,
-    get_git_tree_from_api
+    get_git_tree_from_api,
+    reset_repo_state
 )
 from app.utils.snyk_helper import (
-    get_snyk_repos_from_snyk_orgs,
+    iter_snyk_repos_by_org,
     app_print,
-    process_import_status_checks,
     import_manifests,
+    get_import_status,
+    delete_snyk_project,
     log_potential_delete,
     log_audit_large_repo_result
 )
+from app.utils.concurrency import map_ordered
+
+
+def refresh(options=None):
+    """
+    Run a sync from within another program. options are as for common.configure,
+    command line arguments or a dict of option names to values. Clients, caches
+    and state stores opened by earlier calls in the process are reused.
+    Raises RefreshError if the sync can't run
+    """
+    common.configure(options if options is not None else [])
+    run()
 
 
 def run():
-    """Begin application logic"""
-    # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-    # pylint: disable=too-many-nested-blocks
+    """Begin application logic, raising RefreshError if there is nothing to sync"""
+    checkpoint = get_checkpoint()
+    completed_repos = checkpoint.completed_repos() if checkpoint is not None else set()
+    pending_imports = checkpoint.pending_imports() if checkpoint is not None else []
+    # a resumed run adds to the result files of the run it continues
+    results_sink = get_results_sink(append=bool(completed_repos or pending_imports))
+    metrics = reset_metrics()
+
+    snyk_orgs = get_snyk_orgs()
+    progress = ProgressTracker(len(snyk_orgs), metrics, common.PROGRESS_INTERVAL_SECONDS)
+    # repos are processed org by org, as soon as each org's projects are fetched
+    snyk_repos = iter_indexed_repos(
+        progress.add_org(org_repos)
+        for org_repos in iter_snyk_repos_by_org(snyk_orgs, common.ARGS))
+    first_repo = next(snyk_repos, None)
+    if first_repo is None:
+        sys.stdout.write(" - 0 found\n")
+        raise RefreshError("If using repo-name filter, ensure it is correct")
+    snyk_repos = itertools.chain([first_repo], snyk_repos)
+
+    # import jobs are polled in the background while the remaining repos are processed
+    import_status_poller = ImportStatusPoller(get_import_status, delete_snyk_project,
+                                              checkpoint=checkpoint)
+
+    if checkpoint is not None:
+        def not_completed(indexed_repo):
+            snyk_repo = indexed_repo[2]
+            if (snyk_repo.org_id, snyk_repo.full_name) in completed_repos:
+                progress.repo_skipped()
+                return False
+            return True
+        snyk_repos = filter(not_completed, snyk_repos)
+        if completed_repos or pending_imports:
+            print(f"Resuming from checkpoint: skipping {len(completed_repos)} "
+                  f"completed repos, polling {len(pending_imports)} pending import jobs")
+        for import_status_check in pending_imports:
+            import_status_poller.submit(import_status_check)
+
+    def process_indexed_repo(indexed_repo):
+        (i, total, snyk_repo, gh_repo_status) = indexed_repo
+        with metrics.phase("repo"):
+            import_status_checks = process_repo(snyk_repo, i, total, gh_repo_status)
+        if checkpoint is not None:
+            # the repo's results are on disk before it is recorded as done
+            results_sink.sync()
+            checkpoint.complete_repo(snyk_repo.org_id, snyk_repo.full_name,
+                                     import_status_checks)
+        return import_status_checks
+
+    for repo_import_status_checks in map_ordered(process_indexed_repo,
+                                                 iter_repos_with_status(snyk_repos),
+                                                 common.ARGS.workers):
+        for import_status_check in repo_import_status_checks:
+            import_status_poller.submit(import_status_check)
+        progress.repo_done()
+        report_progress(progress)
+
+    pending_count = import_status_poller.pending_count()
+    if pending_count:
+        print(f"Waiting for {pending_count} pending import jobs...")
+    with metrics.phase("import_wait"):
+        import_status_poller.wait()
+
+    close_results_sink()
+    report_progress(progress, force=True)
+    print(metrics.summary())
+    if checkpoint is not None:
+        # the run finished, the next one starts from scratch
+        checkpoint.clear()
+
+
+def get_snyk_orgs():
+    """ the orgs to sync, raising RefreshError if they can't be listed """
     sys.stdout.write("Retrieving Snyk Repos")
     sys.stdout.flush()
 
@@ -39,185 +134,246 @@ def run():
         else:
             snyk_orgs = common.snyk_client.organizations.all()
     except snyk.errors.SnykHTTPError as err:
-        print(f"\n\n{err.message}, exiting...\n")
-        sys.exit(1)
+        raise RefreshError(getattr(err, "message", None) or str(err)) from err
 
     print(f" for {len(snyk_orgs)} org(s)")
+    return snyk_orgs
+
+
+def report_progress(progress, force=False):
+    """ print the progress line and refresh --metrics-file, every PROGRESS_INTERVAL_SECONDS """
+    line = progress.report(force)
+    if line is None:
+        return
+    print(line)
+    if common.ARGS.metrics_file:
+        try:
+            get_metrics().write_prometheus(common.ARGS.metrics_file)
+        except OSError as err:
+            print(f"Failed to write metrics file {common.ARGS.metrics_file}: {err}")
+
+
+def iter_indexed_repos(snyk_repos_by_org):
+    """ yield (index, total, snyk_repo) for each repo, counted within its org """
+    for org_repos in snyk_repos_by_org:
+        for (i, snyk_repo) in enumerate(org_repos):
+            yield (i, len(org_repos), snyk_repo)
+
+
+def iter_repos_with_status(indexed_repos):
+    """
+    yield (index, total, snyk_repo, github status) for each repo. with --status-api=graphql
+    statuses are resolved a batch at a time just ahead of processing, otherwise
+    the status is left for process_repo to look up
+    """
+    if common.ARGS.status_api != "graphql":
+        for (i, total, snyk_repo) in indexed_repos:
+            yield (i, total, snyk_repo, None)
+        return
 
-    # build snyk repo objects
-    snyk_repos = get_snyk_repos_from_snyk_orgs(snyk_orgs, common.ARGS)
-    len_snyk_repos = len(snyk_repos)
-    sys.stdout.write(f" - {len_snyk_repos} found\n")
-    if len_snyk_repos == 0:
-        print("\nIf using repo-name filter, ensure it is correct\n")
-        sys.exit(1)
+    indexed_repos = iter(indexed_repos)
+    while True:
+        batch = list(itertools.islice(indexed_repos, common.GITHUB_GRAPHQL_BATCH_SIZE))
+        if not batch:
+            return
+        try:
+            with get_metrics().phase("status_batch"):
+                statuses = get_gh_repo_statuses([snyk_repo for (_, _, snyk_repo) in batch])
+        except RuntimeError as err:
+            raise RuntimeError("Failed to query GitHub repository!") from err
+        for ((i, total, snyk_repo), gh_repo_status) in zip(batch, statuses):
+            yield (i, total, snyk_repo, gh_repo_status)
 
+
+def process_repo(snyk_repo, index, total, gh_repo_status=None):
+    """
+    Check a single repo against GitHub and bring its Snyk projects in sync,
+    returning any import jobs that were submitted for it
+    """
+    # pylint: disable=too-many-locals, too-many-branches, too-many-statements
+    # pylint: disable=too-many-nested-blocks
     import_status_checks = []
+    reset_repo_state()
 
-    for (i, snyk_repo) in enumerate(snyk_repos):
-        # snyk_repo.get_projects()
-        deleted_projects = []
-        is_default_renamed = False
-        app_print(snyk_repo.org_name,
-                  snyk_repo.full_name,
-                  f"Processing {str(i + 1)}/{str(len(snyk_repos))}")
+    # snyk_repo.get_projects()
+    deleted_projects = []
+    app_print(snyk_repo.org_name,
+              snyk_repo.full_name,
+              f"Processing {str(index + 1)}/{str(total)}")
 
+    if gh_repo_status is None:
         try:
-            gh_repo_status = get_gh_repo_status(snyk_repo)
+            with get_metrics().phase("status"):
+                gh_repo_status = get_gh_repo_status(snyk_repo)
 
         except RuntimeError as err:
             raise RuntimeError("Failed to query GitHub repository!") from err
 
-        app_print(snyk_repo.org_name,
-                  snyk_repo.full_name,
-                  f"Github Status {gh_repo_status.response_code}" \
-                  f"({gh_repo_status.response_message}) [{snyk_repo.origin}]")
-
-        # if snyk_repo does not still exist (removed/404), then log and skip to next repo
-        if gh_repo_status.response_code == 404:  # project no longer exists
-            log_potential_delete(snyk_repo.org_name, snyk_repo.full_name)
-
-        elif gh_repo_status.response_code == 200:  # project exists and has not been renamed
-            # if --audit-large-repos is on
-            if common.ARGS.audit_large_repos:
-                is_truncated_str = \
-                    is_gh_repo_truncated(
-                        get_git_tree_from_api(snyk_repo.full_name, snyk_repo.origin)
-                    )
-                log_audit_large_repo_result(
-                    snyk_repo.org_name,
-                    snyk_repo.full_name,
-                    str(bool(is_truncated_str))
+    app_print(snyk_repo.org_name,
+              snyk_repo.full_name,
+              f"Github Status {gh_repo_status.response_code}" \
+              f"({gh_repo_status.response_message}) [{snyk_repo.origin}]")
+    record_repo_phase(snyk_repo, REPO_PHASE_STATUS)
+
+    # if snyk_repo does not still exist (removed/404), then log and skip to next repo
+    if gh_repo_status.response_code == 404:  # project no longer exists
+        log_potential_delete(snyk_repo.org_name, snyk_repo.full_name)
+
+    elif gh_repo_status.response_code == 200:  # project exists and has not been renamed
+        # if --audit-large-repos is on
+        if common.ARGS.audit_large_repos:
+            is_truncated_str = \
+                is_gh_repo_truncated(
+                    get_git_tree_from_api(snyk_repo.full_name, snyk_repo.origin)
                 )
-                # move to next repo without processing the rest of the code
-                continue
-
-            # If we've previously deactivated projects, we should activate them again
-            # if the repo becomes "unarchived"
-            if not gh_repo_status.archived and common.ARGS.on_unarchived == "reactivate":
-                for project in snyk_repo.snyk_projects:
-                    if not project["is_monitored"]:
-                        activated_projects = snyk_repo.activate_manifests(common.ARGS.dry_run)
-                        for activated_project in activated_projects:
-                            if not common.ARGS.dry_run:
-                                app_print(snyk_repo.org_name,
-                                          snyk_repo.full_name,
-                                          f"Activated manifest: {activated_project['manifest']}")
-                            else:
-                                app_print(snyk_repo.org_name,
-                                          snyk_repo.full_name,
-                                          f"Would activate manifest: "
-                                          f"{activated_project['manifest']}")
-                        break  # We just needed to check if any one of the projects wasn't active
-
-            if gh_repo_status.archived and common.ARGS.on_archived != "ignore":
-                app_print(snyk_repo.org_name,
-                          snyk_repo.full_name,
-                          f"Repo is archived")
-
-                # Check what archival mode we're running in
-                on_archival_action = common.ARGS.on_archived
-                if on_archival_action == "deactivate":
-                    deleted_projects = snyk_repo.deactivate_manifests(common.ARGS.dry_run)
-                elif on_archival_action == "delete":
-                    deleted_projects = snyk_repo.delete_manifests(common.ARGS.dry_run)
-
-                # And tell the user what has or would have happened
-                for project in deleted_projects:
-                    if not common.ARGS.dry_run:
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"{on_archival_action.capitalize()}d manifest: "
-                                  f"{project['manifest']}")
-                    else:
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"Would {on_archival_action} manifest: {project['manifest']}")
-            # snyk has the wrong branch, re-import
-            elif gh_repo_status.repo_default_branch != snyk_repo.branch:
-                app_print(snyk_repo.org_name,
-                          snyk_repo.full_name,
-                          f"Default branch name changed from {snyk_repo.branch}" f" -> "
-                          f"{gh_repo_status.repo_default_branch}")
+            log_audit_large_repo_result(
+                snyk_repo.org_name,
+                snyk_repo.full_name,
+                str(bool(is_truncated_str))
+            )
+            # move to next repo without processing the rest of the code
+            return import_status_checks
+
+        # If we've previously deactivated projects, we should activate them again
+        # if the repo becomes "unarchived"
+        if not gh_repo_status.archived and common.ARGS.on_unarchived == "reactivate":
+            for project in snyk_repo.snyk_projects:
+                if not project["is_monitored"]:
+                    activated_projects = snyk_repo.activate_manifests(common.ARGS.dry_run)
+                    for activated_project in activated_projects:
+                        if not common.ARGS.dry_run:
+                            app_print(snyk_repo.org_name,
+                                      snyk_repo.full_name,
+                                      f"Activated manifest: {activated_project['manifest']}")
+                        else:
+                            app_print(snyk_repo.org_name,
+                                      snyk_repo.full_name,
+                                      f"Would activate manifest: "
+                                      f"{activated_project['manifest']}")
+                    break  # We just needed to check if any one of the projects wasn't active
+
+        if gh_repo_status.archived and common.ARGS.on_archived != "ignore":
+            app_print(snyk_repo.org_name,
+                      snyk_repo.full_name,
+                      f"Repo is archived")
+
+            # Check what archival mode we're running in
+            on_archival_action = common.ARGS.on_archived
+            if on_archival_action == "deactivate":
+                deleted_projects = snyk_repo.deactivate_manifests(common.ARGS.dry_run)
+            elif on_archival_action == "delete":
+                deleted_projects = snyk_repo.delete_manifests(common.ARGS.dry_run)
+
+            # And tell the user what has or would have happened
+            for project in deleted_projects:
+                if not common.ARGS.dry_run:
+                    app_print(snyk_repo.org_name,
+                              snyk_repo.full_name,
+                              f"{on_archival_action.capitalize()}d manifest: "
+                              f"{project['manifest']}")
+                else:
+                    app_print(snyk_repo.org_name,
+                              snyk_repo.full_name,
+                              f"Would {on_archival_action} manifest: {project['manifest']}")
+        # snyk has the wrong branch, re-import
+        elif gh_repo_status.repo_default_branch != snyk_repo.branch:
+            app_print(snyk_repo.org_name,
+                      snyk_repo.full_name,
+                      f"Default branch name changed from {snyk_repo.branch}" f" -> "
+                      f"{gh_repo_status.repo_default_branch}")
+            with get_metrics().phase("branch_update"):
                 updated_projects = snyk_repo.update_branch(
                     gh_repo_status.repo_default_branch,
                     common.ARGS.dry_run)
-                for project in updated_projects:
-                    if not common.ARGS.dry_run:
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"Monitored branch set to " \
-                                  f"{gh_repo_status.repo_default_branch} " \
-                                  f"for: {project['manifest']}")
-            else:  # find deltas
-                app_print(snyk_repo.org_name,
-                          snyk_repo.full_name,
-                          f"Checking {str(len(snyk_repo.snyk_projects))} " \
-                          f"projects for any stale manifests")
-                # print(f"snyk repo projects: {snyk_repo.snyk_projects}")
+            for project in updated_projects:
+                if not common.ARGS.dry_run:
+                    app_print(snyk_repo.org_name,
+                              snyk_repo.full_name,
+                              f"Monitored branch set to " \
+                              f"{gh_repo_status.repo_default_branch} " \
+                              f"for: {project['manifest']}")
+        elif is_repo_unchanged_since_sync(snyk_repo, gh_repo_status):
+            app_print(snyk_repo.org_name,
+                      snyk_repo.full_name,
+                      "No changes pushed since the last sync, skipping manifest checks")
+        else:  # find deltas
+            app_print(snyk_repo.org_name,
+                      snyk_repo.full_name,
+                      f"Checking {str(len(snyk_repo.snyk_projects))} " \
+                      f"projects for any stale manifests")
+            # print(f"snyk repo projects: {snyk_repo.snyk_projects}")
+            with get_metrics().phase("stale_delete"):
                 deleted_projects = snyk_repo.delete_stale_manifests(common.ARGS.dry_run)
-                for project in deleted_projects:
-                    if not common.ARGS.dry_run:
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"Deleted stale manifest: {project['manifest']}")
-                    else:
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"Would delete stale manifest: {project['manifest']}")
-
-                app_print(snyk_repo.org_name,
-                          snyk_repo.full_name,
-                          "Checking for new manifests in source tree")
-
-                # if not common.ARGS.dry_run:
-                projects_import = snyk_repo.add_new_manifests(common.ARGS.dry_run)
-
-                if isinstance(projects_import, ImportStatus):
-                    import_status_checks.append(projects_import)
+            record_repo_phase(snyk_repo, REPO_PHASE_STALE_DELETE)
+            for project in deleted_projects:
+                if not common.ARGS.dry_run:
                     app_print(snyk_repo.org_name,
                               snyk_repo.full_name,
-                              f"Found {len(projects_import.files)} to import")
-                    for file in projects_import.files:
-                        import_message = ""
-                        if re.match(common.MANIFEST_PATTERN_CODE, file["path"]):
-                            import_message = "Triggering code analysis via"
-                        else:
-                            import_message = "Importing new manifest"
-
-                        app_print(snyk_repo.org_name,
-                                  snyk_repo.full_name,
-                                  f"{import_message}: {file['path']}")
+                              f"Deleted stale manifest: {project['manifest']}")
+                else:
+                    app_print(snyk_repo.org_name,
+                              snyk_repo.full_name,
+                              f"Would delete stale manifest: {project['manifest']}")
 
-        # if snyk_repo has been moved/renamed (301), then re-import the entire repo
-        # with the new name and remove the old one (make optional)
-        elif gh_repo_status.response_code == 301:
             app_print(snyk_repo.org_name,
                       snyk_repo.full_name,
-                      f"Repo has moved to {gh_repo_status.repo_full_name}, submitting import...")
-            if not common.ARGS.dry_run:
-                repo_import_status = import_manifests(snyk_repo.org_id,
-                                                      gh_repo_status.repo_full_name,
-                                                      snyk_repo.integration_id)
-                # build list of projects to delete with old name
-                # only when the repo with new name has been imported
-                repo_projects = snyk_repo.get_projects()
-                # pylint: disable=unused-variable
-                for (j, repo_project) in enumerate(repo_projects):
-                    repo_projects[j]["pending_repo"] = gh_repo_status.repo_full_name
-
-                repo_import_status.pending_project_deletes = repo_projects
-                import_status_checks.append(repo_import_status)
-            else:
+                      "Checking for new manifests in source tree")
+
+            # if not common.ARGS.dry_run:
+            with get_metrics().phase("manifest_delta"):
+                projects_import = snyk_repo.add_new_manifests(common.ARGS.dry_run)
+
+            if isinstance(projects_import, ImportStatus):
+                import_status_checks.append(projects_import)
                 app_print(snyk_repo.org_name,
                           snyk_repo.full_name,
-                          "Would import repo (all targets) under new name")
+                          f"Found {len(projects_import.files)} to import")
+                for file in projects_import.files:
+                    import_message = ""
+                    if re.match(common.MANIFEST_PATTERN_CODE, file["path"]):
+                        import_message = "Triggering code analysis via"
+                    else:
+                        import_message = "Importing new manifest"
+
+                    app_print(snyk_repo.org_name,
+                              snyk_repo.full_name,
+                              f"{import_message}: {file['path']}")
+
+            # the repo is recorded as in sync once its deletes and imports succeeded,
+            # the import poller records it when the job completes. a repo with manifests
+            # left over the import limit is checked again on the next run
+            if snyk_repo.failed_operations == 0:
+                if isinstance(projects_import, ImportStatus):
+                    if not projects_import.truncated:
+                        projects_import.repo_sync = gh_repo_status
+                else:
+                    record_repo_sync(snyk_repo, gh_repo_status)
 
+    # if snyk_repo has been moved/renamed (301), then re-import the entire repo
+    # with the new name and remove the old one (make optional)
+    elif gh_repo_status.response_code == 301:
+        app_print(snyk_repo.org_name,
+                  snyk_repo.full_name,
+                  f"Repo has moved to {gh_repo_status.repo_full_name}, submitting import...")
+        if not common.ARGS.dry_run:
+            repo_import_status = import_manifests(snyk_repo.org_id,
+                                                  gh_repo_status.repo_full_name,
+                                                  snyk_repo.integration_id)
+            # build list of projects to delete with old name
+            # only when the repo with new name has been imported.
+            # these are copies, the repo's project records are left as they are
+            repo_import_status.pending_project_deletes = [
+                dict(repo_project.items(), pending_repo=gh_repo_status.repo_full_name)
+                for repo_project in snyk_repo.get_projects()]
+            import_status_checks.append(repo_import_status)
         else:
             app_print(snyk_repo.org_name,
                       snyk_repo.full_name,
-                      f"Skipping due to invalid response")
+                      "Would import repo (all targets) under new name")
 
-        time.sleep(1)
+    else:
+        app_print(snyk_repo.org_name,
+                  snyk_repo.full_name,
+                  f"Skipping due to invalid response")
 
-    process_import_status_checks(import_status_checks)
+    return import_status_checks
@@ -1,13 +1,21 @@
 """utilities for github"""
 import logging
 import re
+import shutil
 import sys
 import subprocess
+import tempfile
+import threading
 import requests
+from github import GithubException
 from app.models import GithubRepoStatus
+from app.utils.metrics import get_metrics
+from app.utils.manifest_classifier import get_manifest_classifier
+from app.utils.tree_cache import get_tree_cache
 from app.utils.github_utils import (
     get_github_client,
-    get_github_repo
+    get_github_repo,
+    get_github_session
 )
 import common
 
@@ -18,31 +26,40 @@ import common
 # pylint: disable=no-member
 requests.packages.urllib3.disable_warnings()
 
+# per-thread so concurrent workers (--workers) don't share tree results
 # pylint: disable=invalid-name
-state = {
-    "tree_already_retrieved": False,
-    "manifests": []
-}
+state = threading.local()
 
 def get_git_tree_from_clone(repo_name, origin):
     """
-    get git tree for large repos by performing
-    a shallow clone 'git clone --depth 1'
+    get git tree for large repos by cloning the default branch,
+    yielding (sha, path) for each tree entry
     """
+    gh_repo = get_current_github_repo(repo_name, origin)
 
-    tree_full_paths = []
+    yield from clone_git_tree(gh_repo.name,
+                              gh_repo.clone_url,
+                              gh_repo.default_branch,
+                              common.ARGS.clone_mode)
 
-    gh_client = get_github_client(origin)
-    gh_repo = get_github_repo(gh_client, repo_name)
+def clone_git_tree(name, clone_url, default_branch, clone_mode="partial"):
+    """
+    clone a single branch and yield (sha, path) for each entry of its tree.
 
+    'partial' does a blob-less, no-checkout clone, so only commits and trees
+    are downloaded and nothing is written to the working directory.
+    'full' does a shallow clone with checkout 'git clone --depth 1'.
+    the clone is removed once the tree has been read
+    """
     # check if git exists on the system
-    subprocess.run(["command", "-v", "git"], check=True, stdout=subprocess.DEVNULL)
+    if shutil.which("git") is None:
+        raise RuntimeError("git is required to clone large repos but was not found")
 
-    name = gh_repo.name
-    clone_url = gh_repo.clone_url
-    default_branch = gh_repo.default_branch
-
-    GIT_CLONE_PATH = f"{common.GIT_CLONE_TEMP_DIR}/{name}"
+    # each clone gets its own parent directory so concurrent workers
+    # cloning repos with the same name do not collide
+    GIT_CLONE_PARENT = tempfile.mkdtemp(prefix="snyk-scm-refresh-",
+                                        dir=common.GIT_CLONE_TEMP_DIR)
+    GIT_CLONE_PATH = f"{GIT_CLONE_PARENT}/{name}"
 
     # check that GIT_CLONE_PATH is set safely for deletion
     if re.match(f'{common.GIT_CLONE_TEMP_DIR}/.+', GIT_CLONE_PATH) and \
@@ -52,131 +69,183 @@ def get_git_tree_from_clone(repo_name, origin):
         sys.exit(f"could not determine that the temp cloning directory"
                  f"{GIT_CLONE_PATH} was set properly, exiting...")
 
-    print(f"  - shallow cloning {name} from {clone_url} to {GIT_CLONE_PATH}")
+    if clone_mode == "partial":
+        print(f"  - partial cloning {name} from {clone_url} to {GIT_CLONE_PATH}")
+        clone_args = ["--filter=blob:none", "--no-checkout", "--depth", "1",
+                      "--single-branch", "--branch", default_branch]
+    else:
+        print(f"  - shallow cloning {name} from {clone_url} to {GIT_CLONE_PATH}")
+        clone_args = ["--depth", "1"]
 
-    # clone the repo locally
-    subprocess.run(["rm", "-fr", f"{GIT_CLONE_PATH}"], check=True)
-    subprocess.run(
-        ["git", "clone", "--depth", "1", clone_url],
-        check=True,
-        cwd=common.GIT_CLONE_TEMP_DIR
-    )
+    try:
+        # clone the repo locally
+        with get_metrics().timer("clone_seconds", mode=clone_mode):
+            subprocess.run(
+                ["git", "clone", "--quiet"] + clone_args + [clone_url, GIT_CLONE_PATH],
+                check=True,
+                cwd=GIT_CLONE_PARENT
+            )
 
-    print("  - Loading tree from local git structure")
-
-    git_tree = subprocess.run(
-        [
-            "git",
-            "ls-tree",
-            "-r",
-            default_branch
-        ],
-        capture_output=True,
-        check=True,
-        text=True,
-        cwd=f"{GIT_CLONE_PATH}"
-    )
+        print("  - Loading tree from local git structure")
 
-    print(f"  - removing cloned files in /tmp...")
-    subprocess.run(["rm", "-fr", f"{GIT_CLONE_PATH}"], check=True)
+        tree_items = 0
+        for tree_entry in read_git_tree(GIT_CLONE_PATH, default_branch):
+            tree_items += 1
+            yield tree_entry
 
-    git_tree_lines = git_tree.stdout.splitlines()
-    print(f"  - found {len(git_tree_lines)} tree items ...")
+        print(f"  - found {tree_items} tree items ...")
 
-    for line in git_tree_lines:
-        sha, path = [line.split()[i] for i in (2, 3)]
-        tree_full_paths.append({
-            "sha": sha,
-            "path": path
-        })
+    finally:
+        print(f"  - removing cloned files in {common.GIT_CLONE_TEMP_DIR}...")
+        subprocess.run(["rm", "-fr", f"{GIT_CLONE_PARENT}"], check=True)
 
-    return tree_full_paths
+def read_git_tree(repo_path, rev, chunk_size=65536):
+    """
+    yield (sha, path) for every entry of 'git ls-tree -r -z <rev>', parsing
+    the NUL separated output from the pipe as it arrives
+    """
+    command = ["git", "ls-tree", "-r", "-z", rev]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, cwd=repo_path) as git_tree:
+        completed = False
+        try:
+            remainder = b""
+            for chunk in iter(lambda: git_tree.stdout.read(chunk_size), b""):
+                records = (remainder + chunk).split(b"\0")
+                remainder = records.pop()
+                for record in records:
+                    yield parse_git_tree_record(record)
+            if remainder:
+                yield parse_git_tree_record(remainder)
+            completed = True
+        finally:
+            # stop git if the caller gave up before reading the whole tree
+            if not completed:
+                git_tree.kill()
+
+    if git_tree.returncode != 0:
+        raise subprocess.CalledProcessError(git_tree.returncode, command)
+
+def parse_git_tree_record(record):
+    """ parse '<mode> SP <type> SP <sha> TAB <path>' from git ls-tree -z """
+    (info, path) = record.split(b"\t", 1)
+    sha = info.rsplit(b" ", 1)[1]
+    return (sha.decode("ascii"), path.decode("utf-8", "replace"))
 
 def is_gh_repo_truncated(gh_tree_response) -> bool:
     """ check if repo is truncated """
     #pylint: disable=protected-access
     return gh_tree_response._rawData['truncated']
 
+def reset_repo_state():
+    """
+    forget the repo and tree this thread looked up last, before it starts on
+    the next repo, so nothing carries over from an earlier repo or run
+    """
+    state.gh_repo = None
+    state.gh_repo_key = None
+    state.tree_already_retrieved = False
+    state.manifests = []
+
+def get_current_github_repo(repo_name, origin):
+    """
+    get a github repo by name, reusing the last one looked up
+    on this thread so each repo is only fetched once
+    """
+    if getattr(state, 'gh_repo_key', None) != (origin, repo_name):
+        state.gh_repo = get_github_repo(get_github_client(origin), repo_name)
+        state.gh_repo_key = (origin, repo_name)
+    return state.gh_repo
+
 def get_git_tree_from_api(repo_name, origin):
     """ get git tree for repo via API call """
-    gh_client = get_github_client(origin)
-    gh_repo = get_github_repo(gh_client, repo_name)
+    gh_repo = get_current_github_repo(repo_name, origin)
 
     return gh_repo.get_git_tree(gh_repo.default_branch, True)
 
-def get_repo_manifests(snyk_repo_name, origin, skip_snyk_code):
-    """retrieve list of all supported manifests in a given github repo"""
-
-    if state['tree_already_retrieved']:
-        state['tree_already_retrieved'] = False
-        return state['manifests']
-
-    state['manifests'] = []
+def get_default_branch_tree_sha(repo_name, origin):
+    """ get the root tree SHA of the default branch, None if it can't be found """
+    gh_repo = get_current_github_repo(repo_name, origin)
+    try:
+        return gh_repo.get_branch(gh_repo.default_branch).commit.commit.tree.sha
+    except GithubException as err:
+        logging.debug(f"could not get tree sha for {repo_name}: {err}")
+        return None
 
-    tree_response = get_git_tree_from_api(snyk_repo_name, origin)
+def iter_git_tree_from_api(gh_tree_response):
+    """ yield (sha, path) for each entry of a tree api response """
+    for tree_element in gh_tree_response.tree:
+        yield (tree_element.sha, tree_element.path)
 
-    contents = tree_response.tree
+def filter_manifests(tree_entries, skip_snyk_code):
+    """
+    yield the paths from (sha, path) tree entries that pass the manifest filter.
+    only the first snyk code file is passed through unless skip_snyk_code is set
+    """
+    classifier = get_manifest_classifier()
+    for (_, path) in tree_entries:
+        if classifier.classify_path(path, skip_snyk_code):
+            yield path
+        if not skip_snyk_code and classifier.is_code(path):
+            skip_snyk_code = True
 
-    is_truncated_str = is_gh_repo_truncated(tree_response)
+def get_repo_manifests(snyk_repo_name, origin, skip_snyk_code):
+    """retrieve list of all supported manifests in a given github repo"""
 
-    if is_truncated_str:
+    if getattr(state, 'tree_already_retrieved', False):
+        state.tree_already_retrieved = False
+        return state.manifests
+
+    state.manifests = []
+
+    # an unchanged tree is answered from the cache without downloading it
+    tree_cache = get_tree_cache()
+    tree_sha = None
+    if tree_cache is not None:
+        tree_sha = get_default_branch_tree_sha(snyk_repo_name, origin)
+        filter_key = f"{get_manifest_classifier().fingerprint}:{int(bool(skip_snyk_code))}"
+        if tree_sha is not None:
+            cached_manifests = tree_cache.get(origin, snyk_repo_name, tree_sha, filter_key)
+            get_metrics().inc("tree_cache_lookups_total",
+                              result="miss" if cached_manifests is None else "hit")
+            if cached_manifests is not None:
+                state.manifests = cached_manifests
+                state.tree_already_retrieved = True
+                return state.manifests
+
+    with get_metrics().phase("tree_fetch"):
+        tree_response = get_git_tree_from_api(snyk_repo_name, origin)
+
+    if is_gh_repo_truncated(tree_response):
         # repo too large to get try via API, just clone it
         print(f"  - Large repo detected, falling back to cloning. "
               f"This may take a few minutes ...")
-        contents = get_git_tree_from_clone(snyk_repo_name, origin)
-        # print(f"tree contents: {contents}")
-
-    while contents:
-        tree_element = contents.pop(0)
-        # print(f"tree_element: {tree_element}")
-        if is_truncated_str:
-            tree_element_sha = tree_element['sha']
-            tree_element_path = tree_element['path']
-        else:
-            tree_element_sha = tree_element.sha
-            tree_element_path = tree_element.path
-        full_path = {
-            "sha": tree_element_sha,
-            "path": tree_element_path
-        }
-        if passes_manifest_filter(full_path['path'], skip_snyk_code):
-            #print(f"appending to manifests to check")
-            state['manifests'].append(full_path['path'])
-        if re.match(common.MANIFEST_PATTERN_CODE, full_path['path']):
-            skip_snyk_code = True
+        tree_entries = get_git_tree_from_clone(snyk_repo_name, origin)
+    else:
+        tree_entries = iter_git_tree_from_api(tree_response)
+
+    state.manifests = list(filter_manifests(tree_entries, skip_snyk_code))
 
-    state['tree_already_retrieved'] = True
-    return state['manifests']
+    if tree_sha is not None:
+        tree_cache.put(origin, snyk_repo_name, tree_sha, filter_key, state.manifests)
+
+    state.tree_already_retrieved = True
+    return state.manifests
 
 def passes_manifest_filter(path, skip_snyk_code=False):
     """ check if given path should be imported based
         on configured search and exclusion filters """
+    return get_manifest_classifier().classify_path(path, skip_snyk_code) is not None
 
-    passes_filter = False
-    if (common.PROJECT_TYPE_ENABLED_SCA and
-            re.match(common.MANIFEST_PATTERN_SCA, path)):
-        passes_filter = True
-        # print('passes SCA filter true')
-    if (common.PROJECT_TYPE_ENABLED_CONTAINER and
-            re.match(common.MANIFEST_PATTERN_CONTAINER, path)):
-        passes_filter = True
-        # print('passes CONTAINER filter true')
-    if (common.PROJECT_TYPE_ENABLED_IAC and
-            re.match(common.MANIFEST_PATTERN_IAC, path)):
-        passes_filter = True
-        # print('passes IAC filter true')
-    if (common.PROJECT_TYPE_ENABLED_CODE and
-            re.match(common.MANIFEST_PATTERN_CODE, path)):
-        if not skip_snyk_code:
-            passes_filter = True
-            # print('passes CODE filter true')
-    if re.match(common.MANIFEST_PATTERN_EXCLUSIONS, path):
-        passes_filter = False
-
-    return passes_filter
+def get_github_token(origin):
+    """ get the token used to call github for the given integration type """
+    if origin == "github":
+        return common.GITHUB_TOKEN
+    if origin == "github-enterprise":
+        return common.GITHUB_ENTERPRISE_TOKEN
+    return None
 
 def get_gh_repo_status(snyk_gh_repo):
-    # pylint: disable=too-many-branches
+    # pylint: disable=too-many-branches, too-many-locals
     """detect if repo still exists, has been removed, or renamed"""
     repo_owner = snyk_gh_repo.full_name.split("/")[0]
     repo_name = snyk_gh_repo.full_name.split("/")[1]
@@ -184,16 +253,13 @@ def get_gh_repo_status(snyk_gh_repo):
     response_status_code = ""
     repo_default_branch = ""
     archived = False
+    pushed_at = ""
+    updated_at = ""
 
     # logging.debug(f"snyk_gh_repo origin: {snyk_gh_repo.origin}")
 
-    if snyk_gh_repo.origin == "github":
-        github_token = common.GITHUB_TOKEN
-    elif snyk_gh_repo.origin == "github-enterprise":
-        github_token = common.GITHUB_ENTERPRISE_TOKEN
-
     headers = {"Authorization": "Bearer %s"}
-    headers["Authorization"] = headers["Authorization"] % (github_token)
+    headers["Authorization"] = headers["Authorization"] % (get_github_token(snyk_gh_repo.origin))
     if snyk_gh_repo.origin == "github" or \
         (snyk_gh_repo.origin == "github-enterprise" and \
             common.USE_GHE_INTEGRATION_FOR_GH_CLOUD):
@@ -203,10 +269,10 @@ def get_gh_repo_status(snyk_gh_repo):
         request_url = f"https://{common.GITHUB_ENTERPRISE_HOST}" \
         f"/api/v3/repos/{snyk_gh_repo['full_name']}"
     try:
-        response = requests.get(url=request_url,
-                                allow_redirects=False,
-                                headers=headers,
-                                verify=common.VERIFY_TLS)
+        response = get_github_session(request_url).get(url=request_url,
+                                                       allow_redirects=False,
+                                                       headers=headers,
+                                                       verify=common.VERIFY_TLS)
         # logging.debug("response_code: %d" % response.status_code)
         # logging.debug(f"response default branch -> {response.json()['default_branch']}")
 
@@ -216,6 +282,8 @@ def get_gh_repo_status(snyk_gh_repo):
             response_message = "Match"
             repo_default_branch = response.json()['default_branch']
             archived = response.json()['archived']
+            pushed_at = response.json().get('pushed_at') or ""
+            updated_at = response.json().get('updated_at') or ""
 
         elif response.status_code == 404:
             response_message = "Not Found"
@@ -224,7 +292,7 @@ def get_gh_repo_status(snyk_gh_repo):
             raise RuntimeError("GitHub request is unauthorized!")
 
         elif response.status_code == 301:
-            follow_response = requests.get(
+            follow_response = get_github_session(response.headers["Location"]).get(
                 url=response.headers["Location"],
                 headers=headers,
                 verify=common.VERIFY_TLS
@@ -256,6 +324,128 @@ def get_gh_repo_status(snyk_gh_repo):
             repo_owner,
             f"{repo_owner}/{repo_name}",
             repo_default_branch,
-            archived
+            archived,
+            pushed_at,
+            updated_at
         )
     return repo_status
+
+def get_graphql_url(origin):
+    """ get the GraphQL endpoint for the given integration type """
+    if origin == "github" or \
+        (origin == "github-enterprise" and common.USE_GHE_INTEGRATION_FOR_GH_CLOUD):
+        return "https://api.github.com/graphql"
+    return f"https://{common.GITHUB_ENTERPRISE_HOST}/api/graphql"
+
+def build_repo_status_query(snyk_gh_repos):
+    """
+    build a single GraphQL query looking up every repo in the batch,
+    aliased r0..rN in the same order as the input
+    """
+    variable_defs = []
+    selections = []
+    variables = {}
+    for (i, snyk_gh_repo) in enumerate(snyk_gh_repos):
+        (repo_owner, repo_name) = snyk_gh_repo.full_name.split("/")[:2]
+        variable_defs.append(f"$o{i}: String!, $n{i}: String!")
+        selections.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) "
+                          "{ nameWithOwner isArchived pushedAt updatedAt "
+                          "defaultBranchRef { name } }")
+        variables[f"o{i}"] = repo_owner
+        variables[f"n{i}"] = repo_name
+
+    query = f"query({', '.join(variable_defs)}) {{ {' '.join(selections)} }}"
+    return {"query": query, "variables": variables}
+
+def get_gh_repo_statuses(snyk_gh_repos):
+    """
+    detect if repos still exist, have been removed, or renamed, looking up
+    to common.GITHUB_GRAPHQL_BATCH_SIZE repos per GraphQL request.
+    returns a GithubRepoStatus per repo, in the same order as the input
+    """
+    statuses = [None] * len(snyk_gh_repos)
+
+    # repos from different integrations are looked up with different hosts/tokens
+    by_origin = {}
+    for (i, snyk_gh_repo) in enumerate(snyk_gh_repos):
+        by_origin.setdefault(snyk_gh_repo.origin, []).append(i)
+
+    for (origin, indexes) in by_origin.items():
+        for start in range(0, len(indexes), common.GITHUB_GRAPHQL_BATCH_SIZE):
+            batch = indexes[start:start + common.GITHUB_GRAPHQL_BATCH_SIZE]
+            batch_statuses = get_gh_repo_statuses_batch(
+                [snyk_gh_repos[i] for i in batch], origin)
+            for (i, repo_status) in zip(batch, batch_statuses):
+                statuses[i] = repo_status
+
+    return statuses
+
+def get_gh_repo_statuses_batch(snyk_gh_repos, origin):
+    """
+    resolve the status of one batch of repos with a single GraphQL request,
+    falling back to get_gh_repo_status for anything GraphQL can't answer
+    """
+    headers = {"Authorization": f"Bearer {get_github_token(origin)}"}
+    try:
+        graphql_url = get_graphql_url(origin)
+        response = get_github_session(graphql_url).post(url=graphql_url,
+                                                        json=build_repo_status_query(snyk_gh_repos),
+                                                        headers=headers,
+                                                        verify=common.VERIFY_TLS)
+        if response.status_code == 401:
+            raise RuntimeError("GitHub request is unauthorized!")
+        response.raise_for_status()
+        data = response.json().get("data")
+        errors = response.json().get("errors") or []
+    except (requests.exceptions.RequestException, ValueError) as err:
+        logging.debug(f"GraphQL status lookup failed, falling back to REST: {err}")
+        return [get_gh_repo_status(snyk_gh_repo) for snyk_gh_repo in snyk_gh_repos]
+
+    if data is None:
+        logging.debug(f"GraphQL status lookup returned no data: {errors}")
+        return [get_gh_repo_status(snyk_gh_repo) for snyk_gh_repo in snyk_gh_repos]
+
+    statuses = []
+    for (i, snyk_gh_repo) in enumerate(snyk_gh_repos):
+        repository = data.get(f"r{i}")
+        if repository is None:
+            # not found (or not visible to this token). GraphQL does not say
+            # whether the repo was renamed, so let the REST lookup decide
+            statuses.append(get_gh_repo_status(snyk_gh_repo))
+        else:
+            statuses.append(repo_status_from_graphql(snyk_gh_repo, repository))
+    return statuses
+
+def repo_status_from_graphql(snyk_gh_repo, repository):
+    """ build a GithubRepoStatus from a GraphQL repository node """
+    (repo_owner, repo_name) = repository["nameWithOwner"].split("/")[:2]
+    archived = repository["isArchived"]
+
+    if repository["nameWithOwner"].lower() == snyk_gh_repo.full_name.lower():
+        # a repo without commits has no default branch ref yet. report the branch
+        # the projects monitor, so no branch update is made, as for the REST lookup
+        default_branch_ref = repository.get("defaultBranchRef") or {"name": snyk_gh_repo.branch}
+        return GithubRepoStatus(
+            200,
+            "Match",
+            snyk_gh_repo.full_name.split("/")[1],
+            snyk_gh_repo["org_id"],
+            snyk_gh_repo.full_name.split("/")[0],
+            snyk_gh_repo.full_name,
+            default_branch_ref["name"],
+            archived,
+            repository.get("pushedAt") or "",
+            repository.get("updatedAt") or ""
+        )
+
+    # GraphQL followed a rename, report it the same way as a REST 301
+    return GithubRepoStatus(
+        301,
+        f"Moved to {repo_name}",
+        repo_name,
+        snyk_gh_repo["org_id"],
+        repo_owner,
+        f"{repo_owner}/{repo_name}",
+        "",
+        archived
+    )
@@ -1,6 +1,11 @@
 """custom data objects"""
+import sys
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
+
+
+class RefreshError(Exception):
+    """The sync can't run, e.g. the Snyk orgs or integrations can't be read"""
 
 
 @dataclass
@@ -19,6 +24,22 @@ class PendingDelete:
     pending_repo: str
 
 
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class GithubRepoStatus:
+    """Status of a Github repository"""
+    response_code: str
+    response_message: str
+    repo_name: str
+    org_id: str
+    repo_owner: str
+    repo_full_name: str
+    repo_default_branch: str
+    archived: bool
+    pushed_at: str = ""
+    updated_at: str = ""
+
+
 @dataclass
 class ImportStatus:
     """Import job response"""
@@ -31,17 +52,77 @@ class ImportStatus:
     repo_name: str
     files: List[ImportFile]
     pending_project_deletes: List[PendingDelete]
+    # GitHub state of the repo, recorded as synced once the job succeeds
+    repo_sync: Optional[GithubRepoStatus] = None
+    # manifests over MAX_IMPORT_MANIFEST_PROJECTS were left for a later run
+    truncated: bool = False
+
 
-# pylint: disable=too-many-instance-attributes
 @dataclass
-class GithubRepoStatus:
-    """Status of a Github repository"""
-    response_code: str
-    response_message: str
-    repo_name: str
-    org_id: str
-    repo_owner: str
-    repo_full_name: str
-    repo_default_branch: str
-    archived: bool
-    
\ No newline at end of file
+class ProjectOperationResult:
+    """Outcome of a bulk delete/activate/deactivate on one project"""
+    action: str
+    project: dict
+    status: str
+    error: str = ""
+
+    @property
+    def succeeded(self) -> bool:
+        """whether the action was applied"""
+        return self.status == "success"
+
+
+class SnykProject:
+    """
+    Snyk project record. There is one per project in scope, so fields are
+    slots and the values repeated across projects are interned. Supports
+    the dict-style access (project["manifest"]) used throughout
+    """
+    __slots__ = ("id", "name", "repo_full_name", "repo_owner", "repo_name", "manifest",
+                 "org_id", "org_name", "origin", "type", "integration_id",
+                 "branch_from_name", "branch", "is_monitored")
+    # values shared by the projects of a repo, org or integration
+    INTERNED_FIELDS = frozenset(("repo_full_name", "repo_owner", "repo_name", "manifest",
+                                 "org_id", "org_name", "origin", "type", "integration_id",
+                                 "branch_from_name", "branch"))
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            self[field] = fields[field]
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError as err:
+            raise KeyError(field) from err
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        if field in self.INTERNED_FIELDS and isinstance(value, str):
+            value = sys.intern(value)
+        setattr(self, field, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (SnykProject, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SnykProject({self.to_dict()!r})"
+
+    def get(self, field, default=None):
+        """dict.get"""
+        return getattr(self, field, default)
+
+    def keys(self):
+        """field names, as for a dict"""
+        return self.__slots__
+
+    def items(self):
+        """(field, value) pairs, as for a dict"""
+        return [(field, getattr(self, field)) for field in self.__slots__]
+
+    def to_dict(self) -> dict:
+        """plain dict copy of the record"""
+        return dict(self.items())
@@ -10,11 +10,12 @@ from app.gh_repo import (
     get_repo_manifests,
     passes_manifest_filter
 )
+from app.utils.bulk_executor import run_project_operations, OPERATION_ERROR
 import app
 
 class SnykRepo():
     """ SnykRepo object """
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
     def __init__(
             self,
             full_name: str,
@@ -32,6 +33,8 @@ class SnykRepo():
         self.origin = origin
         self.branch = branch
         self.snyk_projects = snyk_projects
+        # project operations that failed, so the repo isn't recorded as in sync
+        self.failed_operations = 0
 
     def __repr__(self):
         return (
@@ -97,73 +100,43 @@ class SnykRepo():
         """ delete snyk projects for which the corresponding SCM file no longer exists """
         result = []
         gh_repo_manifests = get_repo_manifests(self.full_name, self.origin, True)
-        for snyk_project in self.snyk_projects:
-            # print(snyk_project["manifest"])
-            if (snyk_project["type"] != "sast" and
-                    passes_manifest_filter(snyk_project["manifest"]) and
-                    snyk_project["manifest"] not in gh_repo_manifests):
-                # delete project, append on success
-                if not dry_run:
-                    try:
-                        app.utils.snyk_helper.delete_snyk_project(snyk_project["id"],
-                                                                  snyk_project["org_id"])
-                        result.append(snyk_project)
-                    except snyk.errors.SnykNotFoundError:
-                        print(f"    - Project {snyk_project['id']} not found" \
-                            f" in org {snyk_project['org_id']}")
+        stale_projects = [snyk_project for snyk_project in self.snyk_projects
+                          if (snyk_project["type"] != "sast" and
+                              passes_manifest_filter(snyk_project["manifest"]) and
+                              snyk_project["manifest"] not in gh_repo_manifests)]
+        if not dry_run:
+            result = self.apply_to_projects("delete", stale_projects)
+            for snyk_project in result:
+                app.utils.snyk_helper.log_stale_manifest_deleted(snyk_project)
         return result
 
     def delete_manifests(self, dry_run):
         """ delete all snyk projects corresponding to a repo """
-        result = []
-        for snyk_project in self.snyk_projects:
-            # delete project, append on success
-            if not dry_run:
-                try:
-                    app.utils.snyk_helper.delete_snyk_project(snyk_project["id"],
-                                                              snyk_project["org_id"])
-                    result.append(snyk_project)
-                except snyk.errors.SnykNotFoundError:
-                    print(f"    - Project {snyk_project['id']} not found" \
-                        f" in org {snyk_project['org_id']}")
-            else:
-                result.append(snyk_project)
-        return result
-
+        if dry_run:
+            return list(self.snyk_projects)
+        return self.apply_to_projects("delete", self.snyk_projects)
 
     def deactivate_manifests(self, dry_run):
         """ deactivate all snyk projects corresponding to a repo """
-        result = []
-        for snyk_project in [x for x in self.snyk_projects if x["is_monitored"]]:
-            # delete project, append on success
-            if not dry_run:
-                try:
-                    app.utils.snyk_helper.deactivate_snyk_project(snyk_project["id"],
-                                                                  snyk_project["org_id"])
-                    result.append(snyk_project)
-                except snyk.errors.SnykNotFoundError:
-                    print(f"    - Project {snyk_project['id']} not found" \
-                        f" in org {snyk_project['org_id']}")
-            else:
-                result.append(snyk_project)
-        return result
+        monitored_projects = [x for x in self.snyk_projects if x["is_monitored"]]
+        if dry_run:
+            return monitored_projects
+        return self.apply_to_projects("deactivate", monitored_projects)
 
     def activate_manifests(self, dry_run):
         """ deactivate all snyk projects corresponding to a repo """
-        result = []
-        for snyk_project in [x for x in self.snyk_projects if not x["is_monitored"]]:
-            # delete project, append on success
-            if not dry_run:
-                try:
-                    app.utils.snyk_helper.activate_snyk_project(snyk_project["id"],
-                                                                snyk_project["org_id"])
-                    result.append(snyk_project)
-                except snyk.errors.SnykNotFoundError:
-                    print(f"    - Project {snyk_project['id']} not found" \
-                        f" in org {snyk_project['org_id']}")
-            else:
-                result.append(snyk_project)
-        return result
+        inactive_projects = [x for x in self.snyk_projects if not x["is_monitored"]]
+        if dry_run:
+            return inactive_projects
+        return self.apply_to_projects("activate", inactive_projects)
+
+    def apply_to_projects(self, action, snyk_projects):
+        """ run a bulk action on projects, returning those it was applied to """
+        results = run_project_operations([(action, snyk_project)
+                                          for snyk_project in snyk_projects],
+                                         project_action_functions())
+        self.failed_operations += sum(result.status == OPERATION_ERROR for result in results)
+        return [result.project for result in results if result.succeeded]
 
     def update_branch(self, new_branch_name, dry_run):
         """ update the branch for all snyk projects for this repo """
@@ -187,3 +160,11 @@ class SnykRepo():
         sys.stdout.write("\r")
         self.branch = new_branch_name
         return result
+
+def project_action_functions():
+    """ the snyk_helper function applying each bulk action """
+    return {
+        "delete": app.utils.snyk_helper.delete_snyk_project,
+        "activate": app.utils.snyk_helper.activate_snyk_project,
+        "deactivate": app.utils.snyk_helper.deactivate_snyk_project,
+    }
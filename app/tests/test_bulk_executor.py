@@ -0,0 +1,76 @@
+"""test suite for app/utils/bulk_executor.py"""
+import threading
+import time
+import snyk
+import common
+from app.utils import bulk_executor
+from app.utils.bulk_executor import (
+    run_project_operations,
+    OPERATION_SUCCESS,
+    OPERATION_NOT_FOUND,
+    OPERATION_ERROR
+)
+
+
+def make_project(project_id, org_id="org-a"):
+    return {"id": project_id, "name": f"owner/repo:{project_id}",
+            "org_id": org_id, "org_name": org_id}
+
+
+def test_run_project_operations_reports_each_outcome(mocker):
+    def delete(project_id, org_id):
+        if project_id == "missing":
+            return False
+        if project_id == "broken":
+            raise snyk.errors.SnykError("boom")
+        return True
+
+    log_failure = mocker.patch("app.utils.bulk_executor.log_project_operation_failure")
+    projects = [make_project("1"), make_project("missing"), make_project("broken")]
+
+    results = run_project_operations([("delete", p) for p in projects], {"delete": delete},
+                                     workers=2)
+
+    assert [(r.project["id"], r.status) for r in results] == [
+        ("1", OPERATION_SUCCESS), ("missing", OPERATION_NOT_FOUND), ("broken", OPERATION_ERROR)]
+    assert results[2].error == "boom"
+    assert log_failure.call_count == 2
+
+
+def test_run_project_operations_runs_concurrently(mocker):
+    mocker.patch.object(common, "SNYK_ORG_REQUESTS_PER_SECOND", 0)
+    mocker.patch.dict(bulk_executor._org_buckets, clear=True)  # pylint: disable=protected-access
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def deactivate(project_id, org_id):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        return True
+
+    projects = [make_project(str(i)) for i in range(16)]
+
+    results = run_project_operations([("deactivate", p) for p in projects],
+                                     {"deactivate": deactivate}, workers=4)
+
+    assert [r.project for r in results] == projects
+    assert 1 < in_flight["max"] <= 4
+
+
+def test_operations_are_rate_limited_per_org(mocker):
+    mocker.patch.dict(bulk_executor._org_buckets, clear=True)  # pylint: disable=protected-access
+    acquired = []
+    mocker.patch("app.utils.rate_limit.TokenBucket.acquire",
+                 autospec=True, side_effect=acquired.append)
+    projects = [make_project("1", "org-a"), make_project("2", "org-b"), make_project("3", "org-a")]
+
+    run_project_operations([("activate", p) for p in projects],
+                           {"activate": lambda project_id, org_id: True}, workers=1)
+
+    assert len(acquired) == 3
+    assert acquired[0] is acquired[2]
+    assert acquired[0] is not acquired[1]
@@ -0,0 +1,85 @@
+"""test suite for app/utils/checkpoint.py"""
+from app.models import GithubRepoStatus, ImportStatus, SnykProject
+from app.utils.checkpoint import (
+    Checkpoint,
+    REPO_PHASE_STATUS,
+    REPO_PHASE_IMPORT_SUBMITTED,
+    REPO_PHASE_IMPORT_FINISHED
+)
+from app.utils.import_poller import ImportStatusPoller
+
+
+def make_import_status(job_id, repo_name):
+    return ImportStatus(job_id, f"https://api.snyk.io/v1/org/o/integrations/i/import/{job_id}",
+                        "o", "org", "owner", repo_name, [{"path": "package.json"}],
+                        [{"id": "p1", "name": "owner/old:package.json", "org_id": "o",
+                          "org_name": "org", "repo_full_name": "owner/old",
+                          "manifest": "package.json"}])
+
+
+def test_checkpoint_survives_restart(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    checkpoint = Checkpoint(path)
+    job = make_import_status("job-1", "repo-a")
+
+    checkpoint.set_repo_phase("o", "owner/repo-a", REPO_PHASE_STATUS)
+    checkpoint.complete_repo("o", "owner/repo-a", [job])
+    checkpoint.complete_repo("o", "owner/repo-b", [])
+    checkpoint.set_repo_phase("o", "owner/repo-c", REPO_PHASE_STATUS)
+    checkpoint.close()
+
+    restarted = Checkpoint(path)
+    assert restarted.completed_repos() == {("o", "owner/repo-a"), ("o", "owner/repo-b")}
+    assert restarted.get_repo_phase("o", "owner/repo-a") == REPO_PHASE_IMPORT_SUBMITTED
+    assert restarted.get_repo_phase("o", "owner/repo-b") == REPO_PHASE_IMPORT_FINISHED
+    assert restarted.pending_imports() == [job]
+
+
+def test_finish_import_marks_repo_finished_after_last_job(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.sqlite"))
+    checkpoint.complete_repo("o", "owner/repo-a", [make_import_status("job-1", "repo-a"),
+                                                   make_import_status("job-2", "repo-a")])
+
+    checkpoint.finish_import("job-1")
+    assert checkpoint.get_repo_phase("o", "owner/repo-a") == REPO_PHASE_IMPORT_SUBMITTED
+    checkpoint.finish_import("job-2")
+    assert checkpoint.get_repo_phase("o", "owner/repo-a") == REPO_PHASE_IMPORT_FINISHED
+    assert checkpoint.pending_imports() == []
+
+    checkpoint.clear()
+    assert checkpoint.completed_repos() == set()
+
+
+def test_poller_removes_finished_jobs_from_checkpoint(tmp_path, mocker):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.sqlite"))
+    checkpoint.complete_repo("o", "owner/repo-a", [make_import_status("job-1", "repo-a")])
+    mocker.patch("app.utils.import_poller.write_result")
+    poller = ImportStatusPoller(mocker.Mock(return_value={"status": "complete", "logs": []}),
+                                mocker.Mock(return_value=True),
+                                min_interval=0.01, timeout=5, checkpoint=checkpoint)
+
+    for import_status_check in checkpoint.pending_imports():
+        poller.submit(import_status_check)
+    poller.wait()
+
+    assert checkpoint.pending_imports() == []
+    assert checkpoint.get_repo_phase("o", "owner/repo-a") == REPO_PHASE_IMPORT_FINISHED
+
+
+def test_checkpoint_stores_project_records(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.sqlite"))
+    record = SnykProject(
+        id="p1", name="owner/old:package.json", repo_full_name="owner/old",
+        repo_owner="owner", repo_name="old", manifest="package.json", org_id="o",
+        org_name="org", origin="github", type="npm", integration_id="i",
+        branch_from_name="", branch="main", is_monitored=True)
+    job = make_import_status("job-1", "repo-a")
+    job.pending_project_deletes = [record]
+    job.repo_sync = GithubRepoStatus(200, "Match", "repo-a", "o", "owner", "owner/repo-a",
+                                     "main", False, "2023-01-01T00:00:00Z", "")
+
+    checkpoint.complete_repo("o", "owner/repo-a", [job])
+
+    [pending] = checkpoint.pending_imports()
+    assert pending.pending_project_deletes == [record.to_dict()]
+    assert pending.repo_sync == job.repo_sync
@@ -0,0 +1,54 @@
+"""test suite for the run configuration in common.py"""
+import os
+import subprocess
+import sys
+import pytest
+import common
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def restore_args():
+    args = common.ARGS
+    yield
+    common.configure([])
+    common.ARGS = args
+
+
+def test_configure_from_arguments_and_dict(restore_args):
+    common.configure(["--org-id", "o1", "--sca", "off", "--workers", "4"])
+    assert (common.ARGS.org_id, common.ARGS.workers) == ("o1", 4)
+    assert common.PROJECT_TYPE_ENABLED_SCA is False
+
+    common.configure({"repo_name": "owner/repo", "skip_scm_validation": True})
+    assert (common.ARGS.org_id, common.ARGS.repo_name) == (None, "owner/repo")
+    assert common.VERIFY_TLS is False
+    assert common.PROJECT_TYPE_ENABLED_SCA is True
+
+    with pytest.raises(ValueError):
+        common.configure({"no_such_option": True})
+
+
+def test_clients_are_reused_until_their_settings_change(restore_args, mocker):
+    create_client = mocker.patch("common.create_client", side_effect=lambda name: object())
+    mocker.patch.dict("common._clients", clear=True)
+
+    first = common.snyk_client
+    common.configure({"dry_run": True})
+    assert common.snyk_client is first
+    common.configure({"snyk_requests_per_second": 2})
+    assert common.snyk_client is not first
+    assert create_client.call_count == 2
+
+
+def test_import_has_no_side_effects(tmp_path):
+    """ importing common parses no arguments, creates no files and loads no clients """
+    code = ("import sys, common; "
+            "print(common.ARGS.org_id, 'snyk' in sys.modules, 'github' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code, "--org-id", "from-argv"],
+                            cwd=tmp_path, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=REPO_ROOT)).stdout
+
+    assert output.split() == ["None", "False", "False"]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,52 @@
+"""test suite for app/utils/concurrency.py"""
+import random
+import time
+import pytest
+from app.utils.concurrency import map_ordered
+
+
+def slow_square(number):
+    """ print and return after a random short delay """
+    time.sleep(random.uniform(0, 0.01))
+    print(f"start {number}")
+    time.sleep(random.uniform(0, 0.01))
+    print(f"end {number}")
+    return number * number
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_map_ordered_keeps_result_and_output_order(capsys, workers):
+    results = list(map_ordered(slow_square, range(20), workers))
+
+    assert results == [n * n for n in range(20)]
+    expected_output = "".join(f"start {n}\nend {n}\n" for n in range(20))
+    assert capsys.readouterr().out == expected_output
+
+
+def test_map_ordered_reraises_worker_error_after_its_output(capsys):
+    def fail_on_three(number):
+        print(f"processing {number}")
+        if number == 3:
+            raise RuntimeError("boom")
+        return number
+
+    results = []
+    with pytest.raises(RuntimeError):
+        for result in map_ordered(fail_on_three, range(6), 2):
+            results.append(result)
+
+    assert results == [0, 1, 2]
+    assert capsys.readouterr().out.startswith(
+        "processing 0\nprocessing 1\nprocessing 2\nprocessing 3\n")
+
+
+def test_nested_map_ordered_keeps_output_order(capsys):
+    def inner(number):
+        return list(map_ordered(slow_square, [number * 10 + n for n in range(3)], 3))
+
+    results = list(map_ordered(inner, range(4), 2))
+
+    assert results == [[(n * 10 + i) ** 2 for i in range(3)] for n in range(4)]
+    expected_output = "".join(f"start {n * 10 + i}\nend {n * 10 + i}\n"
+                              for n in range(4) for i in range(3))
+    assert capsys.readouterr().out == expected_output
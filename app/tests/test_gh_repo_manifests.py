@@ -0,0 +1,185 @@
+"""test suite for tree retrieval and manifest discovery in app/gh_repo.py"""
+import subprocess
+from types import SimpleNamespace
+import pytest
+import common
+from app import gh_repo
+from app.gh_repo import (
+    clone_git_tree,
+    filter_manifests,
+    get_repo_manifests,
+    read_git_tree
+)
+from app.utils.tree_cache import TreeCache
+
+
+def fake_tree_response(paths, truncated=False):
+    """ stand-in for a PyGithub GitTree """
+    tree = [SimpleNamespace(sha=f"sha-{i}", path=path) for (i, path) in enumerate(paths)]
+    return SimpleNamespace(tree=tree, _rawData={"truncated": truncated})
+
+
+@pytest.fixture(autouse=True)
+def reset_tree_state(mocker):
+    gh_repo.reset_repo_state()
+    mocker.patch("app.gh_repo.get_tree_cache", return_value=None)
+    yield
+    gh_repo.reset_repo_state()
+
+
+def test_filter_manifests_is_lazy():
+    def tree_entries():
+        yield ("sha-1", "package.json")
+        raise AssertionError("read past the first manifest")
+
+    manifests = filter_manifests(tree_entries(), True)
+
+    assert next(manifests) == "package.json"
+
+
+def test_get_repo_manifests_from_api(mocker):
+    paths = ["README.md", "package.json", "src/main.go", "tests/package.json",
+             "docker/Dockerfile", "services/api/requirements.txt"]
+    mocker.patch("app.gh_repo.get_git_tree_from_api", return_value=fake_tree_response(paths))
+    clone = mocker.patch("app.gh_repo.get_git_tree_from_clone")
+
+    manifests = get_repo_manifests("owner/repo", "github", True)
+
+    assert manifests == ["package.json", "docker/Dockerfile", "services/api/requirements.txt"]
+    clone.assert_not_called()
+
+
+def test_get_repo_manifests_falls_back_to_clone(mocker):
+    mocker.patch("app.gh_repo.get_git_tree_from_api",
+                 return_value=fake_tree_response(["package.json"], truncated=True))
+    mocker.patch("app.gh_repo.get_git_tree_from_clone",
+                 return_value=iter([("sha-1", "go.mod"), ("sha-2", "main.go")]))
+
+    assert get_repo_manifests("owner/repo", "github", True) == ["go.mod"]
+
+
+def test_get_repo_manifests_reuses_tree_for_next_call(mocker):
+    tree_api = mocker.patch("app.gh_repo.get_git_tree_from_api",
+                            return_value=fake_tree_response(["package.json"]))
+
+    first = get_repo_manifests("owner/repo", "github", True)
+    second = get_repo_manifests("owner/repo", "github", True)
+
+    assert first == second == ["package.json"]
+    tree_api.assert_called_once()
+
+
+def test_reset_repo_state_looks_the_repo_up_again(mocker):
+    get_github_repo = mocker.patch("app.gh_repo.get_github_repo", side_effect=[
+        SimpleNamespace(default_branch="main"), SimpleNamespace(default_branch="develop")])
+    mocker.patch("app.gh_repo.get_github_client")
+    tree_api = mocker.patch("app.gh_repo.get_git_tree_from_api",
+                            return_value=fake_tree_response(["package.json"]))
+
+    assert gh_repo.get_current_github_repo("owner/repo", "github").default_branch == "main"
+    get_repo_manifests("owner/repo", "github", True)
+    # e.g. a later refresh() in the same process, after the default branch changed
+    gh_repo.reset_repo_state()
+    assert gh_repo.get_current_github_repo("owner/repo", "github").default_branch == "develop"
+    get_repo_manifests("owner/repo", "github", True)
+
+    assert get_github_repo.call_count == 2
+    assert tree_api.call_count == 2
+
+
+def test_get_repo_manifests_uses_tree_cache(mocker, tmp_path):
+    tree_cache = TreeCache(str(tmp_path / "tree-cache.sqlite"))
+    mocker.patch("app.gh_repo.get_tree_cache", return_value=tree_cache)
+    mocker.patch("app.gh_repo.get_default_branch_tree_sha", return_value="tree-1")
+    tree_api = mocker.patch("app.gh_repo.get_git_tree_from_api",
+                            return_value=fake_tree_response(["package.json", "go.mod"]))
+
+    first = get_repo_manifests("owner/repo", "github", True)
+    gh_repo.state.tree_already_retrieved = False
+    second = get_repo_manifests("owner/repo", "github", True)
+
+    assert first == second == ["package.json", "go.mod"]
+    tree_api.assert_called_once()
+
+    # a new tree sha for the default branch means the tree is fetched again
+    mocker.patch("app.gh_repo.get_default_branch_tree_sha", return_value="tree-2")
+    gh_repo.state.tree_already_retrieved = False
+    get_repo_manifests("owner/repo", "github", True)
+    assert tree_api.call_count == 2
+
+
+def test_tree_cache_evicts_by_age_and_size(tmp_path, mocker):
+    tree_cache = TreeCache(str(tmp_path / "tree-cache.sqlite"))
+    clock = mocker.patch("app.utils.tree_cache.time.time", return_value=1000.0)
+    tree_cache.put("github", "owner/old", "sha-old", "key", ["package.json"])
+    clock.return_value = 2000.0
+    for i in range(3):
+        tree_cache.put("github", f"owner/repo-{i}", f"sha-{i}", "key", ["go.mod"])
+        clock.return_value += 1
+
+    tree_cache.evict(max_age_seconds=500, max_entries=2)
+
+    assert len(tree_cache) == 2
+    assert tree_cache.get("github", "owner/old", "sha-old", "key") is None
+    assert tree_cache.get("github", "owner/repo-0", "sha-0", "key") is None
+    assert tree_cache.get("github", "owner/repo-2", "sha-2", "key") == ["go.mod"]
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+                    "-c", "init.defaultBranch=main"] + list(args),
+                   check=True, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def bare_repo(tmp_path, mocker):
+    """ a local bare repo with a few files, served over file:// so filters apply """
+    work = tmp_path / "work"
+    work.mkdir()
+    git("init", cwd=work)
+    files = ["package.json", "src/main.go", "docs/with space/requirements.txt",
+             "services/ünïcode/Dockerfile", "tests/package.json"]
+    for name in files:
+        (work / name).parent.mkdir(parents=True, exist_ok=True)
+        (work / name).write_text(name)
+    git("add", ".", cwd=work)
+    git("commit", "-m", "initial", cwd=work)
+    git("clone", "--bare", str(work), str(tmp_path / "repo.git"))
+    git("config", "uploadpack.allowFilter", "true", cwd=tmp_path / "repo.git")
+
+    clone_dir = tmp_path / "clones"
+    clone_dir.mkdir()
+    mocker.patch.object(common, "GIT_CLONE_TEMP_DIR", str(clone_dir))
+    return f"file://{tmp_path / 'repo.git'}", files, clone_dir
+
+
+@pytest.mark.parametrize("clone_mode", ["partial", "full"])
+def test_clone_git_tree_from_local_bare_repo(bare_repo, clone_mode):
+    (clone_url, files, clone_dir) = bare_repo
+
+    tree = list(clone_git_tree("repo", clone_url, "main", clone_mode))
+
+    assert sorted(path for (_, path) in tree) == sorted(files)
+    assert all(len(sha) == 40 for (sha, _) in tree)
+    # clones are cleaned up once the tree has been read
+    assert list(clone_dir.iterdir()) == []
+
+
+def test_clone_git_tree_cleans_up_when_abandoned(bare_repo):
+    (clone_url, _, clone_dir) = bare_repo
+
+    tree = clone_git_tree("repo", clone_url, "main")
+    next(tree)
+    tree.close()
+
+    assert list(clone_dir.iterdir()) == []
+
+
+def test_read_git_tree_parses_incrementally(bare_repo, tmp_path):
+    (clone_url, files, _) = bare_repo
+    git("clone", "--quiet", clone_url, str(tmp_path / "checkout"))
+
+    # tiny reads so records are split across chunk boundaries
+    tree = list(read_git_tree(tmp_path / "checkout", "HEAD", chunk_size=7))
+
+    assert sorted(path for (_, path) in tree) == sorted(files)
@@ -0,0 +1,132 @@
+"""test suite for the batched GraphQL repo status lookup in app/gh_repo.py"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+import common
+from app.snyk_repo import SnykRepo
+from app.models import GithubRepoStatus
+from app.gh_repo import get_gh_repo_statuses
+
+# repos known to the stub endpoint, keyed by the name they are looked up with
+STUB_REPOSITORIES = {
+    "test_owner/test_repo": {
+        "nameWithOwner": "test_owner/test_repo",
+        "isArchived": False,
+        "pushedAt": "2023-01-01T00:00:00Z",
+        "updatedAt": "2023-01-02T00:00:00Z",
+        "defaultBranchRef": {"name": "main"}
+    },
+    "test_owner/archived_repo": {
+        "nameWithOwner": "test_owner/archived_repo",
+        "isArchived": True,
+        "defaultBranchRef": {"name": "master"}
+    },
+    "test_owner/empty_repo": {
+        "nameWithOwner": "test_owner/empty_repo",
+        "isArchived": False,
+        "defaultBranchRef": None
+    },
+    "test_owner/old_name": {
+        "nameWithOwner": "new_owner/new_name",
+        "isArchived": False,
+        "defaultBranchRef": {"name": "main"}
+    },
+}
+
+
+class StubGraphQLHandler(BaseHTTPRequestHandler):
+    """ answers aliased repository(owner, name) lookups from STUB_REPOSITORIES """
+    requests_seen = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubGraphQLHandler.requests_seen.append(body)
+        variables = body["variables"]
+
+        data = {}
+        errors = []
+        i = 0
+        while f"o{i}" in variables:
+            full_name = f"{variables[f'o{i}']}/{variables[f'n{i}']}"
+            data[f"r{i}"] = STUB_REPOSITORIES.get(full_name)
+            if data[f"r{i}"] is None:
+                errors.append({"type": "NOT_FOUND", "path": [f"r{i}"]})
+            i += 1
+
+        payload = json.dumps({"data": data, "errors": errors}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def stub_graphql_endpoint(mocker):
+    server = HTTPServer(("127.0.0.1", 0), StubGraphQLHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubGraphQLHandler.requests_seen = []
+    mocker.patch("app.gh_repo.get_graphql_url",
+                 return_value=f"http://127.0.0.1:{server.server_port}/graphql")
+    yield StubGraphQLHandler.requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def make_snyk_repo(full_name):
+    return SnykRepo(full_name, "1234-5678", "test_org", "12345", "github", "main", [])
+
+
+def test_get_gh_repo_statuses_batches_requests(stub_graphql_endpoint, mocker):
+    mocker.patch.object(common, "GITHUB_GRAPHQL_BATCH_SIZE", 2)
+    rest_status = GithubRepoStatus(404, "Not Found", "gone_repo", "1234-5678",
+                                   "test_owner", "test_owner/gone_repo", "", False)
+    rest_lookup = mocker.patch("app.gh_repo.get_gh_repo_status", return_value=rest_status)
+
+    snyk_repos = [make_snyk_repo(full_name) for full_name in [
+        "test_owner/test_repo",
+        "test_owner/archived_repo",
+        "test_owner/old_name",
+        "test_owner/gone_repo",
+    ]]
+
+    statuses = get_gh_repo_statuses(snyk_repos)
+
+    assert len(stub_graphql_endpoint) == 2
+    assert statuses == [
+        GithubRepoStatus(200, "Match", "test_repo", "1234-5678", "test_owner",
+                         "test_owner/test_repo", "main", False,
+                         "2023-01-01T00:00:00Z", "2023-01-02T00:00:00Z"),
+        GithubRepoStatus(200, "Match", "archived_repo", "1234-5678", "test_owner",
+                         "test_owner/archived_repo", "master", True),
+        GithubRepoStatus(301, "Moved to new_name", "new_name", "1234-5678", "new_owner",
+                         "new_owner/new_name", "", False),
+        rest_status,
+    ]
+    # only the repo GraphQL could not find goes back to the REST lookup
+    rest_lookup.assert_called_once_with(snyk_repos[3])
+
+
+def test_get_gh_repo_statuses_falls_back_to_rest_on_error(mocker):
+    mocker.patch("app.gh_repo.get_graphql_url", return_value="http://127.0.0.1:1/graphql")
+    rest_lookup = mocker.patch("app.gh_repo.get_gh_repo_status", return_value="rest")
+
+    snyk_repos = [make_snyk_repo("test_owner/test_repo"), make_snyk_repo("test_owner/other")]
+
+    assert get_gh_repo_statuses(snyk_repos) == ["rest", "rest"]
+    assert rest_lookup.call_count == 2
+
+
+def test_repo_without_commits_keeps_the_monitored_branch(stub_graphql_endpoint):
+    snyk_repo = SnykRepo("test_owner/empty_repo", "1234-5678", "test_org", "12345", "github",
+                         "develop", [])
+
+    (status,) = get_gh_repo_statuses([snyk_repo])
+
+    assert status.response_code == 200
+    assert status.repo_default_branch == "develop"
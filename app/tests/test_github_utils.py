@@ -0,0 +1,77 @@
+"""test suite for the pooled github sessions in app/utils/github_utils.py"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.utils.github_utils import GithubSessionManager
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """ answers every request on a persistent connection, recording the client port """
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_GET(self):
+        KeepAliveHandler.client_ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def keep_alive_server(mocker):
+    mocker.patch("app.utils.github_utils.get_http_cache", return_value=None)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    KeepAliveHandler.client_ports = []
+    yield f"http://127.0.0.1:{server.server_port}", KeepAliveHandler.client_ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_sessions_are_shared_per_origin():
+    manager = GithubSessionManager()
+
+    api = manager.session_for("https://api.github.com/repos/owner/repo")
+    assert manager.session_for("https://api.github.com:443/graphql") is api
+    assert manager.session_for("https://ghe.example.com/api/v3/repos/owner/repo") is not api
+
+
+def test_session_respects_verify():
+    manager = GithubSessionManager(verify=False)
+
+    assert manager.session_for("https://ghe.example.com/api/v3").verify is False
+
+
+def test_connections_are_kept_alive(keep_alive_server):
+    (base_url, client_ports) = keep_alive_server
+    manager = GithubSessionManager()
+
+    for _ in range(5):
+        manager.session_for(base_url).get(f"{base_url}/repos/owner/repo")
+
+    assert len(client_ports) == 5
+    assert len(set(client_ports)) == 1
+    manager.close()
+
+
+def test_pool_is_shared_between_threads(keep_alive_server):
+    (base_url, client_ports) = keep_alive_server
+    manager = GithubSessionManager(pool_size=4)
+
+    def fetch(_):
+        return manager.session_for(base_url).get(f"{base_url}/repos/owner/repo").status_code
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert set(executor.map(fetch, range(40))) == {200}
+
+    # connections are returned to the pool and reused, at most one per worker
+    assert len(client_ports) == 40
+    assert len(set(client_ports)) <= 4
+    manager.close()
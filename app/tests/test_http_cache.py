@@ -0,0 +1,123 @@
+"""test suite for app/utils/http_cache.py and the shared github session"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+import requests
+from app.utils.http_cache import ConditionalRequestAdapter, HttpCache
+from github import Github
+from app.utils.github_utils import use_github_session_for_pygithub
+
+REPO_JSON = {
+    "id": 1, "name": "repo", "full_name": "owner/repo",
+    "default_branch": "main", "archived": False,
+    "url": "http://127.0.0.1/repos/owner/repo"
+}
+
+
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    """ serves one repo with an ETag, answering 304 when it's sent back """
+    status_codes = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            StubGitHubHandler.status_codes.append(304)
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("X-RateLimit-Remaining", "4999")
+            self.end_headers()
+            return
+        payload = json.dumps(REPO_JSON).encode()
+        StubGitHubHandler.status_codes.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", '"v1"')
+        self.send_header("X-RateLimit-Remaining", "4998")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def stub_github():
+    server = HTTPServer(("127.0.0.1", 0), StubGitHubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubGitHubHandler.status_codes = []
+    yield f"http://127.0.0.1:{server.server_port}", StubGitHubHandler.status_codes
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cached_session(tmp_path):
+    http_cache = HttpCache(str(tmp_path / "http-cache.sqlite"))
+    session = requests.Session()
+    session.mount("http://", ConditionalRequestAdapter(lambda: http_cache))
+    return session
+
+
+def test_conditional_request_returns_cached_body(stub_github, cached_session):
+    (base_url, status_codes) = stub_github
+
+    first = cached_session.get(f"{base_url}/repos/owner/repo")
+    second = cached_session.get(f"{base_url}/repos/owner/repo")
+
+    assert status_codes == [200, 304]
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() == REPO_JSON
+    assert second.headers["X-From-Cache"] == "1"
+    # rate limit headers come from the fresh response
+    assert second.headers["X-RateLimit-Remaining"] == "4999"
+
+
+def test_responses_are_not_shared_between_tokens(stub_github, cached_session):
+    (base_url, status_codes) = stub_github
+
+    cached_session.get(f"{base_url}/repos/owner/repo", headers={"Authorization": "token a"})
+    cached_session.get(f"{base_url}/repos/owner/repo", headers={"Authorization": "token b"})
+
+    assert status_codes == [200, 200]
+
+
+def test_pygithub_requests_use_shared_session(stub_github, cached_session, mocker):
+    (base_url, status_codes) = stub_github
+    mocker.patch("app.utils.github_utils.get_github_session", return_value=cached_session)
+
+    use_github_session_for_pygithub()
+    gh_client = Github(base_url=base_url, login_or_token="token")
+
+    assert gh_client.get_repo("owner/repo").default_branch == "main"
+    assert gh_client.get_repo("owner/repo").default_branch == "main"
+    assert status_codes == [200, 304]
+
+
+def test_git_trees_are_not_cached(stub_github, cached_session):
+    (base_url, status_codes) = stub_github
+
+    cached_session.get(f"{base_url}/repos/owner/repo/git/trees/sha-1?recursive=1")
+    cached_session.get(f"{base_url}/repos/owner/repo/git/trees/sha-1?recursive=1")
+
+    assert status_codes == [200, 200]
+
+
+def test_http_cache_evicts_by_age_and_size(tmp_path, mocker):
+    http_cache = HttpCache(str(tmp_path / "http-cache.sqlite"))
+    response = mocker.Mock(url="https://api.github.com/repos/owner/repo", status_code=200,
+                           headers={"ETag": '"v1"'}, content=b"{}")
+    clock = mocker.patch("app.utils.http_cache.time.time", return_value=1000.0)
+    http_cache.put("old", response)
+    clock.return_value = 2000.0
+    for i in range(3):
+        http_cache.put(f"key-{i}", response)
+        clock.return_value += 1
+
+    http_cache.evict(max_age_seconds=500, max_entries=2)
+
+    assert len(http_cache) == 2
+    assert http_cache.get("old") is None
+    assert http_cache.get("key-0") is None
+    assert http_cache.get("key-2") is not None
@@ -0,0 +1,127 @@
+"""test suite for app/utils/import_poller.py"""
+import threading
+import time
+from app.models import ImportStatus
+from app.utils.import_poller import ImportStatusPoller
+
+
+def make_import_status(job_id, pending_deletes=None):
+    return ImportStatus(job_id, f"https://api.snyk.io/v1/org/o/integrations/i/import/{job_id}",
+                        "o", "org", "owner", f"repo-{job_id}", [], pending_deletes or [])
+
+
+def make_pending_delete(project_id):
+    return {"id": project_id, "name": f"owner/old-name:{project_id}",
+            "org_id": "o", "org_name": "org",
+            "repo_full_name": "owner/old-name", "manifest": "package.json"}
+
+
+class FakeImportJobs():
+    """ import jobs that complete after a number of checks """
+    def __init__(self, checks_until_complete):
+        self.checks_until_complete = checks_until_complete
+        self.checks = {}
+        self.lock = threading.Lock()
+
+    def get_import_status(self, import_status_url, org_id):
+        job_id = import_status_url.rsplit("/", 1)[1]
+        with self.lock:
+            self.checks[job_id] = self.checks.get(job_id, 0) + 1
+            complete = self.checks[job_id] >= self.checks_until_complete.get(job_id, 1)
+        log_status = "complete" if complete else "pending"
+        return {
+            "status": "complete" if complete else "pending",
+            "logs": [{"name": f"owner/repo-{job_id}", "created": "2020-01-01",
+                      "status": log_status,
+                      "projects": [{"targetFile": "package.json", "success": True}]}]
+        }
+
+
+def test_poller_completes_jobs_and_deletes_pending_projects(mocker):
+    jobs = FakeImportJobs({"a": 1, "b": 3})
+    delete = mocker.Mock(return_value=True)
+    poller = ImportStatusPoller(jobs.get_import_status, delete, workers=2, min_interval=0.01, max_interval=0.04, timeout=5)
+
+    poller.submit(make_import_status("a"))
+    poller.submit(make_import_status("b", [make_pending_delete("p1")]))
+    # a second check for the same job adds its pending deletes to the first
+    poller.submit(make_import_status("b", [make_pending_delete("p2")]))
+    poller.wait()
+
+    assert poller.completed_jobs == {"a", "b"}
+    assert jobs.checks == {"a": 1, "b": 3}
+    assert poller.completed_logs == {"owner/repo-a-2020-01-01", "owner/repo-b-2020-01-01"}
+    assert sorted(c.args for c in delete.call_args_list) == [("p1", "o"), ("p2", "o")]
+
+
+def test_poller_starts_polling_on_first_submit(mocker):
+    jobs = FakeImportJobs({})
+    poller = ImportStatusPoller(jobs.get_import_status, mocker.Mock(),
+                                min_interval=0.01, timeout=5)
+
+    poller.submit(make_import_status("a"))
+    deadline = time.monotonic() + 2
+    while poller.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert poller.completed_jobs == {"a"}
+    poller.wait()
+
+
+def test_poller_backs_off_and_gives_up_after_timeout(mocker):
+    jobs = FakeImportJobs({"a": 1000})
+    write_result = mocker.patch("app.utils.import_poller.write_result")
+    delete = mocker.Mock()
+    poller = ImportStatusPoller(jobs.get_import_status, delete, min_interval=0.01, max_interval=0.08, timeout=0.3)
+
+    poller.submit(make_import_status("a", [make_pending_delete("p1")]))
+    poller.wait()
+
+    assert poller.expired_jobs == {"a"}
+    # 0.01 + 0.02 + 0.04 + 0.08 + 0.08 ... rather than a check every 0.01s
+    assert 3 <= jobs.checks["a"] <= 8
+    delete.assert_not_called()
+    write_result.assert_called_once_with("renamed_manifest_pending", "org", "owner/repo-a")
+
+
+def test_poller_reports_job_progress(mocker, capsys):
+    jobs = FakeImportJobs({"a": 2})
+    mocker.patch("common.IMPORT_STATUS_MIN_INTERVAL", 0.01)
+    mocker.patch("common.IMPORT_STATUS_MAX_INTERVAL", 0.02)
+    poller = ImportStatusPoller(jobs.get_import_status, mocker.Mock())
+
+    poller.submit(make_import_status("a"))
+    poller.wait()
+
+    output = capsys.readouterr().out
+    assert "checking import job: a [complete]" in output
+    assert "None Pending, Done." in output
+
+
+def test_pending_deletes_start_when_the_repo_import_completes(mocker):
+    """ old projects are deleted once the new repo is imported, before the job finishes """
+    checks = []
+    checks_before_delete = []
+
+    def get_import_status(import_status_url, org_id):
+        checks.append(import_status_url)
+        return {
+            "status": "pending" if len(checks) < 3 else "complete",
+            "logs": [{"name": "owner/repo-a", "created": "2020-01-01", "status": "complete",
+                      "projects": [{"targetFile": "package.json", "success": True}]}]
+        }
+
+    delete = mocker.Mock(side_effect=lambda *args: checks_before_delete.append(len(checks)))
+    write_result = mocker.patch("app.utils.import_poller.write_result")
+    poller = ImportStatusPoller(get_import_status, delete, min_interval=0.01, max_interval=0.02, timeout=5)
+
+    poller.submit(make_import_status("a", [make_pending_delete("p1"), make_pending_delete("p2")]))
+    poller.wait()
+
+    # deleted after the first check, while the job itself was still pending
+    assert len(checks) == 3
+    assert delete.call_count == 2
+    assert all(count < 3 for count in checks_before_delete)
+    assert [c.args for c in write_result.call_args_list
+            if c.args[0] == "renamed_manifest_deleted"] == [
+                ("renamed_manifest_deleted", "org", "owner/old-name:package.json")] * 2
@@ -0,0 +1,100 @@
+"""test suite for app/utils/manifest_classifier.py"""
+import itertools
+import random
+import re
+import pytest
+import common
+from app.utils.manifest_classifier import (
+    ManifestClassifier,
+    PROJECT_TYPES,
+    PROJECT_TYPE_SCA,
+    PROJECT_TYPE_CONTAINER,
+    PROJECT_TYPE_IAC,
+    PROJECT_TYPE_CODE
+)
+
+
+def regex_project_type(path, enabled_types, skip_snyk_code=False):
+    """ reference implementation: the original uncompiled re.match filter """
+    patterns = [
+        (PROJECT_TYPE_SCA, common.MANIFEST_PATTERN_SCA),
+        (PROJECT_TYPE_CONTAINER, common.MANIFEST_PATTERN_CONTAINER),
+        (PROJECT_TYPE_IAC, common.MANIFEST_PATTERN_IAC),
+        (PROJECT_TYPE_CODE, common.MANIFEST_PATTERN_CODE),
+    ]
+    matched = None
+    for (project_type, pattern) in patterns:
+        if project_type not in enabled_types:
+            continue
+        if project_type == PROJECT_TYPE_CODE and skip_snyk_code:
+            continue
+        if matched is None and re.match(pattern, path):
+            matched = project_type
+    if re.match(common.MANIFEST_PATTERN_EXCLUSIONS, path):
+        return None
+    return matched
+
+
+TRICKY_PATHS = [
+    "package.json", "mypackage.json", ".package.json", "a/.hidden/package.json",
+    "requirements.txt", "requirements-test.txt", "req.txt", "notes.txt", "dir/req/notes.txt",
+    "reqtxt", ".requirements.txt", "Podfile", "MyPodfile", "a.b/Podfile", "Podfile.lock",
+    "Dockerfile", "prod.Dockerfile", "Dockerfile.prod", "docker/Dockerfile",
+    "main.tf", "variables.tf", "outputs.tf", "deploy/values.yaml", "x.yml", ".ci.yml",
+    ".gitlab-ci.yml", "app.py", "src/index.js", "src/index.jsx", "Program.cs", "a.csproj",
+    "tests/Gemfile.lock", "test/pom.xml", "__tests__/package.json", "__test__/go.mod",
+    "fixtures/go.mod", "node_modules/x/package.json", "bower_components/x/bower.json",
+    ".circleci/config.yml", "a.ci/go.mod", "vendor/vendor.json", "x/project.assets.json",
+    "build.gradle", "build.gradle.kts", "build.sbt", "composer.lock", "Gopkg.lock",
+    "packages.config", "app.fsproj", "app.vbproj", "yarn.lockfile", "pom.xml.bak",
+]
+
+FRAGMENTS = ["src", "tests", "test", "lib", ".ci", "node_modules", "req", "fixtures",
+             "a.b", "docker", "deploy", "__tests__", "ci"]
+FILE_NAMES = ["package.json", "requirements.txt", "Dockerfile", "main.tf", "values.yaml",
+              "app.py", "index.js", "README.md", "logo.png", "main.go", "Podfile",
+              "variables.tf", "ci.yml", "pom.xml", "reqs.txt", "x.csproj", "notes.txt"]
+
+
+def random_paths(count, seed=1234):
+    rand = random.Random(seed)
+    for _ in range(count):
+        dirs = rand.choices(FRAGMENTS, k=rand.randint(0, 3))
+        prefix = rand.choice(["", ".", "my", "x-"])
+        yield "/".join(dirs + [prefix + rand.choice(FILE_NAMES)])
+
+
+ENABLED_TYPE_COMBINATIONS = [
+    combo for size in range(len(PROJECT_TYPES) + 1)
+    for combo in itertools.combinations(PROJECT_TYPES, size)
+]
+
+
+@pytest.mark.parametrize("enabled_types", ENABLED_TYPE_COMBINATIONS)
+@pytest.mark.parametrize("skip_snyk_code", [False, True])
+def test_classifier_matches_regex_filter(enabled_types, skip_snyk_code):
+    classifier = ManifestClassifier(enabled_types)
+    paths = TRICKY_PATHS + list(random_paths(2000))
+
+    expected = [regex_project_type(path, enabled_types, skip_snyk_code) for path in paths]
+
+    assert classifier.classify(paths, skip_snyk_code) == expected
+
+
+def test_classify_path_returns_project_type():
+    classifier = ManifestClassifier(PROJECT_TYPES)
+
+    assert classifier.classify_path("package.json") == PROJECT_TYPE_SCA
+    assert classifier.classify_path("docker/Dockerfile") == PROJECT_TYPE_CONTAINER
+    assert classifier.classify_path("deploy/main.tf") == PROJECT_TYPE_IAC
+    assert classifier.classify_path("app.py") == PROJECT_TYPE_CODE
+    assert classifier.classify_path("app.py", skip_snyk_code=True) is None
+    assert classifier.classify_path("README.md") is None
+    assert classifier.classify_path("tests/package.json") is None
+
+
+def test_is_code_ignores_enabled_types():
+    classifier = ManifestClassifier((PROJECT_TYPE_SCA,))
+
+    assert classifier.is_code("src/app.py")
+    assert not classifier.is_code("package.json")
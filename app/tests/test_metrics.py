@@ -0,0 +1,88 @@
+"""test suite for app/utils/metrics.py"""
+import threading
+from app.utils.metrics import (
+    Metrics,
+    ProgressTracker,
+    github_endpoint,
+    snyk_endpoint
+)
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_counters_and_histograms_from_threads():
+    metrics = Metrics()
+
+    def record():
+        for _ in range(1000):
+            metrics.inc("github_requests_total", endpoint="graphql", status=200)
+            metrics.observe("github_request_seconds", 0.2, endpoint="graphql")
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.counters[("github_requests_total",
+                             (("endpoint", "graphql"), ("status", "200")))] == 8000
+    histogram = metrics.histograms[("github_request_seconds", (("endpoint", "graphql"),))]
+    assert histogram.count == 8000
+    assert histogram.quantile(0.95) == 0.2
+
+
+def test_timer_and_prometheus_text(tmp_path):
+    clock = FakeClock()
+    metrics = Metrics(clock=clock)
+    with metrics.phase("org_fetch"):
+        clock.now += 3
+    metrics.inc("snyk_retries_total", reason=429)
+    metrics.set("eta_seconds", 120)
+
+    path = tmp_path / "snyk_scm_refresh.prom"
+    metrics.write_prometheus(str(path))
+    lines = path.read_text().splitlines()
+
+    assert "# TYPE snyk_scm_refresh_snyk_retries_total counter" in lines
+    assert 'snyk_scm_refresh_snyk_retries_total{reason="429"} 1' in lines
+    assert "snyk_scm_refresh_eta_seconds 120" in lines
+    assert "# TYPE snyk_scm_refresh_phase_seconds histogram" in lines
+    assert 'snyk_scm_refresh_phase_seconds_bucket{phase="org_fetch",le="2.5"} 0' in lines
+    assert 'snyk_scm_refresh_phase_seconds_bucket{phase="org_fetch",le="5"} 1' in lines
+    assert 'snyk_scm_refresh_phase_seconds_bucket{phase="org_fetch",le="+Inf"} 1' in lines
+    assert 'snyk_scm_refresh_phase_seconds_sum{phase="org_fetch"} 3.0' in lines
+    assert "phase_seconds phase=org_fetch" in metrics.summary()
+
+
+def test_endpoint_labels_leave_out_ids():
+    assert github_endpoint("https://api.github.com/graphql") == "graphql"
+    assert github_endpoint("https://ghe.example.com/api/graphql") == "graphql"
+    assert github_endpoint(
+        "https://ghe.example.com/api/v3/repos/owner/repo/git/trees/"
+        "0123456789abcdef0123456789abcdef01234567?recursive=1") == "repos/git/trees"
+    assert github_endpoint("https://api.github.com/repos/owner/repo") == "repos"
+    assert snyk_endpoint(
+        "https://snyk.io/api/v1/org/1a2b3c4d-0000-1111-2222-333344445555/project/"
+        "9f8e7d6c-0000-1111-2222-333344445555/deactivate") == "org/project/deactivate"
+
+
+def test_progress_estimates_the_orgs_not_yet_discovered():
+    clock = FakeClock()
+    metrics = Metrics(clock=clock)
+    progress = ProgressTracker(4, metrics, interval=30, clock=clock)
+    progress.add_org(["repo"] * 10)
+    for _ in range(5):
+        progress.repo_done()
+
+    clock.now = 10
+    assert progress.report() is None
+
+    clock.now = 50
+    assert progress.report() == \
+        "[progress] 5/~40 repos, 0.10 repos/s, orgs 1/4, ETA 5m50s"
+    assert metrics.gauges[("eta_seconds", ())] == 350
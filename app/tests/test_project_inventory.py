@@ -0,0 +1,76 @@
+"""test suite for app/utils/project_inventory.py"""
+import time
+from unittest.mock import MagicMock
+import common
+from app.utils.project_inventory import ProjectInventory
+from app.utils.snyk_helper import build_snyk_project_list
+
+
+def make_record(project_id, name="owner/repo:package.json"):
+    return {"id": project_id, "name": name, "origin": "github"}
+
+
+def make_org(projects):
+    snyk_org = MagicMock()
+    snyk_org.id = "org1"
+    snyk_org.name = "Org One"
+    snyk_org.integrations.filter.return_value = [MagicMock(id="gh-integration")]
+    snyk_org.projects.all.return_value = projects
+    return snyk_org
+
+
+def make_project(project_id, name):
+    project = MagicMock()
+    project.id = project_id
+    project.name = name
+    project.origin = "github"
+    project.type = "npm"
+    project.branch = "main"
+    project.isMonitored = True
+    return project
+
+
+def test_inventory_round_trip_and_max_age(tmp_path):
+    inventory = ProjectInventory(str(tmp_path / "inventory.sqlite"))
+    assert inventory.get_org_projects("org1", 3600) is None
+
+    records = [make_record("p2"), make_record("p1", "owner/repo:pom.xml")]
+    inventory.put_org_projects("org1", records)
+
+    assert inventory.get_org_projects("org1", 3600) == records
+    assert inventory.get_org_projects("org2", 3600) is None
+    # older than the max age
+    inventory.execute("UPDATE orgs SET refreshed_at = ?", (time.time() - 7200,))
+    assert inventory.get_org_projects("org1", 3600) is None
+
+
+def test_inventory_refetches_orgs_marked_dirty(tmp_path):
+    inventory = ProjectInventory(str(tmp_path / "inventory.sqlite"))
+    inventory.put_org_projects("org1", [make_record("p1")])
+
+    inventory.mark_dirty("org1")
+    assert inventory.get_org_projects("org1", 3600) is None
+
+    inventory.put_org_projects("org1", [make_record("p3")])
+    assert inventory.get_org_projects("org1", 3600) == [make_record("p3")]
+
+
+def test_project_list_served_from_inventory(tmp_path, mocker):
+    inventory = ProjectInventory(str(tmp_path / "inventory.sqlite"))
+    mocker.patch("app.utils.snyk_helper.get_project_inventory", return_value=inventory)
+    mocker.patch.dict("app.utils.snyk_helper.snyk_integration_ids_by_org", clear=True)
+    mocker.patch.object(common, "GITHUB_ENABLED", True)
+    mocker.patch.object(common, "GITHUB_ENTERPRISE_ENABLED", False)
+    mocker.patch.object(common.ARGS, "repo_name", None)
+    snyk_org = make_org([make_project("p2", "owner/zeta:package.json"),
+                         make_project("p1", "owner/alpha(dev):pom.xml")])
+
+    first = build_snyk_project_list([snyk_org], common.ARGS)
+    second = build_snyk_project_list([snyk_org], common.ARGS)
+
+    assert snyk_org.projects.all.call_count == 1
+    assert first == second
+    assert [p["repo_full_name"] for p in second] == ["owner/alpha", "owner/zeta"]
+    assert second[0]["branch_from_name"] == "dev"
+    assert second[0]["manifest"] == "pom.xml"
+    assert second[0]["integration_id"] == "gh-integration"
@@ -0,0 +1,65 @@
+"""test suite for app/utils/project_name.py"""
+import random
+import string
+import pytest
+from app.utils.project_name import (
+    ProjectName,
+    parse_project_name,
+    parse_repo_prefix,
+    split_project_name
+)
+
+REPO_CHARS = string.ascii_letters + string.digits + "-_."
+# git refs can't contain colons, but can contain parentheses and slashes
+BRANCH_CHARS = REPO_CHARS + "/()"
+PATH_CHARS = REPO_CHARS + "/():"
+
+
+def random_text(rng, chars, min_length=1, max_length=12):
+    return "".join(rng.choice(chars) for _ in range(rng.randint(min_length, max_length)))
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("snyk/goof:package.json", ProjectName("snyk/goof", "snyk", "goof", "", "package.json")),
+    ("snyk/goof(master):pom.xml", ProjectName("snyk/goof", "snyk", "goof", "master", "pom.xml")),
+    ("snyk/goof(feature/x):src/a:b/Dockerfile",
+     ProjectName("snyk/goof", "snyk", "goof", "feature/x", "src/a:b/Dockerfile")),
+    ("snyk/goof(fix(1)):go.mod", ProjectName("snyk/goof", "snyk", "goof", "fix(1)", "go.mod")),
+    ("snyk/goof(main)", ProjectName("snyk/goof", "snyk", "goof", "main", "snyk/goof(main)")),
+    ("snyk/goof", ProjectName("snyk/goof", "snyk", "goof", "", "snyk/goof")),
+])
+def test_parse_project_name(name, expected):
+    assert parse_project_name(name) == expected
+    assert parse_project_name(name).repo_full_name == "snyk/goof"
+    assert split_project_name(name) == (tuple(expected[:4]), expected.manifest)
+
+
+@pytest.mark.parametrize("name", ["goof:package.json", "a/b/c:package.json", "", ":x"])
+def test_names_without_a_repo_are_rejected(name):
+    assert parse_project_name(name) is None
+    assert split_project_name(name) is None
+
+
+def test_parse_round_trips_random_names():
+    """ any owner/repo(branch):path built from valid parts parses back into those parts """
+    rng = random.Random(1234)
+    for _ in range(5000):
+        owner = random_text(rng, REPO_CHARS)
+        repo = random_text(rng, REPO_CHARS)
+        branch = random_text(rng, BRANCH_CHARS) if rng.random() < 0.5 else ""
+        manifest = random_text(rng, PATH_CHARS, max_length=30)
+        name = f"{owner}/{repo}" + (f"({branch})" if branch else "") + f":{manifest}"
+
+        expected = ProjectName(f"{owner}/{repo}", owner, repo, branch, manifest)
+        assert parse_project_name(name) == expected, name
+
+
+def test_repo_prefixes_are_cached():
+    parse_repo_prefix.cache_clear()
+    parts = [split_project_name(f"snyk/cached(main):{manifest}")
+             for manifest in ("package.json", "pom.xml", "go.mod")]
+
+    cache_info = parse_repo_prefix.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 2)
+    # the names of a repo share its parts
+    assert parts[0][0] is parts[1][0] is parts[2][0]
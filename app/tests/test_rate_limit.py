@@ -0,0 +1,148 @@
+"""test suite for app/utils/rate_limit.py"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+import requests
+from app.utils.rate_limit import GithubRequestScheduler, RateLimitedAdapter
+
+KEY = ("api.github.com", "token", "core")
+
+
+class FakeClock():
+    """ clock that only moves when slept on """
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse():
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+
+def make_scheduler(clock):
+    return GithubRequestScheduler(pace_below=0.1, clock=clock.time, sleep=clock.sleep)
+
+
+def rate_limit_headers(remaining, reset, limit=5000):
+    return {"X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset)}
+
+
+def test_no_wait_while_budget_is_plentiful():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.update(KEY, FakeResponse(headers=rate_limit_headers(4000, 4600)))
+
+    for _ in range(100):
+        scheduler.acquire(KEY)
+
+    assert clock.sleeps == []
+
+
+def test_low_budget_is_spread_until_reset():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    # 100 requests left for the next 1000 seconds
+    scheduler.update(KEY, FakeResponse(headers=rate_limit_headers(100, 2000)))
+
+    for _ in range(5):
+        scheduler.acquire(KEY)
+
+    assert clock.sleeps[0] == pytest.approx(10.0)
+    assert all(delay == pytest.approx(10.0, rel=0.05) for delay in clock.sleeps)
+
+
+def test_exhausted_budget_waits_for_reset():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.update(KEY, FakeResponse(headers=rate_limit_headers(0, 1300)))
+
+    scheduler.acquire(KEY)
+
+    assert clock.sleeps == [301]
+
+
+def test_budgets_are_tracked_per_token_and_host():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.update(KEY, FakeResponse(headers=rate_limit_headers(0, 1300)))
+
+    scheduler.acquire(("api.github.com", "other-token", "core"))
+    scheduler.acquire(("ghe.example.com", "token", "core"))
+    scheduler.acquire(("api.github.com", "token", "graphql"))
+
+    assert clock.sleeps == []
+
+
+def test_budget_key_ignores_the_auth_scheme():
+    def make_request(authorization):
+        return requests.Request("GET", "https://api.github.com/repos/owner/repo",
+                                headers={"Authorization": authorization}).prepare()
+
+    key = GithubRequestScheduler.budget_key(make_request("token secret"))
+
+    assert GithubRequestScheduler.budget_key(make_request("Bearer secret")) == key
+    assert GithubRequestScheduler.budget_key(make_request("Bearer other")) != key
+
+
+def test_retry_delay():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+
+    assert scheduler.retry_delay(FakeResponse(200)) is None
+    assert scheduler.retry_delay(FakeResponse(403)) is None
+    assert scheduler.retry_delay(FakeResponse(429, {"Retry-After": "7"})) == 7
+    assert scheduler.retry_delay(
+        FakeResponse(403, rate_limit_headers(0, 1060))) == 61
+
+
+class StubLimitedHandler(BaseHTTPRequestHandler):
+    """ answers the first request with a secondary rate limit, then 200 """
+    status_codes = []
+
+    def do_GET(self):
+        if not StubLimitedHandler.status_codes:
+            StubLimitedHandler.status_codes.append(403)
+            self.send_response(403)
+            self.send_header("Retry-After", "3")
+        else:
+            StubLimitedHandler.status_codes.append(200)
+            self.send_response(200)
+            for (header, value) in rate_limit_headers(4999, 4600).items():
+                self.send_header(header, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def test_adapter_retries_after_retry_after():
+    server = HTTPServer(("127.0.0.1", 0), StubLimitedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubLimitedHandler.status_codes = []
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    session = requests.Session()
+    session.mount("http://", RateLimitedAdapter(scheduler=scheduler))
+
+    try:
+        response = session.get(f"http://127.0.0.1:{server.server_port}/repos/owner/repo")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert response.status_code == 200
+    assert StubLimitedHandler.status_codes == [403, 200]
+    assert clock.sleeps == [3]
@@ -0,0 +1,69 @@
+"""test suite for app/utils/results_sink.py"""
+import json
+import threading
+from app.utils.results_sink import ResultsSink, result_file_path
+
+
+def read_lines(path):
+    with open(path, "r") as fp:
+        return fp.read().splitlines()
+
+
+def test_rows_are_quoted_and_headed(tmp_path):
+    prefix = str(tmp_path / "run")
+    sink = ResultsSink(prefix)
+
+    sink.write("potential_repo_delete", "Org, Inc.", "owner/repo")
+    sink.write("completed_project_import", "org", 'owner/repo:path/"odd".json', True)
+    sink.flush()
+
+    assert read_lines(result_file_path("potential_repo_delete", prefix)) == [
+        "org,repo", '"Org, Inc.",owner/repo']
+    assert read_lines(result_file_path("completed_project_import", prefix)) == [
+        "org,project,success", 'org,"owner/repo:path/""odd"".json",True']
+    # files without rows still get their header
+    assert read_lines(result_file_path("repo_skipped_on_error", prefix)) == ["org,repo,status"]
+    sink.close()
+
+
+def test_rows_from_threads_do_not_interleave(tmp_path):
+    prefix = str(tmp_path / "run")
+    sink = ResultsSink(prefix, batch_size=7)
+
+    def write_rows(thread_num):
+        for i in range(500):
+            sink.write("stale_manifest_deleted", f"org-{thread_num}", f"owner/repo:{i}" * 20)
+    threads = [threading.Thread(target=write_rows, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.close()
+
+    rows = read_lines(result_file_path("stale_manifest_deleted", prefix))[1:]
+    assert len(rows) == 8 * 500
+    assert all(row.count(",") == 1 for row in rows)
+
+
+def test_jsonl_stream_and_append(tmp_path):
+    prefix = str(tmp_path / "run")
+    jsonl_path = str(tmp_path / "results.jsonl")
+    sink = ResultsSink(prefix, jsonl_path)
+    sink.write("project_operation_error", "org", "owner/repo:package.json", "p1",
+               "delete", "error")
+    sink.close()
+
+    # a resumed run keeps the rows already written
+    sink = ResultsSink(prefix, jsonl_path, append=True)
+    sink.write("potential_repo_delete", "org", "owner/repo")
+    sink.sync()
+    sink.close()
+
+    assert [json.loads(line) for line in read_lines(jsonl_path)] == [
+        {"type": "project_operation_error", "org": "org",
+         "project_name": "owner/repo:package.json", "project_id": "p1",
+         "action": "delete", "status": "error"},
+        {"type": "potential_repo_delete", "org": "org", "repo": "owner/repo"},
+    ]
+    assert read_lines(result_file_path("potential_repo_delete", prefix)) == [
+        "org,repo", "org,owner/repo"]
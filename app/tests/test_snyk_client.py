@@ -0,0 +1,103 @@
+"""test suite for app/utils/snyk_client.py and the token bucket it uses"""
+import pytest
+import requests
+from snyk.errors import SnykHTTPError
+from app.utils.rate_limit import TokenBucket
+from app.utils.snyk_client import ThrottledSnykClient
+
+
+class FakeClock():
+    """ monotonic clock that only moves when slept on """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b"{}"  # pylint: disable=protected-access
+    return response
+
+
+class FakeMethod():
+    """ stands in for requests.get/post, answering with the given status codes """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def make_client(clock, requests_per_second=0):
+    client = ThrottledSnykClient("token", requests_per_second=requests_per_second,
+                                 max_retries=3, retry_base_delay=2, sleep=clock.sleep)
+    client.bucket.clock = clock.time
+    return client
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(5, capacity=5, clock=clock.time, sleep=clock.sleep)
+
+    for _ in range(10):
+        bucket.acquire()
+
+    # the first 5 calls use the burst, the next 5 are spaced 1/5s apart
+    assert clock.sleeps == [pytest.approx(0.2)] * 5
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_client_retries_server_errors_with_backoff():
+    clock = FakeClock()
+    client = make_client(clock)
+    method = FakeMethod(make_response(502), make_response(504), make_response(200))
+
+    response = client.request(method, "https://api.snyk.io/v1/org", headers={})
+
+    assert response.status_code == 200
+    assert method.calls == 3
+    # backoff of 2s then 4s, each with up to half of it jittered away
+    assert 1 <= clock.sleeps[0] <= 2
+    assert 2 <= clock.sleeps[1] <= 4
+
+
+def test_client_honours_retry_after():
+    clock = FakeClock()
+    client = make_client(clock)
+    method = FakeMethod(make_response(429, {"Retry-After": "7"}), make_response(200))
+
+    client.request(method, "https://api.snyk.io/v1/org", headers={})
+
+    assert clock.sleeps == [7]
+
+
+def test_client_raises_once_retries_are_exhausted():
+    clock = FakeClock()
+    client = make_client(clock)
+    method = FakeMethod(*[make_response(503) for _ in range(4)])
+
+    with pytest.raises(SnykHTTPError):
+        client.request(method, "https://api.snyk.io/v1/org", headers={})
+    assert method.calls == 4
+
+
+def test_client_does_not_retry_client_errors():
+    clock = FakeClock()
+    client = make_client(clock)
+    method = FakeMethod(make_response(404))
+
+    with pytest.raises(SnykHTTPError):
+        client.request(method, "https://api.snyk.io/v1/org", headers={})
+    assert method.calls == 1
+    assert clock.sleeps == []
@@ -3,22 +3,30 @@ import os
 import pytest
 import random
 import string
+import threading
 import snyk
 from snyk.models import Organization
 from snyk.models import Project
 import common
 from app.snyk_repo import SnykRepo
-from app.models import GithubRepoStatus
+from app.models import GithubRepoStatus, RefreshError, SnykProject
 from _version import __version__
 
 from app.gh_repo import (
     get_gh_repo_status,
     passes_manifest_filter,
 )
+from app.utils.results_sink import get_results_sink
 from app.utils.snyk_helper import (
     get_snyk_projects_for_repo,
+    parse_snyk_project,
     get_snyk_repos_from_snyk_projects,
-    import_manifests
+    import_manifests,
+    delete_snyk_project,
+    deactivate_snyk_project,
+    build_snyk_project_list,
+    get_snyk_repos_from_snyk_orgs,
+    iter_snyk_repos_by_org
 )
 
 USER_AGENT = f"pysnyk/snyk_services/snyk_scm_refresh/{__version__}"
@@ -45,7 +53,7 @@ def test_get_gh_repo_status_github(mocker, status_code, response_message, repo,
 
     # TODO: assumes a successful redirect for the 301 case
     mocker.patch(
-        "requests.get", side_effect=[MockResponse(status_code), MockResponse(200)]
+        "requests.Session.get", side_effect=[MockResponse(status_code), MockResponse(200)]
     )
     mocker.patch.dict(os.environ, {'GITHUB_ENTERPRISE_TOKEN': '1234', 'GITHUB_ENTERPRISE_HOST':common.GITHUB_CLOUD_API_HOST})
 
@@ -84,7 +92,7 @@ def test_get_gh_repo_status_github_enterprise_cloud(mocker, status_code, respons
 
     # TODO: assumes a successful redirect for the 301 case
     mocker.patch(
-        "requests.get", side_effect=[MockResponse(status_code), MockResponse(200)]
+        "requests.Session.get", side_effect=[MockResponse(status_code), MockResponse(200)]
     )
     mocker.patch.dict(os.environ, {'GITHUB_ENTERPRISE_TOKEN': '1234', 'GITHUB_ENTERPRISE_HOST':common.GITHUB_CLOUD_API_HOST})
 
@@ -114,7 +122,7 @@ def test_get_gh_repo_status_github_enterprise_cloud(mocker, status_code, respons
 def test_get_gh_repo_status_unauthorized(mocker):
     """ test handling unauthorized token """
     mocker.patch(
-        "requests.get", side_effect=[MockResponse(401)]
+        "requests.Session.get", side_effect=[MockResponse(401)]
     )
 
     mocker.patch.dict(os.environ, {'GITHUB_TOKEN': 'test_token'})
@@ -193,6 +201,36 @@ def test_get_snyk_repos_from_snyk_projects():
 
     assert str(get_snyk_repos_from_snyk_projects(snyk_gh_projects)) == str(snyk_repos_from_snyk_projects)
 
+def test_get_snyk_repos_from_snyk_projects_groups_by_org():
+    """ test the same repo name in two orgs gives two repos, each with its own projects """
+
+    def project(project_id, org_id, repo_full_name):
+        return {
+            "id": project_id,
+            "name": f"{repo_full_name}:package.json",
+            "repo_full_name": repo_full_name,
+            "manifest": "package.json",
+            "org_id": org_id,
+            "org_name": f"name-{org_id}",
+            "origin": "github",
+            "integration_id": f"integration-{org_id}",
+            "branch": "master",
+        }
+
+    snyk_gh_projects = [
+        project("1", "org-a", "owner/repo-1"),
+        project("2", "org-b", "owner/repo-1"),
+        project("3", "org-a", "owner/repo-1"),
+        project("4", "org-a", "owner/repo-2"),
+    ]
+
+    snyk_repos = get_snyk_repos_from_snyk_projects(snyk_gh_projects)
+
+    assert [(r.org_id, r.full_name) for r in snyk_repos] == [
+        ("org-a", "owner/repo-1"), ("org-b", "owner/repo-1"), ("org-a", "owner/repo-2")]
+    assert [[p["id"] for p in r.snyk_projects] for r in snyk_repos] == [["1", "3"], ["2"], ["4"]]
+    assert snyk_repos[1].integration_id == "integration-org-b"
+
 def test_get_snyk_project_for_repo():
     """ test collecting projects for a repo """
 
@@ -253,6 +291,9 @@ def test_get_snyk_project_for_repo():
         )
     ]
 
+    snyk_org = Organization(name="My Other Org", id="a04d9cbd-ae6e-44af-b573-0556b0ad4bd2",
+                            slug="my-other-org", url="https://snyk.io/org/my-other-org")
+    snyk_projects = [parse_snyk_project(project, snyk_org) for project in snyk_projects]
     snyk_projects_filtered = [snyk_projects[0],snyk_projects[1]]
 
     assert get_snyk_projects_for_repo(snyk_projects, \
@@ -384,7 +425,181 @@ def test_import_manifest_exceeds_limit(mocker):
         import_manifests(org_id, repo_full_name, integration_id, files)
 
     # assert csv contains header and a skipped manifest file path
-    common.MANIFESTS_SKIPPED_ON_LIMIT_FILE.close()
+    get_results_sink().flush()
     with open("snyk-scm-refresh_manifests-skipped-on-limit.csv", 'r') as fp:
         num_lines = len(fp.readlines())
     assert num_lines == 2
+
+def test_project_mutations_use_cached_org(mocker):
+    """ mutations on a known org are a single API call, without loading orgs or projects """
+    org = Organization(name="My Other Org", id="12345", slug="myotherorg",
+                       url="https://snyk.io/api/v1/org/12345")
+    org.client = mocker.MagicMock()
+    mocker.patch.dict("app.utils.snyk_helper.snyk_orgs_by_id", {"12345": org})
+    orgs_get = mocker.patch("snyk.managers.OrganizationManager.get")
+
+    assert delete_snyk_project("67890", "12345") is True
+    assert deactivate_snyk_project("67890", "12345") is True
+
+    org.client.delete.assert_called_once_with("org/12345/project/67890")
+    org.client.post.assert_called_once_with("org/12345/project/67890/deactivate", {})
+    orgs_get.assert_not_called()
+
+def test_project_mutation_not_found(mocker):
+    """ a missing project is reported and skipped """
+    response = mocker.MagicMock(status_code=404)
+    response.json.return_value = {"code": 404, "message": "Project not found"}
+    org = Organization(name="My Other Org", id="12345", slug="myotherorg",
+                       url="https://snyk.io/api/v1/org/12345")
+    org.client = mocker.MagicMock()
+    org.client.delete.side_effect = snyk.errors.SnykHTTPError(response)
+    mocker.patch.dict("app.utils.snyk_helper.snyk_orgs_by_id", {"12345": org})
+
+    assert delete_snyk_project("67890", "12345") is False
+
+def make_org_with_projects(mocker, org_id, repo_names, on_fetch=None):
+    """ an org whose projects.all() returns one package.json project per repo """
+    snyk_org = mocker.MagicMock()
+    snyk_org.id = org_id
+    snyk_org.name = f"org {org_id}"
+    snyk_org.integrations.filter.return_value = [mocker.MagicMock(id=f"{org_id}-integration")]
+    projects = []
+    for repo_name in repo_names:
+        project = mocker.MagicMock(origin="github", type="npm", branch="main", isMonitored=True)
+        project.id = f"{org_id}-{repo_name}"
+        project.name = f"owner/{repo_name}:package.json"
+        projects.append(project)
+
+    def all_projects():
+        if on_fetch:
+            on_fetch()
+        return projects
+    snyk_org.projects.all.side_effect = all_projects
+    return snyk_org
+
+@pytest.fixture
+def org_fetch_args(mocker):
+    mocker.patch("app.utils.snyk_helper.get_project_inventory", return_value=None)
+    mocker.patch.dict("app.utils.snyk_helper.snyk_integration_ids_by_org", clear=True)
+    mocker.patch.object(common, "GITHUB_ENABLED", True)
+    mocker.patch.object(common, "GITHUB_ENTERPRISE_ENABLED", False)
+    mocker.patch.object(common.ARGS, "repo_name", None)
+    mocker.patch.object(common.ARGS, "org_workers", 3)
+    return common.ARGS
+
+def test_build_snyk_project_list_fetches_orgs_concurrently(mocker, org_fetch_args):
+    """ every org is fetched at the same time, the result is sorted as before """
+    # a serial fetch would break the barrier
+    barrier = threading.Barrier(3, timeout=5)
+    snyk_orgs = [make_org_with_projects(mocker, "o1", ["zeta", "beta"], barrier.wait),
+                 make_org_with_projects(mocker, "o2", ["alpha"], barrier.wait),
+                 make_org_with_projects(mocker, "o3", ["gamma"], barrier.wait)]
+
+    snyk_projects = build_snyk_project_list(snyk_orgs, org_fetch_args)
+
+    assert [p["repo_full_name"] for p in snyk_projects] == \
+        ["owner/alpha", "owner/beta", "owner/gamma", "owner/zeta"]
+    assert [p["integration_id"] for p in snyk_projects] == \
+        ["o2-integration", "o1-integration", "o3-integration", "o1-integration"]
+
+    build_snyk_project_list(snyk_orgs, org_fetch_args)
+    # integration ids are looked up once per org
+    assert snyk_orgs[0].integrations.filter.call_count == 1
+
+def test_build_snyk_project_list_skips_org_on_timeout(mocker, org_fetch_args):
+    """ an org that takes too long is skipped, the other orgs are kept """
+    mocker.patch.object(common, "SNYK_ORG_FETCH_TIMEOUT", 0.2)
+    release = threading.Event()
+    snyk_orgs = [make_org_with_projects(mocker, "o1", ["slow"], lambda: release.wait(5)),
+                 make_org_with_projects(mocker, "o2", ["fast"])]
+
+    try:
+        snyk_projects = build_snyk_project_list(snyk_orgs, org_fetch_args)
+    finally:
+        release.set()
+
+    assert [p["repo_full_name"] for p in snyk_projects] == ["owner/fast"]
+
+def test_unreadable_integration_raises_instead_of_exiting(mocker, org_fetch_args):
+    """ an embedding program gets an exception it can handle, not a SystemExit """
+    snyk_orgs = [make_org_with_projects(mocker, "o1", ["repo"])]
+    snyk_orgs[0].integrations.filter.side_effect = snyk.errors.SnykHTTPError(MockResponse(403))
+
+    with pytest.raises(RefreshError, match="Unable to retrieve GitHub integration id"):
+        build_snyk_project_list(snyk_orgs, org_fetch_args)
+
+def test_repos_stream_org_by_org(mocker, org_fetch_args):
+    """ an org's repos are yielded before the orgs after the next one are fetched """
+    mocker.patch.object(org_fetch_args, "org_workers", 1)
+    snyk_orgs = [make_org_with_projects(mocker, "o1", ["zeta", "beta", "zeta"]),
+                 make_org_with_projects(mocker, "o2", ["alpha"]),
+                 make_org_with_projects(mocker, "o3", ["beta"])]
+
+    snyk_repos_by_org = iter_snyk_repos_by_org(snyk_orgs, org_fetch_args)
+    first_org_repos = next(snyk_repos_by_org)
+
+    assert [r.full_name for r in first_org_repos] == ["owner/beta", "owner/zeta"]
+    assert len(first_org_repos[1].snyk_projects) == 2
+    assert snyk_orgs[2].projects.all.call_count == 0
+    assert [[r.full_name for r in repos] for repos in snyk_repos_by_org] == \
+        [["owner/alpha"], ["owner/beta"]]
+
+def test_merged_repos_match_global_project_order(mocker, org_fetch_args):
+    """ the k-way merge orders repos like grouping the globally sorted project list """
+    snyk_orgs = [make_org_with_projects(mocker, "o1", ["zeta", "beta"]),
+                 make_org_with_projects(mocker, "o2", ["alpha", "beta"]),
+                 make_org_with_projects(mocker, "o3", ["gamma"])]
+
+    merged = get_snyk_repos_from_snyk_orgs(snyk_orgs, org_fetch_args)
+    grouped = get_snyk_repos_from_snyk_projects(build_snyk_project_list(snyk_orgs, org_fetch_args))
+
+    assert [(r.org_id, r.full_name) for r in merged] == \
+        [(r.org_id, r.full_name) for r in grouped] == \
+        [("o2", "owner/alpha"), ("o1", "owner/beta"), ("o2", "owner/beta"),
+         ("o3", "owner/gamma"), ("o1", "owner/zeta")]
+
+def test_snyk_project_record_acts_like_a_dict():
+    """ project records support the dict access used by callers, and share repeated values """
+    fields = {"id": "p1", "name": "owner/repo:package.json", "repo_full_name": "owner/repo",
+              "repo_owner": "owner", "repo_name": "repo", "manifest": "package.json",
+              "org_id": "o1", "org_name": "org", "origin": "github", "type": "npm",
+              "integration_id": "", "branch_from_name": "", "branch": "main",
+              "is_monitored": True}
+    first = SnykProject(**fields)
+    second = SnykProject(**dict(fields, id="p2", org_id="".join(["o", "1"])))
+
+    assert first["manifest"] == first.manifest == "package.json"
+    assert first.get("missing", "default") == "default"
+    first["integration_id"] = "12345"
+    assert first.to_dict() == dict(fields, integration_id="12345")
+    assert first == dict(fields, integration_id="12345")
+    assert second["org_id"] is first["org_id"]
+    with pytest.raises(KeyError):
+        first["missing"] = "value"
+
+def test_renamed_repo_queues_old_projects_for_delete(mocker):
+    """ a 301 imports the repo under its new name, queueing copies of the old projects """
+    from app.app import process_repo
+    from app.models import ImportStatus
+
+    record = SnykProject(
+        id="p1", name="owner/old:package.json", repo_full_name="owner/old",
+        repo_owner="owner", repo_name="old", manifest="package.json", org_id="o1",
+        org_name="org", origin="github", type="npm", integration_id="i1",
+        branch_from_name="", branch="main", is_monitored=True)
+    snyk_repo = SnykRepo("owner/old", "o1", "org", "i1", "github", "main", [record])
+    gh_repo_status = GithubRepoStatus(301, "moved permanently", "new", "o1", "owner",
+                                      "owner/new", "main", False)
+    import_status = ImportStatus("job-1", "https://api.snyk.io/v1/org/o1/integrations/i1/"
+                                 "import/job-1", "o1", "org", "owner", "new", [], [])
+    import_manifests = mocker.patch("app.app.import_manifests", return_value=import_status)
+    mocker.patch.object(common.ARGS, "dry_run", False)
+    mocker.patch.object(common.ARGS, "checkpoint", None)
+
+    assert process_repo(snyk_repo, 0, 1, gh_repo_status) == [import_status]
+
+    import_manifests.assert_called_once_with("o1", "owner/new", "i1")
+    assert import_status.pending_project_deletes == [
+        dict(record.to_dict(), pending_repo="owner/new")]
+    assert snyk_repo.get_projects() == [record]
+    assert "pending_repo" not in record.to_dict()
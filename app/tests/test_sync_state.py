@@ -0,0 +1,141 @@
+"""test suite for app/utils/sync_state.py"""
+import sqlite3
+import pytest
+import common
+from app.app import process_repo
+from app.models import GithubRepoStatus, ImportStatus, ProjectOperationResult
+from app.snyk_repo import SnykRepo
+from app.utils.bulk_executor import OPERATION_ERROR
+from app.utils.import_poller import ImportStatusPoller
+from app.utils.sync_state import (
+    SyncState,
+    get_filter_key,
+    get_sync_state,
+    is_repo_unchanged_since_sync,
+    record_repo_sync
+)
+
+
+def make_status(pushed_at="2023-01-01T00:00:00Z", default_branch="main", archived=False):
+    return GithubRepoStatus(200, "Match", "repo", "o", "owner", "owner/repo",
+                            default_branch, archived, pushed_at, "2023-01-02T00:00:00Z")
+
+
+def test_unchanged_only_when_push_branch_archive_and_filter_match(tmp_path):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    assert not sync_state.is_unchanged("o", "owner/repo", make_status(), "filter")
+
+    sync_state.put("o", "owner/repo", make_status(), "filter")
+
+    assert sync_state.is_unchanged("o", "owner/repo", make_status(), "filter")
+    assert not sync_state.is_unchanged("o", "owner/repo",
+                                       make_status(pushed_at="2023-02-01T00:00:00Z"), "filter")
+    assert not sync_state.is_unchanged("o", "owner/repo",
+                                       make_status(default_branch="develop"), "filter")
+    assert not sync_state.is_unchanged("o", "owner/repo", make_status(archived=True), "filter")
+    assert not sync_state.is_unchanged("o", "owner/repo", make_status(), "other-filter")
+    assert not sync_state.is_unchanged("o2", "owner/repo", make_status(), "filter")
+    # without a push date nothing can be skipped
+    assert not sync_state.is_unchanged("o", "owner/repo", make_status(pushed_at=""), "filter")
+
+
+def test_full_forces_the_manifest_checks(tmp_path, mocker):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    mocker.patch("app.utils.sync_state.get_sync_state", return_value=sync_state)
+    mocker.patch.object(common.ARGS, "dry_run", False)
+    snyk_repo = SnykRepo("owner/repo", "o", "org", "12345", "github", "main", [])
+
+    record_repo_sync(snyk_repo, make_status())
+    assert is_repo_unchanged_since_sync(snyk_repo, make_status())
+
+    mocker.patch.object(common.ARGS, "full", True)
+    assert not is_repo_unchanged_since_sync(snyk_repo, make_status())
+
+
+def test_dry_run_does_not_record(tmp_path, mocker):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    mocker.patch("app.utils.sync_state.get_sync_state", return_value=sync_state)
+    mocker.patch.object(common.ARGS, "dry_run", True)
+    snyk_repo = SnykRepo("owner/repo", "o", "org", "12345", "github", "main", [])
+
+    record_repo_sync(snyk_repo, make_status())
+
+    assert sync_state.get("o", "owner/repo") is None
+
+
+def test_import_jobs_record_the_sync_only_when_they_succeed(tmp_path, mocker):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    mocker.patch("app.utils.sync_state.get_sync_state", return_value=sync_state)
+    mocker.patch.object(common.ARGS, "dry_run", False)
+    statuses = {"ok": "complete", "failed": "failed"}
+    poller = ImportStatusPoller(
+        lambda url, org_id: {"status": statuses[url.rsplit("/", 1)[1]], "logs": []},
+        mocker.Mock(), min_interval=0.01, timeout=5)
+
+    for (job_id, repo_name) in (("ok", "repo-ok"), ("failed", "repo-failed")):
+        poller.submit(ImportStatus(job_id, f"https://api.snyk.io/v1/org/o/import/{job_id}",
+                                   "o", "org", "owner", repo_name, [], [],
+                                   repo_sync=make_status()))
+    poller.wait()
+
+    assert sync_state.is_unchanged("o", "owner/repo-ok", make_status(), get_filter_key())
+    assert sync_state.get("o", "owner/repo-failed") is None
+
+
+def test_failed_stale_deletes_leave_the_repo_unsynced(tmp_path, mocker):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    mocker.patch("app.utils.sync_state.get_sync_state", return_value=sync_state)
+    mocker.patch.object(common.ARGS, "dry_run", False)
+    mocker.patch.object(common.ARGS, "checkpoint", None)
+    mocker.patch.object(common.ARGS, "full", True)
+    snyk_repo = SnykRepo("owner/repo", "o", "org", "12345", "github", "main",
+                         [{"id": "p1", "name": "owner/repo:package.json", "type": "npm",
+                           "manifest": "package.json", "org_id": "o", "org_name": "org"}])
+    mocker.patch("app.snyk_repo.get_repo_manifests", return_value=[])
+    mocker.patch("app.snyk_repo.run_project_operations", return_value=[
+        ProjectOperationResult("delete", snyk_repo.snyk_projects[0], OPERATION_ERROR, "boom")])
+
+    process_repo(snyk_repo, 0, 1, make_status())
+
+    assert snyk_repo.failed_operations == 1
+    assert sync_state.get("o", "owner/repo") is None
+
+
+def test_shared_store_closes_the_previous_path(tmp_path, mocker):
+    first_path = str(tmp_path / "first.sqlite")
+    second_path = str(tmp_path / "second.sqlite")
+    mocker.patch.object(common.ARGS, "sync_state_path", first_path)
+    first = get_sync_state()
+    assert get_sync_state() is first
+
+    mocker.patch.object(common.ARGS, "sync_state_path", second_path)
+    second = get_sync_state()
+
+    assert second is not first and second.path == second_path
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.get("o", "owner/repo")
+
+
+def test_imports_over_the_limit_leave_the_repo_unsynced(tmp_path, mocker):
+    sync_state = SyncState(str(tmp_path / "sync-state.sqlite"))
+    mocker.patch("app.utils.sync_state.get_sync_state", return_value=sync_state)
+    mocker.patch.object(common.ARGS, "dry_run", False)
+    mocker.patch.object(common.ARGS, "checkpoint", None)
+    mocker.patch.object(common.ARGS, "full", True)
+    mocker.patch.object(common, "MAX_IMPORT_MANIFEST_PROJECTS", 2)
+    org = mocker.MagicMock(id="o")
+    org.name = "org"
+    org.client.post.return_value.headers = {
+        "Location": "https://snyk.io/api/v1/org/o/integrations/12345/import/job-1"}
+    mocker.patch("app.utils.snyk_helper.get_snyk_org", return_value=org)
+    mocker.patch("app.utils.snyk_helper.write_result")
+    snyk_repo = SnykRepo("owner/repo", "o", "org", "12345", "github", "main", [])
+    mocker.patch("app.snyk_repo.get_repo_manifests",
+                 return_value=["a/package.json", "b/package.json", "c/package.json"])
+
+    (import_status,) = process_repo(snyk_repo, 0, 1, make_status())
+
+    assert [file["path"] for file in import_status.files] == ["a/package.json", "b/package.json"]
+    assert import_status.truncated
+    assert import_status.repo_sync is None
+    assert sync_state.get("o", "owner/repo") is None
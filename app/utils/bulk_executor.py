@@ -0,0 +1,82 @@
+"""
+run delete/activate/deactivate operations on many
+snyk projects concurrently, rate limited per org
+"""
+import threading
+from functools import partial
+from typing import Callable, Iterable, List, Mapping, Tuple
+import requests
+import snyk.errors
+import common
+from app.models import ProjectOperationResult
+from app.utils.concurrency import map_ordered
+from app.utils.metrics import get_metrics
+from app.utils.rate_limit import TokenBucket
+from app.utils.results_sink import write_result
+
+OPERATION_SUCCESS = "success"
+OPERATION_NOT_FOUND = "not_found"
+OPERATION_ERROR = "error"
+
+# pylint: disable=invalid-name
+_org_buckets = {}
+_org_buckets_lock = threading.Lock()
+
+def get_org_bucket(org_id):
+    """ token bucket limiting the mutation rate for one org """
+    with _org_buckets_lock:
+        if org_id not in _org_buckets:
+            _org_buckets[org_id] = TokenBucket(common.SNYK_ORG_REQUESTS_PER_SECOND)
+        return _org_buckets[org_id]
+
+def run_project_operation(operation, action_functions) -> ProjectOperationResult:
+    """ apply one (action, project) operation and report how it went """
+    result = apply_project_operation(operation, action_functions)
+    get_metrics().inc("project_operations_total", action=result.action, status=result.status)
+    return result
+
+def apply_project_operation(operation, action_functions) -> ProjectOperationResult:
+    """
+    apply one (action, project) operation with action_functions[action],
+    called as action_function(project_id, org_id)
+    """
+    (action, project) = operation
+    action_function = action_functions[action]
+
+    get_org_bucket(project["org_id"]).acquire()
+    try:
+        applied = action_function(project["id"], project["org_id"])
+    except snyk.errors.SnykNotFoundError:
+        return ProjectOperationResult(action, project, OPERATION_NOT_FOUND)
+    except (snyk.errors.SnykError, requests.exceptions.RequestException) as err:
+        message = getattr(err, "message", None) or str(err)
+        print(f"    - Failed to {action} project {project['id']}"
+              f" in org {project['org_id']}: {message}")
+        return ProjectOperationResult(action, project, OPERATION_ERROR, str(message))
+
+    if applied is False:
+        return ProjectOperationResult(action, project, OPERATION_NOT_FOUND)
+    return ProjectOperationResult(action, project, OPERATION_SUCCESS)
+
+def run_project_operations(operations: Iterable[Tuple[str, dict]],
+                           action_functions: Mapping[str, Callable],
+                           workers=None) -> List[ProjectOperationResult]:
+    """
+    apply (action, project) operations with the function action_functions maps
+    the action to, with up to `workers` (--mutation-workers) in flight,
+    returning one result per operation in input order
+    """
+    if workers is None:
+        workers = common.ARGS.mutation_workers
+    results = list(map_ordered(partial(run_project_operation,
+                                       action_functions=action_functions),
+                               operations, workers))
+    for result in results:
+        if not result.succeeded:
+            log_project_operation_failure(result)
+    return results
+
+def log_project_operation_failure(result: ProjectOperationResult):
+    """ log an operation that was not applied """
+    write_result("project_operation_error", result.project['org_name'],
+                 result.project['name'], result.project['id'], result.action, result.status)
@@ -0,0 +1,134 @@
+"""
+checkpoint of a run's progress, so an interrupted run can
+skip the repos it finished and resume polling its import jobs
+"""
+import dataclasses
+import json
+import time
+import common
+from app.models import GithubRepoStatus, ImportStatus, SnykProject
+from app.utils.sqlite_store import SqliteStore
+
+# phases a repo goes through, in order. a repo is complete once its imports
+# were submitted: the jobs themselves are resumed from the import_jobs table
+REPO_PHASE_STATUS = "status"
+REPO_PHASE_STALE_DELETE = "stale_delete"
+REPO_PHASE_IMPORT_SUBMITTED = "import_submitted"
+REPO_PHASE_IMPORT_FINISHED = "import_finished"
+REPO_COMPLETE_PHASES = (REPO_PHASE_IMPORT_SUBMITTED, REPO_PHASE_IMPORT_FINISHED)
+
+
+class Checkpoint(SqliteStore):
+    """ completed phase per (org, repo) and the import jobs not yet finished """
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS repo_phases (
+            org_id TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (org_id, repo)
+        )""",
+        """CREATE TABLE IF NOT EXISTS import_jobs (
+            import_job_id TEXT PRIMARY KEY,
+            org_id TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            import_status TEXT NOT NULL
+        )""",
+    )
+
+    def set_repo_phase(self, org_id, repo, phase):
+        """ record the last phase a repo completed """
+        self.execute(
+            "INSERT OR REPLACE INTO repo_phases (org_id, repo, phase, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (org_id, repo, phase, time.time()))
+
+    def get_repo_phase(self, org_id, repo):
+        """ the last phase a repo completed, None if it wasn't started """
+        rows = self.execute("SELECT phase FROM repo_phases WHERE org_id = ? AND repo = ?",
+                            (org_id, repo))
+        return rows[0][0] if rows else None
+
+    def completed_repos(self):
+        """ set of (org_id, repo) that don't need processing again """
+        rows = self.execute(
+            "SELECT org_id, repo FROM repo_phases WHERE phase IN (?, ?)", REPO_COMPLETE_PHASES)
+        return set(rows)
+
+    def complete_repo(self, org_id, repo, import_status_checks):
+        """ record a processed repo together with the import jobs it submitted """
+        phase = REPO_PHASE_IMPORT_SUBMITTED if import_status_checks \
+            else REPO_PHASE_IMPORT_FINISHED
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO import_jobs (import_job_id, org_id, repo, import_status) "
+                "VALUES (?, ?, ?, ?)",
+                [(check.import_job_id, org_id, repo, encode_import_status(check))
+                 for check in import_status_checks])
+            self._connection.execute(
+                "INSERT OR REPLACE INTO repo_phases (org_id, repo, phase, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (org_id, repo, phase, time.time()))
+
+    def finish_import(self, import_job_id):
+        """ forget a finished job, marking its repo finished once none of its jobs remain """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "SELECT org_id, repo FROM import_jobs WHERE import_job_id = ?",
+                (import_job_id,)).fetchall()
+            self._connection.execute("DELETE FROM import_jobs WHERE import_job_id = ?",
+                                     (import_job_id,))
+            for (org_id, repo) in rows:
+                remaining = self._connection.execute(
+                    "SELECT COUNT(*) FROM import_jobs WHERE org_id = ? AND repo = ?",
+                    (org_id, repo)).fetchone()[0]
+                if not remaining:
+                    self._connection.execute(
+                        "UPDATE repo_phases SET phase = ?, updated_at = ? "
+                        "WHERE org_id = ? AND repo = ?",
+                        (REPO_PHASE_IMPORT_FINISHED, time.time(), org_id, repo))
+
+    def pending_imports(self):
+        """ the import jobs submitted by an earlier run that haven't finished """
+        rows = self.execute("SELECT import_status FROM import_jobs ORDER BY rowid")
+        return [decode_import_status(import_status) for (import_status,) in rows]
+
+    def clear(self):
+        """ drop all progress, once a run finished """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM repo_phases")
+            self._connection.execute("DELETE FROM import_jobs")
+
+
+def encode_import_status(import_status):
+    """ json for an import job, with its project records as plain dicts """
+    return json.dumps(dataclasses.asdict(import_status), default=encode_record)
+
+
+def decode_import_status(encoded):
+    """ the import job stored by encode_import_status """
+    import_status = ImportStatus(**json.loads(encoded))
+    if import_status.repo_sync is not None:
+        import_status.repo_sync = GithubRepoStatus(**import_status.repo_sync)
+    return import_status
+
+
+def encode_record(value):
+    """ json.dumps fallback for the records held by an import job """
+    if isinstance(value, SnykProject):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def get_checkpoint():
+    """ the checkpoint given with --checkpoint, opened on first use. None if not set """
+    if not common.ARGS.checkpoint:
+        return None
+    return Checkpoint.shared(common.ARGS.checkpoint)
+
+
+def record_repo_phase(snyk_repo, phase):
+    """ record a repo's progress, if checkpointing is on """
+    checkpoint = get_checkpoint()
+    if checkpoint is not None:
+        checkpoint.set_repo_phase(snyk_repo.org_id, snyk_repo.full_name, phase)
@@ -0,0 +1,101 @@
+"""
+helpers for running per-repo work on a bounded thread pool
+while keeping console output in input order
+"""
+import io
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThreadOutputRouter(io.TextIOBase):
+    """
+    stdout replacement that sends writes from threads with an
+    active capture buffer into that buffer, and everything else
+    straight through to the real stream
+    """
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self._local = threading.local()
+
+    def start_capture(self):
+        """ start buffering output written by the current thread """
+        self._local.buffer = io.StringIO()
+
+    def stop_capture(self) -> str:
+        """ stop buffering for the current thread and return what was written """
+        buffer = getattr(self._local, "buffer", None)
+        self._local.buffer = None
+        return buffer.getvalue() if buffer is not None else ""
+
+    def writable(self):
+        """ always writable, like the stream it replaces """
+        return True
+
+    def write(self, text):
+        """ write to the current thread's capture buffer, or through to the stream """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        """ flush the stream, captured output is flushed when the capture stops """
+        if getattr(self._local, "buffer", None) is None:
+            self.stream.flush()
+
+
+def _call_captured(router, func, item):
+    """ run func(item) on a worker thread, capturing its output """
+    router.start_capture()
+    result = None
+    error = None
+    try:
+        result = func(item)
+    # pylint: disable=broad-except
+    except BaseException as err:
+        error = err
+    return result, router.stop_capture(), error
+
+
+def map_ordered(func, items, workers=1):
+    """
+    yield func(item) for each item, running up to `workers` calls
+    concurrently. results and anything the calls print are emitted
+    in the same order as `items`
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    # nested calls (e.g. from a worker of an outer map_ordered) share the
+    # installed router, their output is emitted into the caller's buffer
+    nested = isinstance(sys.stdout, ThreadOutputRouter)
+    router = sys.stdout if nested else ThreadOutputRouter(sys.stdout)
+    sys.stdout = router
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            for item in items:
+                in_flight.append(executor.submit(_call_captured, router, func, item))
+                # keep a small window of work queued ahead of the oldest item
+                if len(in_flight) >= workers * 2:
+                    yield _emit(router, in_flight.popleft())
+            while in_flight:
+                yield _emit(router, in_flight.popleft())
+    finally:
+        if not nested:
+            sys.stdout = router.stream
+
+
+def _emit(router, future):
+    """ write out a finished call's output and return (or raise) its result """
+    result, output, error = future.result()
+    router.write(output)
+    router.flush()
+    if error is not None:
+        raise error
+    return result
@@ -2,12 +2,155 @@
 methods for creating github or
 github enterprise clients
 """
+import threading
+from urllib.parse import urlsplit
+import requests
 from github import Github
+from github.Requester import Requester, RequestsResponse
 import common
+from app.utils.http_cache import ConditionalRequestAdapter, get_http_cache
+from app.utils.rate_limit import GithubRequestScheduler, RateLimitedAdapter
+
+class GithubAdapter(RateLimitedAdapter, ConditionalRequestAdapter):
+    """ rate limit scheduling on top of conditional requests """
+
+class GithubSessionManager():
+    """
+    one pooled, keep-alive requests session per origin (scheme://host:port),
+    shared by every thread and by PyGithub. sessions are created on first use
+    """
+    def __init__(self, pool_size=10, verify=True):
+        self.pool_size = pool_size
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._scheduler = None
+
+    @staticmethod
+    def origin_of(url):
+        """ scheme://host:port of a url, with the default port filled in """
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return f"{parts.scheme}://{parts.hostname}:{port}"
+
+    def session_for(self, url):
+        """ the session for the origin of this url """
+        origin = self.origin_of(url)
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = self._sessions[origin] = self.create_session()
+            return session
+
+    def create_session(self):
+        """ new session with a connection pool sized for concurrent workers """
+        if self._scheduler is None:
+            # one scheduler for all sessions, budgets are tracked per host and token
+            self._scheduler = GithubRequestScheduler(
+                pace_below=common.GITHUB_RATE_LIMIT_PACE_BELOW,
+                max_retries=common.GITHUB_RATE_LIMIT_MAX_RETRIES
+            )
+        session = requests.Session()
+        session.verify = self.verify
+        adapter = GithubAdapter(get_http_cache,
+                                scheduler=self._scheduler,
+                                pool_connections=1,
+                                pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        """ close every pooled connection """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
 
 # pylint: disable=invalid-name
+_github_sessions = {"instance": None}
+_github_sessions_lock = threading.Lock()
+
+def get_github_session_manager():
+    """ the process wide GithubSessionManager """
+    with _github_sessions_lock:
+        if _github_sessions["instance"] is None:
+            _github_sessions["instance"] = GithubSessionManager(
+                pool_size=max(common.ARGS.github_pool_size, common.ARGS.workers),
+                verify=common.VERIFY_TLS
+            )
+        return _github_sessions["instance"]
+
+def get_github_session(url):
+    """
+    requests session for GitHub API calls to this url's origin, raw or through
+    PyGithub, scheduled against the rate limit and sending GETs as conditional
+    requests against the http cache
+    """
+    return get_github_session_manager().session_for(url)
+
+class GithubSessionConnection():
+    """
+    PyGithub connection class (mimics the httplib connection object like
+    github.Requester.HTTPSRequestsConnectionClass) that sends its request
+    through the shared github session
+    """
+    # pylint: disable=too-many-instance-attributes
+    protocol = "https"
+    default_port = 443
+
+    # pylint: disable=too-many-arguments, unused-argument
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, **kwargs):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.verb = None
+        self.url = None
+        self.input = None
+        self.headers = None
+
+    # pylint: disable=redefined-builtin
+    def request(self, verb, url, input, headers):
+        """ remember the request to send """
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+
+    def getresponse(self):
+        """ send the request and wrap the response the way PyGithub expects """
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        response = get_github_session(url).request(
+            self.verb,
+            url,
+            headers=self.headers,
+            data=self.input,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=False,
+        )
+        return RequestsResponse(response)
+
+    def close(self):
+        """ nothing to close, connections belong to the shared session """
+
+class GithubSessionHttpConnection(GithubSessionConnection):
+    """ plain http variant of GithubSessionConnection """
+    protocol = "http"
+    default_port = 80
+
+def use_github_session_for_pygithub():
+    """
+    route PyGithub clients created from now on through the shared github sessions.
+    injected connection classes are created per request, not kept per client,
+    so the clients can be shared between threads
+    """
+    Requester.injectConnectionClasses(GithubSessionHttpConnection, GithubSessionConnection)
+
 def create_github_client(GITHUB_TOKEN, VERIFY_TLS):
     """ return a github client for given token """
+    use_github_session_for_pygithub()
     try:
         return Github(login_or_token=GITHUB_TOKEN, verify=VERIFY_TLS)
     except KeyError as err:
@@ -17,6 +160,7 @@ def create_github_client(GITHUB_TOKEN, VERIFY_TLS):
 
 def create_github_enterprise_client(GITHUB_ENTERPRISE_TOKEN, GITHUB_ENTERPRISE_HOST, VERIFY_TLS):
     """ return a github enterprise client for given token/host """
+    use_github_session_for_pygithub()
     try:
         return Github(base_url=f"https://{GITHUB_ENTERPRISE_HOST}/api/v3", \
             login_or_token=GITHUB_ENTERPRISE_TOKEN, verify=VERIFY_TLS)
@@ -0,0 +1,165 @@
+"""
+http response cache for conditional GitHub requests. GET responses carrying
+an ETag or Last-Modified header are stored on disk, and later requests for the
+same resource are sent with If-None-Match / If-Modified-Since. A
+'304 Not Modified' answer (which does not count against the GitHub rate limit)
+is turned back into the stored response
+"""
+import hashlib
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import common
+from app.utils.sqlite_store import SqliteStore
+
+# headers describing the request being answered rather than the resource,
+# taken from the fresh 304 instead of the stored response
+FRESH_HEADER_PREFIXES = ("x-ratelimit-", "date", "x-github-request-id")
+# the stored body is already decoded, so these no longer apply to it
+UNSTORED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+# git trees can be several MB and are only fetched once they changed (the tree
+# cache sits in front), so storing them would hardly ever save a request
+UNCACHED_URL_PARTS = ("/git/trees/",)
+
+
+class HttpCache(SqliteStore):
+    """ stored responses keyed by request fingerprint """
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS responses (
+            cache_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            status INTEGER NOT NULL,
+            headers TEXT NOT NULL,
+            body BLOB NOT NULL,
+            stored_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)",
+    )
+
+    def get(self, cache_key):
+        """ return (etag, last_modified, status, headers, body) or None """
+        rows = self.execute(
+            "SELECT etag, last_modified, status, headers, body FROM responses "
+            "WHERE cache_key = ?", (cache_key,))
+        if not rows:
+            return None
+        (etag, last_modified, status, headers, body) = rows[0]
+        return (etag, last_modified, status, json.loads(headers), body)
+
+    def put(self, cache_key, response):
+        """ store a response that can be revalidated later """
+        self.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(cache_key, url, etag, last_modified, status, headers, body, stored_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (cache_key,
+             response.url,
+             response.headers.get("ETag"),
+             response.headers.get("Last-Modified"),
+             response.status_code,
+             json.dumps({name: value for (name, value) in response.headers.items()
+                         if name.lower() not in UNSTORED_HEADERS}),
+             response.content,
+             time.time()))
+
+    def evict(self, max_age_seconds, max_entries):
+        """ drop responses older than max_age_seconds, then the oldest beyond max_entries """
+        self.execute("DELETE FROM responses WHERE stored_at < ?",
+                     (time.time() - max_age_seconds,))
+        self.execute(
+            "DELETE FROM responses WHERE cache_key IN ("
+            "SELECT cache_key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (max_entries,))
+
+    def __len__(self):
+        return self.execute("SELECT COUNT(*) FROM responses")[0][0]
+
+
+def get_cache_key(request):
+    """
+    fingerprint a request. the credentials and accepted media type are part of
+    the key so responses are never shared between tokens or representations
+    """
+    fingerprint = "\n".join([
+        request.method,
+        request.url,
+        request.headers.get("Authorization", ""),
+        request.headers.get("Accept", ""),
+    ])
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def is_cacheable(request):
+    """ whether a request's response is worth storing for revalidation """
+    return request.method == "GET" and \
+        not any(url_part in request.url for url_part in UNCACHED_URL_PARTS)
+
+
+class ConditionalRequestAdapter(HTTPAdapter):
+    """ transport adapter revalidating GET requests against an HttpCache """
+    def __init__(self, http_cache_getter, **kwargs):
+        # takes a callable so the cache file is only opened once it's needed
+        self.get_http_cache = http_cache_getter
+        super().__init__(**kwargs)
+
+    # pylint: disable=arguments-differ
+    def send(self, request, **kwargs):
+        http_cache = self.get_http_cache() if is_cacheable(request) else None
+        if http_cache is None:
+            return super().send(request, **kwargs)
+
+        cache_key = get_cache_key(request)
+        cached = http_cache.get(cache_key)
+        if cached is not None:
+            (etag, last_modified, _, _, _) = cached
+            if etag:
+                request.headers["If-None-Match"] = etag
+            if last_modified:
+                request.headers["If-Modified-Since"] = last_modified
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            return build_cached_response(request, response, cached)
+
+        if response.status_code == 200 and \
+                ("ETag" in response.headers or "Last-Modified" in response.headers):
+            http_cache.put(cache_key, response)
+
+        return response
+
+
+def build_cached_response(request, not_modified, cached):
+    """ rebuild the stored response for a request answered with 304 """
+    (_, _, status, headers, body) = cached
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict(headers)
+    for (name, value) in not_modified.headers.items():
+        if name.lower().startswith(FRESH_HEADER_PREFIXES):
+            response.headers[name] = value
+    response.headers["X-From-Cache"] = "1"
+    # pylint: disable=protected-access
+    response._content = body
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    response.connection = not_modified.connection
+    response.elapsed = not_modified.elapsed
+    not_modified.close()
+    return response
+
+
+def get_http_cache():
+    """ the run's http cache, opened (and evicted) on first use. None if disabled """
+    if common.ARGS.no_http_cache:
+        return None
+    return HttpCache.shared(
+        common.ARGS.http_cache_path,
+        on_open=lambda http_cache: http_cache.evict(common.HTTP_CACHE_MAX_AGE_DAYS * 86400,
+                                                    common.HTTP_CACHE_MAX_ENTRIES))
@@ -0,0 +1,268 @@
+"""
+background polling of snyk import jobs
+"""
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import snyk.errors
+import common
+from app.models import ImportStatus
+from app.utils.bulk_executor import run_project_operation, log_project_operation_failure
+from app.utils.metrics import get_metrics
+from app.utils.results_sink import write_result
+from app.utils.sync_state import record_import_sync
+
+
+class ImportStatusPoller():
+    """
+    Polls submitted import jobs on a background thread from the moment the first
+    one is submitted. Jobs are checked concurrently, soon after submission at
+    first and then with a doubling interval, until they complete or time out.
+    As soon as a job's import of the repo completes, the projects waiting on
+    it (the old projects of a renamed repo) go to a concurrent delete queue.
+    Jobs are checked with get_import_status(import_status_url, org_id) and
+    projects deleted with delete_project(project_id, org_id)
+    """
+    # pylint: disable=too-many-instance-attributes, too-many-arguments
+    def __init__(self, get_import_status, delete_project, workers=None, min_interval=None,
+                 max_interval=None, timeout=None, clock=time.monotonic, checkpoint=None):
+        self.get_import_status = get_import_status
+        self.delete_project = delete_project
+        self.workers = workers or common.IMPORT_STATUS_POLL_WORKERS
+        self.min_interval = min_interval or common.IMPORT_STATUS_MIN_INTERVAL
+        self.max_interval = max_interval or common.IMPORT_STATUS_MAX_INTERVAL
+        self.timeout = timeout or \
+            common.PENDING_REMOVAL_MAX_CHECKS * common.PENDING_REMOVAL_CHECK_INTERVAL
+        self.clock = clock
+        # finished jobs are removed from the run's checkpoint, if there is one
+        self.checkpoint = checkpoint
+
+        self._cond = threading.Condition()
+        self._jobs = {}            # import_job_id -> ImportStatus
+        self._submitted_at = {}    # import_job_id -> clock()
+        self._intervals = {}       # import_job_id -> seconds until the next check
+        self._due = []             # heap of (due time, sequence, import_job_id)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._stopping = False
+        self.completed_jobs = set()
+        self.completed_logs = set()
+        self.expired_jobs = set()
+        self.released_jobs = set()  # jobs whose pending deletes were queued
+
+        self._executor = None
+        self._delete_executor = None
+        self._thread = None
+
+    def submit(self, import_status: ImportStatus):
+        """ start tracking an import job, merging pending deletes of a job already known """
+        with self._cond:
+            job_id = import_status.import_job_id
+            if job_id in self._jobs:
+                known = self._jobs[job_id]
+                if known is not import_status:
+                    known.pending_project_deletes.extend(import_status.pending_project_deletes)
+                if job_id not in self.released_jobs:
+                    return
+                # the import already completed, nothing to wait for
+                pending_deletes = import_status.pending_project_deletes
+            else:
+                self._jobs[job_id] = import_status
+                self._submitted_at[job_id] = self.clock()
+                self._intervals[job_id] = self.min_interval
+                self._schedule(job_id)
+                self._start()
+                return
+        self.queue_deletes(pending_deletes)
+
+    def pending_count(self):
+        """ number of jobs still being polled """
+        with self._cond:
+            return len(self._jobs) - len(self.completed_jobs) - len(self.expired_jobs)
+
+    def wait(self):
+        """
+        block until every submitted job has completed or timed out,
+        then log the renamed manifests still waiting on an import
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            while self._due or self._in_flight:
+                self._cond.wait()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown()
+        if self._delete_executor is not None:
+            # let queued deletes finish
+            self._delete_executor.shutdown()
+
+        pending = [job for (job_id, job) in self._jobs.items()
+                   if job_id not in self.completed_jobs]
+        if pending:
+            write_line(f"\nExiting with {len(pending)} pending removals, logging...\n")
+            for import_status_check in pending:
+                write_result(
+                    "renamed_manifest_pending", import_status_check.org_name,
+                    f"{import_status_check.repo_owner}/{import_status_check.repo_name}")
+        elif self._jobs:
+            write_line("None Pending, Done.\n")
+
+    def _start(self):
+        """ start the scheduler thread on first use (called holding the lock) """
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._thread = threading.Thread(target=self._run, name="import-status-poller",
+                                            daemon=True)
+            self._thread.start()
+
+    def _schedule(self, job_id):
+        """ queue the next check of a job (called holding the lock) """
+        due = self.clock() + self._intervals[job_id]
+        heapq.heappush(self._due, (due, next(self._sequence), job_id))
+        self._cond.notify_all()
+
+    def _run(self):
+        """ hand due jobs to the pool until stopped and nothing is left to poll """
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping and not self._due and not self._in_flight:
+                        return
+                    now = self.clock()
+                    if self._due and self._due[0][0] <= now:
+                        break
+                    self._cond.wait(self._due[0][0] - now if self._due else None)
+                (_, _, job_id) = heapq.heappop(self._due)
+                self._in_flight += 1
+                import_job = self._jobs[job_id]
+            self._executor.submit(self._poll, import_job)
+
+    def _poll(self, import_job):
+        """ check one job, then reschedule it, or finish it off """
+        job_id = import_job.import_job_id
+        done = False
+        succeeded = False
+        try:
+            import_status = self.get_import_status(import_job.import_status_url,
+                                                   import_job.org_id)
+            write_line(f"checking import job: {job_id} [{import_status['status']}]")
+            get_metrics().inc("import_status_checks_total", status=import_status["status"])
+            self.process_import_logs(import_job, import_status)
+            done = import_status["status"] != "pending"
+            succeeded = is_import_successful(import_status)
+        except (snyk.errors.SnykError, requests.exceptions.RequestException) as err:
+            get_metrics().inc("import_status_checks_total", status="error")
+            logging.debug(f"import status check failed for {job_id}: {err}")
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception(f"import status check failed for {job_id}: {err}")
+
+        try:
+            if done:
+                self.release_pending_deletes(import_job)
+                if succeeded:
+                    record_import_sync(import_job)
+                if self.checkpoint is not None:
+                    self.checkpoint.finish_import(job_id)
+        # pylint: disable=broad-except
+        except Exception as err:
+            logging.exception(f"failed to finish import job {job_id}: {err}")
+
+        with self._cond:
+            self._in_flight -= 1
+            if done:
+                self.completed_jobs.add(job_id)
+            elif self.clock() - self._submitted_at[job_id] >= self.timeout:
+                self.expired_jobs.add(job_id)
+                get_metrics().inc("import_jobs_expired_total")
+            else:
+                self._intervals[job_id] = min(self._intervals[job_id] * 2, self.max_interval)
+                self._schedule(job_id)
+            self._cond.notify_all()
+
+    def process_import_logs(self, import_job, import_status):
+        """ report and log the targets of a job that finished importing """
+        for import_status_log in import_status["logs"]:
+            uniq_import_log = import_status_log["name"] + '-' + import_status_log["created"]
+            with self._cond:
+                if uniq_import_log in self.completed_logs:
+                    continue
+                if import_status_log["status"] == "complete":
+                    self.completed_logs.add(uniq_import_log)
+            write_line(f"  - [{import_status_log['name']}] "
+                       f"Import Target status: {import_status_log['status']} "
+                       f"({len(import_status_log['projects'])} projects)")
+            if import_status_log["status"] != "complete":
+                continue
+            if import_status_log["name"] == \
+                    f"{import_job.repo_owner}/{import_job.repo_name}":
+                # the repo was imported under its new name, the old projects can go
+                self.release_pending_deletes(import_job)
+            for project in import_status_log["projects"]:
+                if 'targetFile' in project:
+                    imported_project = project['targetFile']
+                    write_line(f"[org:{import_job.org_name}][{import_status_log['name']}] "
+                               f"Imported {imported_project}")
+                    write_result(
+                        "completed_project_import", import_job.org_name,
+                        f"{import_status_log['name']}:{imported_project}",
+                        project['success'])
+
+    def release_pending_deletes(self, import_job):
+        """ queue the deletes waiting on a job, the first time it is called for the job """
+        with self._cond:
+            if import_job.import_job_id in self.released_jobs:
+                return
+            self.released_jobs.add(import_job.import_job_id)
+            pending_deletes = list(import_job.pending_project_deletes)
+        self.queue_deletes(pending_deletes)
+
+    def queue_deletes(self, pending_deletes):
+        """ delete projects concurrently, logging each result as it comes in """
+        if not pending_deletes:
+            return
+        with self._cond:
+            if self._delete_executor is None:
+                self._delete_executor = ThreadPoolExecutor(
+                    max_workers=max(common.ARGS.mutation_workers, 1))
+            delete_executor = self._delete_executor
+        for pending_delete in pending_deletes:
+            write_line(f"[org:{pending_delete['org_name']}][{pending_delete['repo_full_name']}] "
+                       f"delete stale project [{pending_delete['id']}]")
+            future = delete_executor.submit(
+                run_project_operation, ("delete", pending_delete),
+                {"delete": self.delete_project})
+            future.add_done_callback(log_pending_delete_result)
+
+
+def is_import_successful(import_status):
+    """ true if the job and each of its targets completed """
+    return import_status["status"] == "complete" and \
+        all(import_status_log["status"] == "complete"
+            for import_status_log in import_status["logs"])
+
+
+def log_pending_delete_result(future):
+    """ log the outcome of deleting a project of a renamed repo """
+    try:
+        result = future.result()
+    # pylint: disable=broad-except
+    except Exception as err:
+        logging.exception(f"failed to delete renamed repo project: {err}")
+        return
+    if not result.succeeded:
+        log_project_operation_failure(result)
+        return
+    write_result("renamed_manifest_deleted", result.project['org_name'],
+                 f"{result.project['repo_full_name']}:{result.project['manifest']}")
+
+
+def write_line(text):
+    """ write a whole line at once so lines from poller threads don't interleave """
+    sys.stdout.write(f"{text}\n")
+    sys.stdout.flush()
@@ -0,0 +1,105 @@
+"""
+classify repository paths by the snyk project type
+they would be imported as, if any
+"""
+import hashlib
+import re
+from functools import lru_cache
+import common
+
+PROJECT_TYPE_SCA = "sca"
+PROJECT_TYPE_CONTAINER = "container"
+PROJECT_TYPE_IAC = "iac"
+PROJECT_TYPE_CODE = "code"
+
+# checked in this order, the first matching type wins
+PROJECT_TYPES = (
+    PROJECT_TYPE_SCA,
+    PROJECT_TYPE_CONTAINER,
+    PROJECT_TYPE_IAC,
+    PROJECT_TYPE_CODE
+)
+
+
+def get_project_type_rules():
+    """ (project type, suffixes, pattern) for each project type, from common """
+    return {
+        PROJECT_TYPE_SCA: (common.MANIFEST_SUFFIXES_SCA, common.MANIFEST_PATTERN_SCA),
+        PROJECT_TYPE_CONTAINER: (common.MANIFEST_SUFFIXES_CONTAINER,
+                                 common.MANIFEST_PATTERN_CONTAINER),
+        PROJECT_TYPE_IAC: (common.MANIFEST_SUFFIXES_IAC, common.MANIFEST_PATTERN_IAC),
+        PROJECT_TYPE_CODE: (common.MANIFEST_SUFFIXES_CODE, common.MANIFEST_PATTERN_CODE),
+    }
+
+
+class ManifestClassifier():
+    """
+    Matches paths against the manifest patterns of the enabled project types.
+    Each path is first checked against the file name suffixes its pattern can
+    match, so the compiled regexes only run for the few paths that could match
+    """
+    def __init__(self, enabled_types):
+        rules = get_project_type_rules()
+        self.enabled_types = tuple(x for x in PROJECT_TYPES if x in enabled_types)
+        self._rules = [
+            (project_type, rules[project_type][0], re.compile(rules[project_type][1]))
+            for project_type in self.enabled_types
+        ]
+        self._candidate_suffixes = tuple(
+            suffix for (_, suffixes, _) in self._rules for suffix in suffixes
+        )
+        self._code_suffixes = rules[PROJECT_TYPE_CODE][0]
+        self._code_pattern = re.compile(rules[PROJECT_TYPE_CODE][1])
+        self._exclusions = re.compile(common.MANIFEST_PATTERN_EXCLUSIONS)
+        # identifies this configuration, e.g. for caching filtered results
+        self.fingerprint = hashlib.sha1(repr((
+            self.enabled_types,
+            [(x, rules[x]) for x in PROJECT_TYPES],
+            common.MANIFEST_PATTERN_EXCLUSIONS
+        )).encode()).hexdigest()
+
+    def classify_path(self, path, skip_snyk_code=False):
+        """ return the project type path would be imported as, or None """
+        if not path.endswith(self._candidate_suffixes):
+            return None
+
+        for (project_type, suffixes, pattern) in self._rules:
+            if skip_snyk_code and project_type == PROJECT_TYPE_CODE:
+                continue
+            if path.endswith(suffixes) and pattern.match(path):
+                if self._exclusions.match(path):
+                    return None
+                return project_type
+
+        return None
+
+    def classify(self, paths, skip_snyk_code=False):
+        """ return the project type (or None) for each of the given paths """
+        classify_path = self.classify_path
+        return [classify_path(path, skip_snyk_code) for path in paths]
+
+    def is_code(self, path):
+        """ check if path is a snyk code file, whether or not code is enabled """
+        return bool(path.endswith(self._code_suffixes) and self._code_pattern.match(path))
+
+
+def get_enabled_project_types():
+    """ project types enabled by the command line options """
+    enabled = {
+        PROJECT_TYPE_SCA: common.PROJECT_TYPE_ENABLED_SCA,
+        PROJECT_TYPE_CONTAINER: common.PROJECT_TYPE_ENABLED_CONTAINER,
+        PROJECT_TYPE_IAC: common.PROJECT_TYPE_ENABLED_IAC,
+        PROJECT_TYPE_CODE: common.PROJECT_TYPE_ENABLED_CODE,
+    }
+    return tuple(x for x in PROJECT_TYPES if enabled[x])
+
+
+def get_manifest_classifier():
+    """ get the classifier for the currently enabled project types """
+    return build_manifest_classifier(get_enabled_project_types())
+
+
+@lru_cache(maxsize=None)
+def build_manifest_classifier(enabled_types):
+    """ build (once) the classifier for a given set of project types """
+    return ManifestClassifier(enabled_types)
@@ -0,0 +1,286 @@
+"""
+counters and latency histograms of the run's phases and API calls,
+with a summary for the console and a prometheus textfile export
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+METRIC_PREFIX = "snyk_scm_refresh"
+# upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# path segments of snyk API urls kept in endpoint labels, ids are dropped
+SNYK_ENDPOINT_SEGMENT = re.compile(r"[a-z-]+")
+
+
+class Histogram():
+    """ observation counts per LATENCY_BUCKETS bucket, plus count, sum and max """
+    __slots__ = ("bucket_counts", "count", "sum", "max")
+
+    def __init__(self):
+        # the last bucket is +Inf
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """ record one value """
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """ upper bound of the bucket holding the given quantile, the max for +Inf """
+        rank = fraction * self.count
+        seen = 0
+        for (bound, bucket_count) in zip(LATENCY_BUCKETS, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics():
+    """
+    Thread safe counters, gauges and histograms, each identified by
+    a name and label values, e.g. inc("github_requests_total", status=200)
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started_at = clock()
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((label, str(value)) for (label, value) in labels.items())))
+
+    def inc(self, name, amount=1, **labels):
+        """ add to a counter """
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """ set a gauge """
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """ record a value, usually seconds, in a histogram """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ observe the seconds spent in the with block """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start, **labels)
+
+    def phase(self, phase):
+        """ time a phase of the run """
+        return self.timer("phase_seconds", phase=phase)
+
+    def summary(self):
+        """ the metrics as console tables """
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = [f"--- run metrics ({self.clock() - self.started_at:.1f}s) ---",
+                 f"{'timing':<60} {'count':>7} {'total s':>9} {'mean s':>8} {'p95 s':>7}"]
+        for ((name, labels), histogram) in histograms:
+            lines.append(f"{describe(name, labels):<60} {histogram.count:>7} "
+                         f"{histogram.sum:>9.2f} {histogram.sum / histogram.count:>8.3f} "
+                         f"{histogram.quantile(0.95):>7.2f}")
+        lines.append(f"{'count':<60} {'value':>7}")
+        for ((name, labels), value) in counters:
+            lines.append(f"{describe(name, labels):<60} {value:>7}")
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """ the metrics in the prometheus text exposition format """
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        lines = []
+        declared = set()
+
+        def declare(name, metric_type):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for ((name, labels), value) in counters:
+            declare(f"{METRIC_PREFIX}_{name}", "counter")
+            lines.append(f"{METRIC_PREFIX}_{name}{format_labels(labels)} {value}")
+        for ((name, labels), value) in gauges:
+            declare(f"{METRIC_PREFIX}_{name}", "gauge")
+            lines.append(f"{METRIC_PREFIX}_{name}{format_labels(labels)} {value}")
+        for ((name, labels), histogram) in histograms:
+            declare(f"{METRIC_PREFIX}_{name}", "histogram")
+            lines.extend(histogram_lines(f"{METRIC_PREFIX}_{name}", labels, histogram))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """ write the textfile collector file, replacing it in one step """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+def histogram_lines(metric, labels, histogram):
+    """ the cumulative bucket, sum and count samples of a histogram """
+    cumulative = 0
+    bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+    for (bound, bucket_count) in zip(bounds, histogram.bucket_counts):
+        cumulative += bucket_count
+        yield f"{metric}_bucket{format_labels(labels + (('le', bound),))} {cumulative}"
+    yield f"{metric}_sum{format_labels(labels)} {histogram.sum}"
+    yield f"{metric}_count{format_labels(labels)} {histogram.count}"
+
+
+def describe(name, labels):
+    """ name label=value ... for the console summary """
+    return " ".join([name] + [f"{label}={value}" for (label, value) in labels])
+
+
+def format_labels(labels):
+    """ {label="value",...} for the prometheus format """
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for (_, value) in labels)
+    return "{" + ",".join(f'{label}="{value}"'
+                          for ((label, _), value) in zip(labels, escaped)) + "}"
+
+
+def github_endpoint(url):
+    """ endpoint label of a GitHub API url, without owner, repo or shas """
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if segments and segments[0] == "api":
+        # GHE serves the API under /api/v3 and /api/graphql
+        segments = segments[2:] if segments[1:2] == ["v3"] else segments[1:]
+    if not segments:
+        return "root"
+    if segments[0] == "repos":
+        # repos/{owner}/{repo}/git/trees/{sha} -> repos/git/trees
+        return "/".join(["repos"] + [segment for segment in segments[3:5]
+                                     if not re.fullmatch(r"[0-9a-f]{40}", segment)])
+    return segments[0]
+
+
+def snyk_endpoint(url):
+    """ endpoint label of a Snyk API url, e.g. org/project/deactivate """
+    path = urlsplit(url).path
+    segments = path.split("/api/v1/", 1)[-1].split("/")
+    return "/".join(segment for segment in segments
+                    if SNYK_ENDPOINT_SEGMENT.fullmatch(segment)) or "root"
+
+
+class ProgressTracker():
+    """
+    Repos processed per second and the time left. Orgs are discovered while
+    repos are processed, so the total is estimated from the repos per org
+    seen so far
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, total_orgs, metrics, interval, clock=time.monotonic):
+        self.total_orgs = total_orgs
+        self.metrics = metrics
+        self.interval = interval
+        self.clock = clock
+        self.started_at = clock()
+        self._reported_at = self.started_at
+        self.orgs = 0
+        self.discovered = 0
+        self.processed = 0
+
+    def add_org(self, org_repos):
+        """ count an org's repos as discovered, returning them """
+        self.orgs += 1
+        self.discovered += len(org_repos)
+        return org_repos
+
+    def repo_done(self):
+        """ count a processed repo """
+        self.processed += 1
+
+    def repo_skipped(self):
+        """ leave out a discovered repo that will not be processed, e.g. done before a resume """
+        self.discovered -= 1
+
+    def estimated_total(self):
+        """ repos discovered, plus the remaining orgs at the average seen so far """
+        if not self.orgs:
+            return self.discovered
+        remaining_orgs = max(self.total_orgs - self.orgs, 0)
+        return self.discovered + round(remaining_orgs * self.discovered / self.orgs)
+
+    def report(self, force=False):
+        """ a progress line, when the interval has passed since the last one (else None) """
+        now = self.clock()
+        if not force and now - self._reported_at < self.interval:
+            return None
+        self._reported_at = now
+        elapsed = max(now - self.started_at, 1e-9)
+        rate = self.processed / elapsed
+        total = self.estimated_total()
+        remaining = max(total - self.processed, 0)
+        eta = remaining / rate if rate > 0 else None
+        self.metrics.set("repos_processed", self.processed)
+        self.metrics.set("repos_per_second", round(rate, 3))
+        if eta is not None:
+            self.metrics.set("eta_seconds", round(eta))
+        estimate = "" if self.orgs >= self.total_orgs else "~"
+        return (f"[progress] {self.processed}/{estimate}{total} repos, {rate:.2f} repos/s, "
+                f"orgs {self.orgs}/{self.total_orgs}, "
+                f"ETA {format_duration(eta) if eta is not None else 'unknown'}")
+
+
+def format_duration(seconds):
+    """ 1h02m03s style """
+    seconds = int(seconds)
+    (hours, seconds) = divmod(seconds, 3600)
+    (minutes, seconds) = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+# pylint: disable=invalid-name
+_metrics = {"instance": None}
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """ the run's metrics """
+    with _metrics_lock:
+        if _metrics["instance"] is None:
+            _metrics["instance"] = Metrics()
+        return _metrics["instance"]
+
+
+def reset_metrics():
+    """ start a new run's metrics """
+    with _metrics_lock:
+        _metrics["instance"] = Metrics()
+        return _metrics["instance"]
@@ -0,0 +1,80 @@
+"""
+local inventory of the parsed snyk projects of each org, so runs
+don't have to page through every project of every org on startup
+"""
+import json
+import time
+import common
+from app.utils.sqlite_store import SqliteStore
+
+
+class ProjectInventory(SqliteStore):
+    """
+    Parsed project records per org, with the time each org was last fetched.
+    The Snyk API offers no cheap way to tell whether an org's projects changed
+    (no counts or modified-since filter), so an org is fetched again once its
+    records are older than the max age, or when this tool changed its projects
+    """
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS orgs (
+            org_id TEXT PRIMARY KEY,
+            refreshed_at REAL NOT NULL,
+            dirty INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS projects (
+            org_id TEXT NOT NULL,
+            project_id TEXT NOT NULL,
+            record TEXT NOT NULL,
+            PRIMARY KEY (org_id, project_id)
+        )""",
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        # orgs marked dirty since their projects were last stored
+        self._dirty_orgs = set()
+
+    def get_org_projects(self, org_id, max_age_seconds):
+        """ the org's project records, or None if they need to be fetched again """
+        rows = self.execute("SELECT refreshed_at, dirty FROM orgs WHERE org_id = ?", (org_id,))
+        if not rows:
+            return None
+        (refreshed_at, dirty) = rows[0]
+        if dirty or refreshed_at < time.time() - max_age_seconds:
+            return None
+        return [json.loads(record) for (record,) in self.execute(
+            "SELECT record FROM projects WHERE org_id = ? ORDER BY rowid", (org_id,))]
+
+    def put_org_projects(self, org_id, records):
+        """ replace all of an org's project records """
+        with self._lock, self._connection:
+            self._dirty_orgs.discard(org_id)
+            self._connection.execute("DELETE FROM projects WHERE org_id = ?", (org_id,))
+            self._connection.executemany(
+                "INSERT INTO projects (org_id, project_id, record) VALUES (?, ?, ?)",
+                [(org_id, record["id"], json.dumps(record)) for record in records])
+            self._connection.execute(
+                "INSERT OR REPLACE INTO orgs (org_id, refreshed_at, dirty) VALUES (?, ?, 0)",
+                (org_id, time.time()))
+
+    def mark_dirty(self, org_id):
+        """ make the next run fetch the org's projects again (written once per org) """
+        with self._lock:
+            if org_id in self._dirty_orgs:
+                return
+            self._dirty_orgs.add(org_id)
+            self.execute("UPDATE orgs SET dirty = 1 WHERE org_id = ?", (org_id,))
+
+
+def get_project_inventory():
+    """ the inventory given with --inventory, opened on first use. None if not set """
+    if not common.ARGS.inventory:
+        return None
+    return ProjectInventory.shared(common.ARGS.inventory)
+
+
+def mark_org_changed(org_id):
+    """ note that this run changed an org's projects """
+    inventory = get_project_inventory()
+    if inventory is not None:
+        inventory.mark_dirty(org_id)
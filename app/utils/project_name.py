@@ -0,0 +1,58 @@
+"""
+parse snyk project names of the form owner/repo(branch):path
+into the repo, branch and manifest they refer to
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# owner/repo, then an optional (branch). repo names can't contain parentheses,
+# branch names can, so the branch runs up to the last closing parenthesis
+REPO_PREFIX_PATTERN = re.compile(r"([^/(]+)/([^/(]+)(?:\((.*)\))?")
+# repo prefixes seen, most projects share theirs with others of the same repo
+REPO_PREFIX_CACHE_SIZE = 65536
+
+
+class ProjectName(namedtuple("ProjectName",
+                             "repo_full_name repo_owner repo_name branch manifest")):
+    """Parts of a snyk project name"""
+    # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
+
+@lru_cache(maxsize=REPO_PREFIX_CACHE_SIZE)
+def parse_repo_prefix(prefix):
+    """
+    (owner/repo, owner, repo, branch) of an owner/repo(branch) prefix,
+    or None if it isn't one
+    """
+    match = REPO_PREFIX_PATTERN.fullmatch(prefix)
+    if match is None:
+        return None
+    (repo_owner, repo_name, branch) = match.groups()
+    return (f"{repo_owner}/{repo_name}", repo_owner, repo_name, branch or "")
+
+
+def split_project_name(name):
+    """
+    split owner/repo(branch):path into ((owner/repo, owner, repo, branch), path),
+    or None if the name doesn't start with a repo. the path is everything after
+    the first colon, as git refs and repo names can't contain one. names without
+    a path (e.g. snyk code projects) get the repo prefix as their path.
+    the repo parts are shared by the names of a repo, and no ProjectName is
+    built, so discovery can parse every project name cheaply
+    """
+    (prefix, separator, manifest) = name.partition(":")
+    repo_parts = parse_repo_prefix(prefix)
+    if repo_parts is None:
+        return None
+    return (repo_parts, manifest if separator else prefix)
+
+
+def parse_project_name(name):
+    """ the ProjectName of owner/repo(branch):path, or None as for split_project_name """
+    parts = split_project_name(name)
+    if parts is None:
+        return None
+    (repo_parts, manifest) = parts
+    return ProjectName._make(repo_parts + (manifest,))
@@ -0,0 +1,173 @@
+"""
+rate limiting for outgoing API calls
+"""
+import hashlib
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from app.utils.metrics import get_metrics, github_endpoint
+
+
+class TokenBucket():
+    """
+    token bucket allowing `rate` calls per second on average,
+    with bursts of up to `capacity` calls
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def acquire(self):
+        """ take a token, blocking until one is available """
+        if not self.rate or self.rate <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve the token even when it has to be waited for,
+            # so concurrent callers queue up behind each other
+            self._tokens -= 1
+            delay = abs(self._tokens) / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            self.sleep(delay)
+
+
+class GithubRequestScheduler():
+    """
+    Tracks the GitHub rate limit budget per host, token and resource from the
+    X-RateLimit-* response headers. Requests run at full speed while the budget
+    is plentiful, are spaced evenly over the time left once it runs low, and
+    wait for the reset once it is used up
+    """
+    def __init__(self, pace_below=0.1, max_retries=5, clock=time.time, sleep=time.sleep):
+        # start pacing when less than this fraction of the limit remains
+        self.pace_below = pace_below
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        # key -> {"limit", "remaining", "reset", "next_slot"}
+        self._budgets = {}
+
+    @staticmethod
+    def budget_key(request):
+        """ (host, token fingerprint, resource) the request is counted against """
+        url = urlsplit(request.url)
+        # the same token is sent as "token X" by PyGithub and "Bearer X" by raw
+        # calls, fingerprint the credential alone so both share one budget
+        credential = request.headers.get("Authorization", "").strip().split(" ")[-1]
+        token = hashlib.sha256(credential.encode()).hexdigest()[:16]
+        if url.path.endswith("/graphql"):
+            resource = "graphql"
+        elif "/search/" in url.path:
+            resource = "search"
+        else:
+            resource = "core"
+        return (url.netloc, token, resource)
+
+    def acquire(self, key):
+        """ block until a request against this budget may be sent """
+        with self._lock:
+            budget = self._budgets.get(key)
+            now = self.clock()
+            if budget is None or budget["reset"] <= now:
+                return
+            if budget["remaining"] <= 0:
+                delay = budget["reset"] - now + 1
+            elif budget["remaining"] < budget["limit"] * self.pace_below:
+                # hand out evenly spaced slots across all threads
+                interval = (budget["reset"] - now) / budget["remaining"]
+                slot = max(now, budget["next_slot"])
+                budget["next_slot"] = slot + interval
+                delay = slot - now
+            else:
+                delay = 0
+            # count the request now so concurrent callers see the smaller budget
+            budget["remaining"] -= 1
+
+        if delay > 0:
+            logging.debug(f"GitHub rate limit {key[0]}/{key[2]}: waiting {delay:.1f}s")
+            get_metrics().inc("github_rate_limit_wait_seconds_total", delay, resource=key[2])
+            self.sleep(delay)
+
+    def update(self, key, response):
+        """ record the budget reported by a response """
+        headers = response.headers
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            limit = int(headers.get("X-RateLimit-Limit", remaining))
+            reset = float(headers.get("X-RateLimit-Reset", 0))
+        except ValueError:
+            return
+        # the response names the resource it was counted against
+        key = (key[0], key[1], headers.get("X-RateLimit-Resource", key[2]))
+        with self._lock:
+            budget = self._budgets.setdefault(key, {"next_slot": 0})
+            budget.update(limit=limit, remaining=remaining, reset=reset)
+
+    def retry_delay(self, response):
+        """ seconds to wait before retrying a rate limited response, None if not limited """
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                return 60
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            return max(reset - self.clock(), 0) + 1
+        return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    transport adapter sending every request through a GithubRequestScheduler,
+    retrying responses rejected by the primary or secondary rate limit
+    """
+    def __init__(self, *args, scheduler=None, **kwargs):
+        self.scheduler = scheduler
+        super().__init__(*args, **kwargs)
+
+    # pylint: disable=arguments-differ
+    def send(self, request, **kwargs):
+        key = self.scheduler.budget_key(request)
+        metrics = get_metrics()
+        endpoint = github_endpoint(request.url)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(key)
+            started = metrics.clock()
+            response = super().send(request, **kwargs)
+            metrics.observe("github_request_seconds", metrics.clock() - started,
+                            endpoint=endpoint)
+            metrics.inc("github_requests_total", endpoint=endpoint,
+                        status=response.status_code)
+            if response.headers.get("X-From-Cache"):
+                metrics.inc("github_cache_hits_total", endpoint=endpoint)
+            self.scheduler.update(key, response)
+
+            delay = self.scheduler.retry_delay(response)
+            if delay is None or attempt >= self.scheduler.max_retries:
+                return response
+
+            attempt += 1
+            metrics.inc("github_retries_total", endpoint=endpoint, status=response.status_code)
+            metrics.inc("github_retry_wait_seconds_total", delay)
+            logging.debug(f"GitHub rate limited ({response.status_code}) on {request.url}, "
+                          f"retry {attempt} in {delay:.1f}s")
+            response.close()
+            self.scheduler.sleep(delay)
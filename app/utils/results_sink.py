@@ -0,0 +1,175 @@
+"""
+results sink: the rows of the run's CSV result files, and optionally one
+JSONL stream of them, written by a single thread fed from a queue
+"""
+import atexit
+import csv
+import json
+import os
+import queue
+import threading
+import common
+
+# result type -> (csv file name after the log prefix, columns)
+RESULT_FILES = {
+    "potential_repo_delete": ("potential-repo-deletes", ("org", "repo")),
+    "stale_manifest_deleted": ("stale-manifests-deleted", ("org", "project")),
+    "renamed_manifest_deleted": ("renamed-manifests-deleted", ("org", "project")),
+    "renamed_manifest_pending": ("renamed-manifests-pending", ("org", "project")),
+    "completed_project_import": ("completed-project-imports", ("org", "project", "success")),
+    "repo_skipped_on_error": ("repos-skipped-on-error", ("org", "repo", "status")),
+    "manifest_skipped_on_limit": ("manifests-skipped-on-limit",
+                                  ("skipped_manifest_file_path",)),
+    "updated_project_branch": ("updated-project-branches",
+                               ("org", "project_name", "project_id", "new_branch")),
+    "update_project_branch_error": ("update-project-branches-errors",
+                                    ("org", "project_name", "project_id", "new_branch")),
+    "project_operation_error": ("project-operation-errors",
+                                ("org", "project_name", "project_id", "action", "status")),
+    "large_repo_audit_result": ("large-repos-audit-results", ("org", "repo", "is_large")),
+}
+# rows written between flushes of the files, at most
+RESULTS_BATCH_SIZE = 500
+
+
+class _FlushRequest():
+    """ queued behind the rows a flush() or sync() waits for """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, fsync):
+        self.fsync = fsync
+        self.done = threading.Event()
+
+
+class ResultsSink():
+    """
+    Queues result rows and writes them from one thread, so rows from worker
+    threads never interleave. The rows waiting in the queue are written
+    together and the files flushed once per batch. sync() also fsyncs them
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, log_prefix, jsonl_path=None, append=False,
+                 batch_size=RESULTS_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._files = {}
+        self._writers = {}
+        # files written since they were last fsynced
+        self._unsynced = set()
+        mode = "a" if append else "w"
+        for (result_type, (_, columns)) in RESULT_FILES.items():
+            file = open(result_file_path(result_type, log_prefix), mode, newline="")
+            self._files[result_type] = file
+            self._writers[result_type] = csv.writer(file, lineterminator="\n")
+            # appended files already have theirs
+            if file.tell() == 0:
+                self._writers[result_type].writerow(columns)
+        self._jsonl = open(jsonl_path, mode) if jsonl_path else None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="results-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, result_type, *values):
+        """ queue a row of one of the RESULT_FILES types """
+        if result_type not in RESULT_FILES:
+            raise KeyError(result_type)
+        self._queue.put((result_type, values))
+
+    def flush(self):
+        """ wait until the rows queued so far are written to the files """
+        self._wait_for_writer(fsync=False)
+
+    def sync(self):
+        """ wait until the rows queued so far are written, and fsync the files """
+        self._wait_for_writer(fsync=True)
+
+    def close(self):
+        """ write and fsync the remaining rows, then close the files """
+        if self._closed:
+            return
+        self.sync()
+        self._queue.put(None)
+        self._thread.join()
+        for file in self._open_files():
+            file.close()
+        self._closed = True
+
+    def _wait_for_writer(self, fsync):
+        request = _FlushRequest(fsync)
+        self._queue.put(request)
+        request.done.wait()
+
+    def _open_files(self):
+        return list(self._files.values()) + ([self._jsonl] if self._jsonl else [])
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # take whatever else is waiting, up to a batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    return
+                if isinstance(item, _FlushRequest):
+                    self._flush_files(fsync=item.fsync)
+                    item.done.set()
+                else:
+                    self._write_row(*item)
+            self._flush_files(fsync=False)
+
+    def _write_row(self, result_type, values):
+        self._writers[result_type].writerow(values)
+        self._unsynced.add(self._files[result_type])
+        if self._jsonl is not None:
+            self._unsynced.add(self._jsonl)
+            columns = RESULT_FILES[result_type][1]
+            record = {"type": result_type, **dict(zip(columns, values))}
+            self._jsonl.write(json.dumps(record, default=str) + "\n")
+
+    def _flush_files(self, fsync):
+        for file in self._open_files():
+            file.flush()
+        if fsync:
+            for file in self._unsynced:
+                os.fsync(file.fileno())
+            self._unsynced.clear()
+
+
+def result_file_path(result_type, log_prefix=None):
+    """ the csv file rows of a result type are written to """
+    return f"{log_prefix or common.LOG_PREFIX}_{RESULT_FILES[result_type][0]}.csv"
+
+
+# pylint: disable=invalid-name
+_results_sink = {"instance": None}
+_results_sink_lock = threading.Lock()
+
+
+def get_results_sink(append=False):
+    """
+    the run's results sink, created with its files on first use and closed
+    at exit. append keeps the rows of an interrupted run being resumed
+    """
+    with _results_sink_lock:
+        if _results_sink["instance"] is None:
+            sink = ResultsSink(common.LOG_PREFIX, common.ARGS.results_jsonl, append)
+            atexit.register(sink.close)
+            _results_sink["instance"] = sink
+        return _results_sink["instance"]
+
+
+def write_result(result_type, *values):
+    """ queue a result row on the run's results sink """
+    get_results_sink().write(result_type, *values)
+
+
+def close_results_sink():
+    """ write out and close the run's results sink, the next run opens a new one """
+    with _results_sink_lock:
+        sink = _results_sink["instance"]
+        _results_sink["instance"] = None
+    if sink is not None:
+        sink.close()
@@ -0,0 +1,81 @@
+"""
+Snyk API client with client side throttling and retries
+"""
+import logging
+import random
+import time
+import requests
+from snyk import SnykClient
+from snyk.errors import SnykHTTPError
+from app.utils.metrics import get_metrics, snyk_endpoint
+from app.utils.rate_limit import TokenBucket
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class ThrottledSnykClient(SnykClient):
+    """
+    SnykClient sending every request through a shared token bucket and retrying
+    429 and 5xx responses with jittered exponential backoff, honouring Retry-After
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, token, requests_per_second=10, max_retries=5,
+                 retry_base_delay=1, retry_max_delay=60, sleep=time.sleep, **kwargs):
+        super().__init__(token, **kwargs)
+        self.bucket = TokenBucket(requests_per_second, sleep=sleep)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.sleep = sleep
+
+    def retry_delay(self, response, attempt):
+        """ seconds to wait before retry number `attempt` of a failed response """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0), self.retry_max_delay)
+            except ValueError:
+                pass
+        delay = min(self.retry_base_delay * 2 ** attempt, self.retry_max_delay)
+        # keep at least half the backoff, spread the rest so retries don't line up
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # pylint: disable=redefined-outer-name
+    def request(self, method, url, headers, params=None, json=None) -> requests.Response:
+        kwargs = {"headers": headers, "verify": self.verify}
+        if params:
+            kwargs["params"] = params
+        if json:
+            kwargs["json"] = json
+
+        metrics = get_metrics()
+        labels = {"method": getattr(method, "__name__", "request").upper(),
+                  "endpoint": snyk_endpoint(url)}
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            started = metrics.clock()
+            try:
+                resp = method(url, **kwargs)
+            except requests.exceptions.ConnectionError:
+                metrics.inc("snyk_requests_total", status="connection_error", **labels)
+                if attempt >= self.max_retries:
+                    raise
+                resp = None
+            else:
+                metrics.observe("snyk_request_seconds", metrics.clock() - started, **labels)
+                metrics.inc("snyk_requests_total", status=resp.status_code, **labels)
+
+            if resp is not None and (resp.status_code not in RETRY_STATUS_CODES
+                                     or attempt >= self.max_retries):
+                if not resp.ok:
+                    raise SnykHTTPError(resp)
+                return resp
+
+            delay = self.retry_delay(resp, attempt)
+            attempt += 1
+            status = resp.status_code if resp is not None else "connection error"
+            metrics.inc("snyk_retries_total", reason=status, **labels)
+            metrics.inc("snyk_retry_wait_seconds_total", delay)
+            logging.debug(f"Snyk API {status} on {url}, retry {attempt} in {delay:.1f}s")
+            self.sleep(delay)
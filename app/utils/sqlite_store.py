@@ -0,0 +1,59 @@
+"""
+base class for the small sqlite databases used to keep state between runs
+"""
+import sqlite3
+import threading
+
+
+class SqliteStore():
+    """
+    A sqlite database file shared by all threads through one connection.
+    Subclasses list the statements creating their tables in SCHEMA
+    """
+    SCHEMA = ()
+    # the store of each subclass shared by the process, see shared()
+    _shared_stores = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+
+    def execute(self, sql, params=()):
+        """ run a statement in its own transaction and return all result rows """
+        with self._lock, self._connection:
+            return self._connection.execute(sql, params).fetchall()
+
+    def executemany(self, sql, seq_of_params):
+        """ run a statement for each set of params in a single transaction """
+        with self._lock, self._connection:
+            self._connection.executemany(sql, seq_of_params)
+
+    def close(self):
+        """ close the underlying connection """
+        with self._lock:
+            self._connection.close()
+
+    @classmethod
+    def shared(cls, path, on_open=None):
+        """
+        the store of this class at path shared by the process, opened on first use
+        and passed to on_open, if given. when the path changes (e.g. between
+        refresh() calls) the store opened at the previous path is closed
+        """
+        with SqliteStore._shared_lock:
+            store = SqliteStore._shared_stores.get(cls)
+            if store is not None and store.path == path:
+                return store
+            if store is not None:
+                store.close()
+            store = cls(path)
+            if on_open is not None:
+                on_open(store)
+            SqliteStore._shared_stores[cls] = store
+            return store
@@ -0,0 +1,91 @@
+"""
+record of the GitHub state each repo was last synced at, so repos
+without new pushes can skip the manifest checks on the next run
+"""
+import time
+import common
+from app.utils.manifest_classifier import get_manifest_classifier
+from app.utils.sqlite_store import SqliteStore
+
+
+class SyncState(SqliteStore):
+    """ pushed_at, default branch and archive state per (org, repo) at the last sync """
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS repo_sync (
+            org_id TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            pushed_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            default_branch TEXT NOT NULL,
+            archived INTEGER NOT NULL,
+            filter_key TEXT NOT NULL,
+            synced_at REAL NOT NULL,
+            PRIMARY KEY (org_id, repo)
+        )""",
+    )
+
+    def get(self, org_id, repo):
+        """ (pushed_at, default_branch, archived, filter_key) at the last sync, or None """
+        rows = self.execute(
+            "SELECT pushed_at, default_branch, archived, filter_key FROM repo_sync "
+            "WHERE org_id = ? AND repo = ?", (org_id, repo))
+        if not rows:
+            return None
+        (pushed_at, default_branch, archived, filter_key) = rows[0]
+        return (pushed_at, default_branch, bool(archived), filter_key)
+
+    def put(self, org_id, repo, gh_repo_status, filter_key):
+        """ record the state a repo was synced at """
+        self.execute(
+            "INSERT OR REPLACE INTO repo_sync (org_id, repo, pushed_at, updated_at, "
+            "default_branch, archived, filter_key, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (org_id, repo, gh_repo_status.pushed_at, gh_repo_status.updated_at,
+             gh_repo_status.repo_default_branch, int(gh_repo_status.archived),
+             filter_key, time.time()))
+
+    def is_unchanged(self, org_id, repo, gh_repo_status, filter_key):
+        """
+        true if nothing was pushed since the last sync and the default branch,
+        archive state and manifest filter are the same
+        """
+        if not gh_repo_status.pushed_at:
+            return False
+        return self.get(org_id, repo) == (gh_repo_status.pushed_at,
+                                          gh_repo_status.repo_default_branch,
+                                          bool(gh_repo_status.archived),
+                                          filter_key)
+
+
+def get_sync_state():
+    """ the sync state store, opened on first use """
+    return SyncState.shared(common.ARGS.sync_state_path)
+
+
+def get_filter_key():
+    """ identifies the manifest filter a repo was synced with """
+    return get_manifest_classifier().fingerprint
+
+
+def is_repo_unchanged_since_sync(snyk_repo, gh_repo_status):
+    """ check if a repo's manifest checks can be skipped. always false with --full """
+    if common.ARGS.full:
+        return False
+    return get_sync_state().is_unchanged(snyk_repo.org_id, snyk_repo.full_name,
+                                         gh_repo_status, get_filter_key())
+
+
+def record_repo_sync(snyk_repo, gh_repo_status):
+    """ record that a repo's manifests are in sync with its current GitHub state """
+    if common.ARGS.dry_run:
+        return
+    get_sync_state().put(snyk_repo.org_id, snyk_repo.full_name, gh_repo_status,
+                         get_filter_key())
+
+
+def record_import_sync(import_status):
+    """ record the sync of the repo an import job was submitted for, once the job succeeded """
+    if import_status.repo_sync is None or common.ARGS.dry_run:
+        return
+    get_sync_state().put(import_status.org_id,
+                         f"{import_status.repo_owner}/{import_status.repo_name}",
+                         import_status.repo_sync, get_filter_key())
@@ -0,0 +1,66 @@
+"""
+on-disk cache of the manifests found in a repo's tree, keyed by the
+root tree SHA of the default branch so an unchanged tree can be
+answered without downloading or cloning it
+"""
+import json
+import time
+import common
+from app.utils.sqlite_store import SqliteStore
+
+
+class TreeCache(SqliteStore):
+    """ manifests per (origin, repo, tree sha, manifest filter) """
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS tree_manifests (
+            origin TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            tree_sha TEXT NOT NULL,
+            filter_key TEXT NOT NULL,
+            manifests TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            PRIMARY KEY (origin, repo, filter_key)
+        )""",
+        "CREATE INDEX IF NOT EXISTS tree_manifests_stored_at ON tree_manifests (stored_at)",
+    )
+
+    def get(self, origin, repo, tree_sha, filter_key):
+        """ return the cached manifest list, or None if this tree hasn't been seen """
+        rows = self.execute(
+            "SELECT manifests FROM tree_manifests "
+            "WHERE origin = ? AND repo = ? AND filter_key = ? AND tree_sha = ?",
+            (origin, repo, filter_key, tree_sha))
+        if not rows:
+            return None
+        return json.loads(rows[0][0])
+
+    # pylint: disable=too-many-arguments
+    def put(self, origin, repo, tree_sha, filter_key, manifests):
+        """ store the manifests for a tree, replacing any older tree for the repo """
+        self.execute(
+            "INSERT OR REPLACE INTO tree_manifests "
+            "(origin, repo, tree_sha, filter_key, manifests, stored_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (origin, repo, tree_sha, filter_key, json.dumps(manifests), time.time()))
+
+    def evict(self, max_age_seconds, max_entries):
+        """ drop entries older than max_age_seconds, then the oldest beyond max_entries """
+        self.execute("DELETE FROM tree_manifests WHERE stored_at < ?",
+                     (time.time() - max_age_seconds,))
+        self.execute(
+            "DELETE FROM tree_manifests WHERE rowid IN ("
+            "SELECT rowid FROM tree_manifests ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (max_entries,))
+
+    def __len__(self):
+        return self.execute("SELECT COUNT(*) FROM tree_manifests")[0][0]
+
+
+def get_tree_cache():
+    """ the run's tree cache, opened (and evicted) on first use. None if disabled """
+    if common.ARGS.no_tree_cache:
+        return None
+    return TreeCache.shared(
+        common.ARGS.tree_cache_path,
+        on_open=lambda tree_cache: tree_cache.evict(common.ARGS.tree_cache_max_age * 86400,
+                                                    common.TREE_CACHE_MAX_ENTRIES))
@@ -0,0 +1 @@
+"""performance benchmarks, run from the repository root with `python -m benchmarks.<name>`"""
@@ -0,0 +1,93 @@
+"""
+benchmark the manifest classifier against the original regex filter
+
+usage: python -m benchmarks.bench_manifest_filter
+
+classifies a synthetic 400k entry monorepo tree with the original
+uncompiled re.match filter and with ManifestClassifier.classify, checks
+both agree, and exits non-zero if the classifier is not faster
+"""
+import random
+import re
+import sys
+import time
+import common
+from app.utils.manifest_classifier import get_manifest_classifier
+
+TREE_ENTRIES = 400_000
+# the classifier must be at least this many times faster than the regex filter
+MIN_SPEEDUP = 5.0
+
+DIRECTORIES = ["src", "lib", "pkg", "internal", "web", "docs", "assets", "services",
+               "tests", "node_modules", "deploy", "tools"]
+FILE_NAMES = ["main.go", "index.ts", "util.c", "util.h", "README.md", "logo.png",
+              "style.css", "index.html", "Makefile", "LICENSE", "app.py", "index.js",
+              "package.json", "go.mod", "requirements.txt", "Dockerfile", "values.yaml",
+              "main.tf", "pom.xml", "notes.txt"]
+
+
+def regex_passes_manifest_filter(path, skip_snyk_code=False):
+    """ the original passes_manifest_filter, one uncompiled re.match per type """
+    passes_filter = False
+    if common.PROJECT_TYPE_ENABLED_SCA and re.match(common.MANIFEST_PATTERN_SCA, path):
+        passes_filter = True
+    if (common.PROJECT_TYPE_ENABLED_CONTAINER and
+            re.match(common.MANIFEST_PATTERN_CONTAINER, path)):
+        passes_filter = True
+    if common.PROJECT_TYPE_ENABLED_IAC and re.match(common.MANIFEST_PATTERN_IAC, path):
+        passes_filter = True
+    if common.PROJECT_TYPE_ENABLED_CODE and re.match(common.MANIFEST_PATTERN_CODE, path):
+        if not skip_snyk_code:
+            passes_filter = True
+    if re.match(common.MANIFEST_PATTERN_EXCLUSIONS, path):
+        passes_filter = False
+    return passes_filter
+
+
+def build_tree(num_entries, seed=42):
+    """ synthetic monorepo paths, mostly source files like a real tree """
+    rand = random.Random(seed)
+    weights = [30, 30, 20, 20, 5, 5, 5, 5, 2, 2, 10, 10, 1, 1, 1, 1, 1, 1, 1, 1]
+    return [
+        "/".join(rand.choices(DIRECTORIES, k=rand.randint(1, 5)) +
+                 rand.choices(FILE_NAMES, weights=weights))
+        for _ in range(num_entries)
+    ]
+
+
+def best_of(func, repeat=3):
+    """ best wall clock time of `repeat` calls, in seconds """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    """ run the benchmark """
+    paths = build_tree(TREE_ENTRIES)
+    classifier = get_manifest_classifier()
+
+    regex_time, regex_result = best_of(
+        lambda: [regex_passes_manifest_filter(path) for path in paths])
+    classifier_time, classifier_result = best_of(lambda: classifier.classify(paths))
+
+    if regex_result != [x is not None for x in classifier_result]:
+        print("FAIL: classifier and regex filter disagree")
+        return 1
+
+    speedup = regex_time / classifier_time
+    print(f"{TREE_ENTRIES} tree entries, {sum(regex_result)} manifests")
+    print(f"regex filter: {regex_time:.3f}s")
+    print(f"classifier:   {classifier_time:.3f}s ({speedup:.1f}x faster)")
+    if speedup < MIN_SPEEDUP:
+        print(f"FAIL: expected at least {MIN_SPEEDUP}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+benchmark the memory held by snyk project records
+(app.models.SnykProject vs the plain dicts used before)
+
+usage: python -m benchmarks.bench_project_memory
+
+builds 250k project records in a fresh interpreter for each record type,
+with every string a separate object as when parsed from API responses,
+and compares the peak RSS of the two. exits non-zero if the records do
+not save at least half of the memory the dicts take
+"""
+import os
+import subprocess
+import sys
+
+NUM_PROJECTS = 250_000
+# the records must use at most this fraction of the memory taken by the dicts
+MAX_RECORD_TO_DICT_RATIO = 0.5
+
+CHILD = """
+import os
+import resource
+from app.models import SnykProject
+
+def fresh(text):
+    # a new string object, like each value json decoded from an API response
+    return "".join(list(text))
+
+def build(i):
+    repo_num = i // 10
+    repo_full_name = f"owner-{repo_num % 97}/repo-{repo_num:08d}"
+    manifest = f"path/{i % 10}/package.json"
+    org = repo_num % 20
+    return {
+        "id": f"project-{i}",
+        "name": f"{repo_full_name}:{manifest}",
+        "repo_full_name": fresh(repo_full_name),
+        "repo_owner": fresh(repo_full_name.split("/")[0]),
+        "repo_name": fresh(repo_full_name.split("/")[1]),
+        "manifest": fresh(manifest),
+        "org_id": fresh(f"org-id-{org:04d}-0000-0000-0000-000000000000"),
+        "org_name": fresh(f"Organization {org}"),
+        "origin": fresh("github"),
+        "type": fresh("npm"),
+        "integration_id": fresh(f"integration-{org:04d}-0000-0000-0000-000000000000"),
+        "branch_from_name": fresh(""),
+        "branch": fresh("main"),
+        "is_monitored": True,
+    }
+
+mode = os.environ["BENCH_RECORD_MODE"]
+if mode == "dict":
+    projects = [build(i) for i in range({num_projects})]
+elif mode == "record":
+    projects = [SnykProject(**build(i)) for i in range({num_projects})]
+else:
+    projects = []
+# ru_maxrss is in kilobytes on linux
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+""".replace("{num_projects}", str(NUM_PROJECTS))
+
+
+def peak_rss_kb(mode):
+    """ peak RSS of a fresh interpreter building the project list in the given mode """
+    # the mode goes in the environment, importing the app parses the command line
+    output = subprocess.run([sys.executable, "-c", CHILD], check=True, capture_output=True,
+                            text=True, env=dict(os.environ, BENCH_RECORD_MODE=mode)).stdout
+    return int(output.strip().splitlines()[-1])
+
+
+def main():
+    """ run the benchmark and check the records save memory """
+    baseline = peak_rss_kb("none")
+    used = {mode: peak_rss_kb(mode) - baseline for mode in ("dict", "record")}
+
+    print(f"{'records':>10} {'peak MB':>10} {'bytes/project':>14}")
+    for (mode, used_kb) in used.items():
+        print(f"{mode:>10} {used_kb / 1024:>10.1f} {used_kb * 1024 / NUM_PROJECTS:>14.0f}")
+
+    ratio = used["record"] / used["dict"]
+    print(f"record / dict memory for {NUM_PROJECTS} projects: {ratio:.2f}")
+    if ratio > MAX_RECORD_TO_DICT_RATIO:
+        print(f"FAIL: project records use too much memory (limit {MAX_RECORD_TO_DICT_RATIO})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+benchmark parsing snyk project names
+(app.utils.project_name.split_project_name)
+
+usage: python -m benchmarks.bench_project_name
+
+parses 1M synthetic owner/repo(branch):path names, 10 manifests per repo,
+with the memoized parser and with the split() parsing it replaced, and
+checks they agree on every name that the old parsing handled correctly.
+the two are timed in alternating rounds so both see the same machine load.
+exits non-zero unless the parser is faster than split() by the required margin
+"""
+import gc
+import statistics
+import sys
+import time
+from app.utils.project_name import parse_project_name, parse_repo_prefix, split_project_name
+
+NUM_NAMES = 1_000_000
+MANIFESTS_PER_REPO = 10
+ROUNDS = 7
+# median parser / split() time over the rounds must stay below this
+# (about 0.7 on a typical machine)
+MAX_TIME_RATIO = 0.85
+
+
+def build_names(num_names):
+    """ synthetic project names, the projects of a repo next to each other """
+    manifests = [f"path/{i}/package.json" for i in range(MANIFESTS_PER_REPO)]
+    names = []
+    for i in range(num_names):
+        repo_num = i // MANIFESTS_PER_REPO
+        branch = f"(release/{repo_num % 7})" if repo_num % 3 == 0 else ""
+        names.append(f"owner-{repo_num % 97}/repo-{repo_num:08d}{branch}:"
+                     f"{manifests[i % MANIFESTS_PER_REPO]}")
+    return names
+
+
+def split_parse(name):
+    """ the split() based parsing build_snyk_project_list used """
+    split_project_name = name.split(":")
+    if len(split_project_name) == 2:
+        manifest = split_project_name[1]
+    else:
+        manifest = split_project_name[0]
+    tmp_branch_split = split_project_name[0].split("(")
+    if len(tmp_branch_split) == 2:
+        branch_from_name = tmp_branch_split[1].split(")")[0]
+    else:
+        branch_from_name = ""
+    split_repo_name = tmp_branch_split[0].split("/")
+    return (split_project_name[0].split("(")[0], split_repo_name[0],
+            split_repo_name[1].split("(")[0], branch_from_name, manifest)
+
+
+def time_parse(parse, names):
+    """ seconds to parse every name, starting from an empty prefix cache """
+    parse_repo_prefix.cache_clear()
+    start = time.perf_counter()
+    for name in names:
+        parse(name)
+    return time.perf_counter() - start
+
+
+def main():
+    """ run the benchmark and check the parser agrees with and beats split() """
+    names = build_names(NUM_NAMES)
+    for name in names[:10000]:
+        assert tuple(parse_project_name(name)) == split_parse(name), name
+
+    split_times = []
+    parser_times = []
+    # pause gc like timeit does
+    gc.disable()
+    try:
+        for _ in range(ROUNDS):
+            split_times.append(time_parse(split_parse, names))
+            parser_times.append(time_parse(split_project_name, names))
+    finally:
+        gc.enable()
+
+    print(f"{'parser':>10} {'seconds':>10} {'ns/name':>10}")
+    for (label, times) in (("split", split_times), ("memoized", parser_times)):
+        elapsed = min(times)
+        print(f"{label:>10} {elapsed:>10.3f} {elapsed / NUM_NAMES * 1e9:>10.0f}")
+
+    ratio = statistics.median(parser / split
+                              for (parser, split) in zip(parser_times, split_times))
+    print(f"median memoized / split time for {NUM_NAMES} names: {ratio:.2f}")
+    if ratio > MAX_TIME_RATIO:
+        print(f"FAIL: the parser is too slow (limit {MAX_TIME_RATIO}x split)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+benchmark grouping snyk projects into repos
+(app.utils.snyk_helper.get_snyk_repos_from_snyk_projects)
+
+usage: python -m benchmarks.bench_repo_grouping
+
+builds synthetic, sorted project lists of 10k, 100k and 1M projects and
+checks that the time spent per project stays flat as the list grows,
+exiting non-zero if it does not
+"""
+import gc
+import sys
+import time
+from app.utils.snyk_helper import get_snyk_repos_from_snyk_projects
+
+PROJECT_COUNTS = [10_000, 100_000, 1_000_000]
+PROJECTS_PER_REPO = 10
+NUM_ORGS = 20
+# per-project cost at the largest size may be at most this many times the smallest.
+# cache effects account for some growth, a quadratic grouping would be ~100x
+MAX_PER_PROJECT_GROWTH = 4.0
+
+
+def build_projects(num_projects):
+    """ synthetic project list, sorted by repo_full_name like build_snyk_project_list """
+    orgs = [(f"org-id-{i}", f"org-{i}", f"integration-{i}") for i in range(NUM_ORGS)]
+    manifests = [f"path/{i}/package.json" for i in range(PROJECTS_PER_REPO)]
+    projects = []
+    for i in range(num_projects):
+        repo_num = i // PROJECTS_PER_REPO
+        (org_id, org_name, integration_id) = orgs[repo_num % NUM_ORGS]
+        repo_full_name = f"owner-{repo_num % 97}/repo-{repo_num:08d}"
+        manifest = manifests[i % PROJECTS_PER_REPO]
+        projects.append({
+            "id": f"project-{i}",
+            "name": f"{repo_full_name}:{manifest}",
+            "repo_full_name": repo_full_name,
+            "repo_owner": repo_full_name.split("/")[0],
+            "repo_name": repo_full_name.split("/")[1],
+            "manifest": manifest,
+            "org_id": org_id,
+            "org_name": org_name,
+            "origin": "github",
+            "type": "npm",
+            "integration_id": integration_id,
+            "branch_from_name": "",
+            "branch": "main",
+            "is_monitored": True
+        })
+    return sorted(projects, key=lambda x: x['repo_full_name'])
+
+
+def time_grouping(projects):
+    """ best of three runs, in seconds, with gc paused like timeit does """
+    best = None
+    gc.disable()
+    try:
+        for _ in range(3):
+            start = time.perf_counter()
+            snyk_repos = get_snyk_repos_from_snyk_projects(projects)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    assert len(snyk_repos) == len(projects) // PROJECTS_PER_REPO
+    return best
+
+
+def main():
+    """ run the benchmark and check it scales linearly """
+    per_project = []
+    print(f"{'projects':>10} {'seconds':>10} {'us/project':>12}")
+    for num_projects in PROJECT_COUNTS:
+        projects = build_projects(num_projects)
+        elapsed = time_grouping(projects)
+        per_project.append(elapsed / num_projects)
+        print(f"{num_projects:>10} {elapsed:>10.3f} {per_project[-1] * 1e6:>12.3f}")
+        del projects
+
+    growth = per_project[-1] / per_project[0]
+    print(f"per-project cost growth {PROJECT_COUNTS[0]} -> {PROJECT_COUNTS[-1]}: {growth:.2f}x")
+    if growth > MAX_PER_PROJECT_GROWTH:
+        print(f"FAIL: grouping does not scale linearly (limit {MAX_PER_PROJECT_GROWTH}x)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
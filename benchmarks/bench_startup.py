@@ -0,0 +1,64 @@
+"""
+benchmark the startup cost of importing common
+(python -X importtime)
+
+usage: python -m benchmarks.bench_startup
+
+imports common in fresh interpreters with -X importtime and takes the best
+cumulative import time of the module over a few runs. exits non-zero if it
+is over the threshold, or if the import pulled in the snyk or github
+client libraries
+"""
+import os
+import subprocess
+import sys
+
+RUNS = 5
+# cumulative microseconds importing common may take. parsing the default
+# arguments takes a few ms, loading the client libraries takes hundreds
+MAX_IMPORT_MICROSECONDS = 50_000
+CLIENT_MODULES = ("snyk", "github", "requests")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_common():
+    """ (cumulative import time of common in us, modules it loaded) in a fresh interpreter """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import common"],
+                            check=True, capture_output=True, text=True, cwd=REPO_ROOT)
+    cumulative = None
+    modules = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[1].isdigit():
+            continue
+        modules.add(fields[2].split(".")[0])
+        if fields[2] == "common":
+            cumulative = int(fields[1])
+    return cumulative, modules
+
+
+def main():
+    """ run the benchmark and check importing common stays cheap """
+    timings = []
+    for _ in range(RUNS):
+        (cumulative, modules) = import_common()
+        timings.append(cumulative)
+    best = min(timings)
+    print(f"import common: best {best / 1000:.1f} ms, worst {max(timings) / 1000:.1f} ms "
+          f"over {RUNS} runs")
+
+    loaded = sorted(set(CLIENT_MODULES) & modules)
+    if loaded:
+        print(f"FAIL: importing common loads client libraries: {', '.join(loaded)}")
+        return 1
+    if best > MAX_IMPORT_MICROSECONDS:
+        print(f"FAIL: importing common is too slow (limit {MAX_IMPORT_MICROSECONDS / 1000} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,9 @@
 import sys
+import threading
 from os import  (
     getenv,
     path
 )
-from snyk import SnykClient
-from app.utils.github_utils import (
-    create_github_client,
-    create_github_enterprise_client
-)
 import argparse
 import configparser
 from _version import __version__
@@ -19,6 +15,17 @@ MANIFEST_PATTERN_CONTAINER = '^.*(Dockerfile)$'
 MANIFEST_PATTERN_IAC = '.*[.](yaml|yml|tf)$'
 MANIFEST_PATTERN_CODE = '.*[.](js|cs|php|java|py)$'
 MANIFEST_PATTERN_EXCLUSIONS = '^.*(fixtures|tests\/|__tests__|test\/|__test__|[.].*ci\/|.*ci[.].yml|node_modules\/|bower_components\/|variables[.]tf|outputs[.]tf).*$'
+# every path matching one of the patterns above must end with one of the
+# matching suffixes below, they let the manifest classifier skip the regex
+# for most paths. keep them in step with the patterns
+MANIFEST_SUFFIXES_SCA = (
+    'package.json', 'Gemfile.lock', 'pom.xml', 'build.gradle', '.lockfile', 'build.sbt',
+    '.txt', 'Gopkg.lock', 'go.mod', 'vendor.json', 'packages.config', '.csproj', '.fsproj',
+    '.vbproj', 'project.json', 'project.assets.json', 'composer.lock', 'Podfile', 'Podfile.lock'
+)
+MANIFEST_SUFFIXES_CONTAINER = ('Dockerfile',)
+MANIFEST_SUFFIXES_IAC = ('.yaml', '.yml', '.tf')
+MANIFEST_SUFFIXES_CODE = ('.js', '.cs', '.php', '.java', '.py')
 GITHUB_CLOUD_API_HOST = "api.github.com"
 
 GITHUB_ENABLED = False
@@ -34,50 +41,32 @@ GIT_CLONE_TEMP_DIR = "/tmp"
 
 LOG_PREFIX = "snyk-scm-refresh"
 LOG_FILENAME = LOG_PREFIX + ".log"
-POTENTIAL_DELETES_FILE = open("%s_potential-repo-deletes.csv" % LOG_PREFIX, "w")
-POTENTIAL_DELETES_FILE.write("org,repo\n")
-STALE_MANIFESTS_DELETED_FILE = open(
-    "%s_stale-manifests-deleted.csv" % LOG_PREFIX, "w"
-)
-STALE_MANIFESTS_DELETED_FILE.write("org,project\n")
-RENAMED_MANIFESTS_DELETED_FILE = open(
-    "%s_renamed-manifests-deleted.csv" % LOG_PREFIX, "w"
-)
-RENAMED_MANIFESTS_DELETED_FILE.write("org,project\n")
-RENAMED_MANIFESTS_PENDING_FILE = open(
-    "%s_renamed-manifests-pending.csv" % LOG_PREFIX, "w"
-)
-RENAMED_MANIFESTS_PENDING_FILE.write("org,project\n")
-COMPLETED_PROJECT_IMPORTS_FILE = open(
-    "%s_completed-project-imports.csv" % LOG_PREFIX, "w"
-)
-COMPLETED_PROJECT_IMPORTS_FILE.write("org,project,success\n")
-REPOS_SKIPPED_ON_ERROR_FILE = open(
-    "%s_repos-skipped-on-error.csv" % LOG_PREFIX, "w"
-)
-REPOS_SKIPPED_ON_ERROR_FILE.write("org,repo,status\n")
-MANIFESTS_SKIPPED_ON_LIMIT_FILE = open(
-    "%s_manifests-skipped-on-limit.csv" % LOG_PREFIX, "w"
-)
-MANIFESTS_SKIPPED_ON_LIMIT_FILE.write("skipped_manifest_file_path\n")
-UPDATED_PROJECT_BRANCHES_FILE = open(
-    "%s_updated-project-branches.csv" % LOG_PREFIX, "w"
-)
-UPDATED_PROJECT_BRANCHES_FILE.write("org,project_name,project_id,new_branch\n")
-UPDATE_PROJECT_BRANCHES_ERRORS_FILE = open(
-    "%s_update-project-branches-errors.csv" % LOG_PREFIX, "w"
-)
-UPDATE_PROJECT_BRANCHES_ERRORS_FILE.write("org,project_name,project_id,new_branch\n")
-LARGE_REPOS_AUDIT_RESULTS_FILE = open(
-    "%s_large-repos-audit-results.csv" % LOG_PREFIX, "w"
-)
-LARGE_REPOS_AUDIT_RESULTS_FILE.write("org,repo,is_large\n")
+# the csv result files are written by app.utils.results_sink
 
 PENDING_REMOVAL_MAX_CHECKS = 45
 PENDING_REMOVAL_CHECK_INTERVAL = 20
+# import jobs are first checked after the min interval, doubling up to the max
+IMPORT_STATUS_MIN_INTERVAL = 2
+IMPORT_STATUS_MAX_INTERVAL = 60
+IMPORT_STATUS_POLL_WORKERS = 4
+GITHUB_GRAPHQL_BATCH_SIZE = 100
+TREE_CACHE_MAX_ENTRIES = 100000
+HTTP_CACHE_MAX_AGE_DAYS = 30
+HTTP_CACHE_MAX_ENTRIES = 50000
+# fraction of the GitHub rate limit below which requests are spaced out until the reset
+GITHUB_RATE_LIMIT_PACE_BELOW = 0.1
+GITHUB_RATE_LIMIT_MAX_RETRIES = 5
+SNYK_MAX_RETRIES = 5
+SNYK_ORG_REQUESTS_PER_SECOND = 5
+SNYK_RETRY_BASE_DELAY = 2
+SNYK_RETRY_MAX_DELAY = 60
+# seconds to wait for an org's integrations and projects once the orgs before it are done
+SNYK_ORG_FETCH_TIMEOUT = 600
+# seconds between progress lines (and --metrics-file updates) while repos are processed
+PROGRESS_INTERVAL_SECONDS = 30
 
-def parse_command_line_args():
-    """Parse command-line arguments"""                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                              
+def parse_command_line_args(argv=None):
+    """Parse command-line arguments, sys.argv unless argv is given"""
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -157,6 +146,144 @@ def parse_command_line_args():
         required=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--clone-mode",
+        help="How large repos are cloned when the tree API response is truncated: "
+             "a blob-less partial clone without checkout, or a full shallow clone "
+             "(partial by default)",
+        required=False,
+        default="partial",
+        choices=['partial', 'full']
+    )
+    parser.add_argument(
+        "--no-tree-cache",
+        help="Always retrieve the repo tree instead of reusing the manifests found "
+             "for an unchanged tree in a previous run",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--tree-cache-path",
+        type=str,
+        help=f"Location of the tree cache ({LOG_PREFIX}_tree-cache.sqlite by default)",
+        required=False,
+        default=f"{LOG_PREFIX}_tree-cache.sqlite",
+    )
+    parser.add_argument(
+        "--tree-cache-max-age",
+        type=int,
+        help="Days after which cached trees are discarded (30 by default)",
+        required=False,
+        default=30,
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        help="Send plain GitHub API requests instead of conditional requests "
+             "revalidating responses cached by previous runs",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--http-cache-path",
+        type=str,
+        help=f"Location of the GitHub response cache ({LOG_PREFIX}_http-cache.sqlite by default)",
+        required=False,
+        default=f"{LOG_PREFIX}_http-cache.sqlite",
+    )
+    parser.add_argument(
+        "--status-api",
+        help="Look up repo status with batched GraphQL queries, or one REST call per repo "
+             "(graphql by default)",
+        required=False,
+        default="graphql",
+        choices=['graphql', 'rest']
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of repos to process concurrently (1 by default)",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--mutation-workers",
+        type=int,
+        help="Number of project deletes, activations and deactivations to run "
+             "concurrently for each repo (4 by default)",
+        required=False,
+        default=4,
+    )
+    parser.add_argument(
+        "--org-workers",
+        type=int,
+        help="Number of Snyk orgs to fetch projects for concurrently (8 by default)",
+        required=False,
+        default=8,
+    )
+    parser.add_argument(
+        "--github-pool-size",
+        type=int,
+        help="Connections kept alive per GitHub host (10 by default, at least --workers)",
+        required=False,
+        default=10,
+    )
+    parser.add_argument(
+        "--snyk-requests-per-second",
+        type=float,
+        help="Maximum rate of Snyk API requests, shared by all workers (10 by default)",
+        required=False,
+        default=10,
+    )
+    parser.add_argument(
+        "--sync-state-path",
+        type=str,
+        help=f"Location of the record of each repo's last synced push "
+             f"({LOG_PREFIX}_sync-state.sqlite by default)",
+        required=False,
+        default=f"{LOG_PREFIX}_sync-state.sqlite",
+    )
+    parser.add_argument(
+        "--full",
+        help="Check the manifests of every repo, including repos without new pushes "
+             "since the last sync",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Record progress in this file, so a run that was interrupted skips the repos "
+             "it finished and resumes polling its import jobs when started again",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Keep a local inventory of each org's Snyk projects in this file, "
+             "so later runs only fetch orgs whose inventory is out of date",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--inventory-max-age",
+        type=float,
+        help="Hours before an org's project inventory is fetched again (default 24)",
+        required=False,
+        default=24,
+    )
+    parser.add_argument(
+        "--results-jsonl",
+        help="Also write every result row to this file as JSON lines, "
+             "with the row's result type in its \"type\" field",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Write run metrics (phase timings, API calls, retries) to this file in the "
+             "Prometheus text format, for the node_exporter textfile collector",
+        required=False,
+        default=None,
+    )
     parser.add_argument(
         "--debug",
         help="Write detailed debug data to snyk_scm_refresh.log for troubleshooting",
@@ -164,9 +291,7 @@ def parse_command_line_args():
         action="store_true",
     )
 
-    return parser.parse_args()
-
-ARGS = parse_command_line_args()
+    return parser.parse_args(argv)
 
 def toggle_to_bool(toggle_value) -> bool:
     if toggle_value == "on":
@@ -175,31 +300,92 @@ def toggle_to_bool(toggle_value) -> bool:
         return False
     return toggle_value
 
-snyk_client = SnykClient(SNYK_TOKEN, user_agent=USER_AGENT)
-
-VERIFY_TLS = not ARGS.skip_scm_validation
-
 if (GITHUB_ENTERPRISE_HOST == GITHUB_CLOUD_API_HOST):
    USE_GHE_INTEGRATION_FOR_GH_CLOUD = True
 
 if (GITHUB_TOKEN):
     GITHUB_ENABLED = True
-    gh_client = create_github_client(GITHUB_TOKEN, VERIFY_TLS)
-    print("created github.com client")
 
 if (GITHUB_ENTERPRISE_HOST):
     GITHUB_ENTERPRISE_ENABLED = True
-    if USE_GHE_INTEGRATION_FOR_GH_CLOUD:
-        gh_enterprise_client = create_github_client(GITHUB_ENTERPRISE_TOKEN, VERIFY_TLS)
-        print(f"created github client for enterprise host: {GITHUB_ENTERPRISE_HOST}")
-    else:
-        print(f"created GH enterprise client for host: {GITHUB_ENTERPRISE_HOST}")
-        gh_enterprise_client = create_github_enterprise_client(GITHUB_ENTERPRISE_TOKEN, \
-            GITHUB_ENTERPRISE_HOST, VERIFY_TLS)
 
-PROJECT_TYPE_ENABLED_SCA = toggle_to_bool(ARGS.sca)
-PROJECT_TYPE_ENABLED_CONTAINER = toggle_to_bool(ARGS.container)
-PROJECT_TYPE_ENABLED_IAC = toggle_to_bool(ARGS.iac)
 # disabled snyk code due to unsupported underlying api changes
 PROJECT_TYPE_ENABLED_CODE = False
 MAX_IMPORT_MANIFEST_PROJECTS = 1000
+
+
+def configure(options=None):
+    """
+    Set ARGS and the settings derived from them. options are command line
+    arguments (sys.argv if None), or a dict of option names to values that
+    replace the defaults, e.g. {"org_id": "...", "dry_run": True}
+    """
+    # pylint: disable=global-statement
+    global ARGS, VERIFY_TLS
+    global PROJECT_TYPE_ENABLED_SCA, PROJECT_TYPE_ENABLED_CONTAINER, PROJECT_TYPE_ENABLED_IAC
+    if isinstance(options, dict):
+        args = parse_command_line_args([])
+        for (name, value) in options.items():
+            if not hasattr(args, name):
+                raise ValueError(f"unknown option: {name}")
+            setattr(args, name, value)
+    else:
+        args = parse_command_line_args(options)
+
+    ARGS = args
+    VERIFY_TLS = not ARGS.skip_scm_validation
+    PROJECT_TYPE_ENABLED_SCA = toggle_to_bool(ARGS.sca)
+    PROJECT_TYPE_ENABLED_CONTAINER = toggle_to_bool(ARGS.container)
+    PROJECT_TYPE_ENABLED_IAC = toggle_to_bool(ARGS.iac)
+    return ARGS
+
+# the defaults, until the entry point or app.refresh() configures the run
+configure([])
+
+
+# clients by name, with the settings they were created with
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def create_client(name):
+    """ create a client, importing its library only when one is needed """
+    # pylint: disable=import-outside-toplevel
+    from app.utils.snyk_client import ThrottledSnykClient
+    from app.utils.github_utils import create_github_client, create_github_enterprise_client
+    if name == "snyk_client":
+        return ThrottledSnykClient(
+            SNYK_TOKEN,
+            requests_per_second=ARGS.snyk_requests_per_second,
+            max_retries=SNYK_MAX_RETRIES,
+            retry_base_delay=SNYK_RETRY_BASE_DELAY,
+            retry_max_delay=SNYK_RETRY_MAX_DELAY,
+            user_agent=USER_AGENT
+        )
+    if name == "gh_client" and GITHUB_ENABLED:
+        print("created github.com client")
+        return create_github_client(GITHUB_TOKEN, VERIFY_TLS)
+    if name == "gh_enterprise_client" and GITHUB_ENTERPRISE_ENABLED:
+        if USE_GHE_INTEGRATION_FOR_GH_CLOUD:
+            print(f"created github client for enterprise host: {GITHUB_ENTERPRISE_HOST}")
+            return create_github_client(GITHUB_ENTERPRISE_TOKEN, VERIFY_TLS)
+        print(f"created GH enterprise client for host: {GITHUB_ENTERPRISE_HOST}")
+        return create_github_enterprise_client(GITHUB_ENTERPRISE_TOKEN, \
+            GITHUB_ENTERPRISE_HOST, VERIFY_TLS)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_client(name):
+    """ the client, created on first use and again if the settings it uses change """
+    settings = (ARGS.snyk_requests_per_second, VERIFY_TLS)
+    with _clients_lock:
+        if name not in _clients or _clients[name][0] != settings:
+            _clients[name] = (settings, create_client(name))
+        return _clients[name][1]
+
+
+def __getattr__(name):
+    """ snyk_client, gh_client and gh_enterprise_client are created on first use """
+    if name in ("snyk_client", "gh_client", "gh_enterprise_client"):
+        return get_client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,13 +6,18 @@ import logging
 import sys
 from os import getenv
 import common
-from app import run
 
 if __name__ == "__main__":
+    # parse the command line before importing the app, so --help and
+    # argument errors don't wait for it
+    common.configure()
+    # pylint: disable=wrong-import-position
+    from app import run, RefreshError
+    from app.utils.results_sink import result_file_path
 
     if common.ARGS.audit_large_repos:
         print("\n****** AUDIT LARGE REPOS MODE ******\n")
-        print(f"check {common.LARGE_REPOS_AUDIT_RESULTS_FILE.name} after script completes\n")
+        print(f"check {result_file_path('large_repo_audit_result')} after script completes\n")
     elif common.ARGS.dry_run:
         print("\n****** DRY-RUN MODE ******\n")
     for arg in vars(common.ARGS):
@@ -57,4 +62,8 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(filename=common.LOG_FILENAME, level=logging.INFO, filemode="w")
 
-    run()
+    try:
+        run()
+    except RefreshError as err:
+        print(f"\n\n{err}, exiting...\n")
+        sys.exit(1)